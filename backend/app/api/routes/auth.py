@@ -7,14 +7,15 @@ from app.core.dependencies import get_current_active_user
 from app.services.user_service import UserService
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from app.models.user import User
-from app.middleware.rate_limit import limiter, RateLimits
+from app.middleware.rate_limit import limiter, plan_limits, RateLimits
+from slowapi.util import get_remote_address
 import structlog
 
 logger = structlog.get_logger()
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-@limiter.limit(RateLimits.AUTH_STRICT)
+@limiter.limit(RateLimits.AUTH_STRICT, key_func=get_remote_address)
 async def register(
     request: Request,
     user_data: UserCreate,
@@ -49,7 +50,7 @@ async def register(
         )
 
 @router.post("/login", response_model=Token)
-@limiter.limit(RateLimits.AUTH_STRICT)
+@limiter.limit(RateLimits.AUTH_STRICT, key_func=get_remote_address)
 async def login(
     request: Request,
     user_credentials: UserLogin,
@@ -87,7 +88,7 @@ async def login(
         )
 
 @router.post("/login/oauth", response_model=Token)
-@limiter.limit(RateLimits.AUTH_STRICT)
+@limiter.limit(RateLimits.AUTH_STRICT, key_func=get_remote_address)
 async def login_oauth(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
@@ -123,7 +124,7 @@ async def login_oauth(
         )
 
 @router.get("/me", response_model=UserResponse)
-@limiter.limit(RateLimits.READ_ONLY)
+@limiter.limit(plan_limits)
 async def get_current_user_info(
     request: Request,
     current_user: User = Depends(get_current_active_user)
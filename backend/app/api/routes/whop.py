@@ -1,13 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
-from app.core.database import get_db
-from app.core.whop_auth import get_current_whop_user, get_whop_company_with_auth, verify_whop_webhook
-from app.models import WhopCompany, WhopUser, WhopCustomer, RecoveryEvent, RecoveryStatus
+from app.core.database import get_db, get_read_db, session_router
+from app.core.etags import etag_matches, make_etag
+from app.core.whop_auth import get_current_whop_user, get_whop_company_with_auth, verify_whop_webhook, verify_resend_webhook
+from app.middleware.rate_limit import check_route_limit, limiter, plan_limits, RateLimits, webhook_key
+from slowapi.util import get_remote_address
+from app.models import WhopCompany, WhopUser, WhopCustomer, RecoveryEvent, RecoveryEventRollup, RecoveryStatus
 from app.services.whop_payments import whop_payment_service
-from pydantic import BaseModel
+from app.services.recovery_analytics import recovery_analytics_service
+from app.services.member_sketches import member_sketch_service, METRICS, GRANULARITIES
+from app.services.dunning import dunning_service
+from app.services.email_templates import email_template_service, is_hex_color
+from app.services.fee_ledger import fee_ledger_service
+from app.services.outbox import outbox_service
+from app.services.retry_schedule import parse_retry_schedule, retry_schedule_service
+from app.services.suppression import suppression_index, unsubscribe_token
+from pydantic import BaseModel, validator
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import hmac
+import html
 import json
 
 router = APIRouter(prefix="/whop", tags=["whop"])
@@ -23,6 +37,13 @@ class CompanySettingsUpdate(BaseModel):
     dunning_enabled: Optional[bool] = None
     email_enabled: Optional[bool] = None
 
+    @validator("brand_color")
+    def validate_brand_color(cls, v):
+        """Only hex colors, e.g. #3B82F6; the value is used in email styles"""
+        if v is not None and not is_hex_color(v):
+            raise ValueError("brand_color must be a hex color like #3B82F6")
+        return v
+
 
 class StatsResponse(BaseModel):
     total_recovered: float
@@ -40,11 +61,50 @@ class RecentActivity(BaseModel):
     metadata: Optional[Dict[str, Any]] = None
 
 
+def company_etag(resource: str, monthly: bool = False):
+    """
+    Dependency answering ``If-None-Match`` from the company's ``data_version``
+
+    Runs after the company access check, then counts the route's rate limit
+    (so 304s use up the tenant's budget like other calls) and reads only
+    the version column from the session the body is read from; a match
+    ends the request with 304. ``monthly`` adds the current month for
+    bodies that change when it rolls over.
+    """
+    async def check(
+        request: Request,
+        response: Response,
+        company: WhopCompany = Depends(get_whop_company_with_auth),
+        db: Session = Depends(get_read_db)
+    ) -> Optional[str]:
+        check_route_limit(request)
+        version = db.query(WhopCompany.data_version).filter(
+            WhopCompany.id == company.id
+        ).scalar()
+        if version is None:
+            return None  # Just installed and not on the replica yet
+        
+        parts = [resource, version]
+        if monthly:
+            parts.append(datetime.utcnow().strftime("%Y%m"))
+        etag = make_etag(*parts)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return etag
+    
+    return check
+
+
 @router.get("/companies/{company_id}/connection")
+@limiter.limit(plan_limits)
 async def check_stripe_connection(
     company_id: str,
+    request: Request,
+    etag: Optional[str] = Depends(company_etag("connection")),
     company: WhopCompany = Depends(get_whop_company_with_auth),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Check if company has connected their Stripe account"""
     return {
@@ -55,32 +115,55 @@ async def check_stripe_connection(
 
 
 @router.get("/companies/{company_id}/stats", response_model=StatsResponse)
+@limiter.limit(plan_limits)
 async def get_company_stats(
     company_id: str,
+    request: Request,
+    etag: Optional[str] = Depends(company_etag("stats", monthly=True)),
     company: WhopCompany = Depends(get_whop_company_with_auth),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get recovery statistics for a company"""
     
     # Calculate date ranges
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    # Upper bound lets Postgres prune the query to the current month's partition
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    
+    # Months past retention only exist as rollups
+    archived = {
+        row.event_type: row
+        for row in db.query(
+            RecoveryEventRollup.event_type,
+            func.sum(RecoveryEventRollup.event_count).label("event_count"),
+            func.sum(RecoveryEventRollup.total_amount).label("total_amount"),
+        ).filter(
+            RecoveryEventRollup.company_id == company.id
+        ).group_by(RecoveryEventRollup.event_type).all()
+    }
+    archived_recovered = archived["payment_recovered"].total_amount if "payment_recovered" in archived else 0
+    archived_failed_count = archived["payment_failed"].event_count if "payment_failed" in archived else 0
+    archived_failed = archived["payment_failed"].total_amount if "payment_failed" in archived else 0
     
     # Query statistics
     total_recovered = db.query(func.sum(RecoveryEvent.amount)).filter(
         RecoveryEvent.company_id == company.id,
         RecoveryEvent.event_type == "payment_recovered"
     ).scalar() or 0
+    total_recovered += archived_recovered
     
     failed_payments = db.query(func.count(RecoveryEvent.id)).filter(
         RecoveryEvent.company_id == company.id,
         RecoveryEvent.event_type == "payment_failed"
     ).scalar() or 0
+    failed_payments += archived_failed_count
     
     this_month = db.query(func.sum(RecoveryEvent.amount)).filter(
         RecoveryEvent.company_id == company.id,
         RecoveryEvent.event_type == "payment_recovered",
-        RecoveryEvent.created_at >= month_start
+        RecoveryEvent.created_at >= month_start,
+        RecoveryEvent.created_at < next_month_start
     ).scalar() or 0
     
     active_members = db.query(func.count(WhopCustomer.id.distinct())).filter(
@@ -89,10 +172,10 @@ async def get_company_stats(
     ).scalar() or 0
     
     # Calculate recovery rate
-    total_failed = db.query(func.sum(RecoveryEvent.amount)).filter(
+    total_failed = (db.query(func.sum(RecoveryEvent.amount)).filter(
         RecoveryEvent.company_id == company.id,
         RecoveryEvent.event_type == "payment_failed"
-    ).scalar() or 1  # Avoid division by zero
+    ).scalar() or 0) + archived_failed or 1  # Avoid division by zero
     
     recovery_rate = (total_recovered / total_failed * 100) if total_failed > 0 else 0
     
@@ -106,10 +189,12 @@ async def get_company_stats(
 
 
 @router.get("/companies/{company_id}/activity")
+@limiter.limit(plan_limits)
 async def get_recent_activity(
     company_id: str,
+    request: Request,
     company: WhopCompany = Depends(get_whop_company_with_auth),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     limit: int = 10
 ):
     """Get recent recovery activity for a company"""
@@ -131,11 +216,52 @@ async def get_recent_activity(
     return activity
 
 
+@router.get("/companies/{company_id}/analytics/recovery")
+@limiter.limit(plan_limits)
+async def get_recovery_analytics(
+    company_id: str,
+    request: Request,
+    company: WhopCompany = Depends(get_whop_company_with_auth),
+    db: Session = Depends(get_read_db)
+):
+    """Get time-to-recovery, cohort and per-attempt recovery analytics"""
+    return recovery_analytics_service.get_company_analytics(db, company.id)
+
+
+@router.get("/companies/{company_id}/members/distinct")
+@limiter.limit(plan_limits)
+async def get_distinct_members(
+    company_id: str,
+    request: Request,
+    metric: str = "failed",
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    company: WhopCompany = Depends(get_whop_company_with_auth),
+    db: Session = Depends(get_read_db)
+):
+    """Get approximate distinct affected members per day/week/month"""
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    
+    return member_sketch_service.distinct_members_series(db, company.id, metric, start, end, granularity)
+
+
 @router.get("/companies/{company_id}/settings")
+@limiter.limit(plan_limits)
 async def get_company_settings(
     company_id: str,
+    request: Request,
+    etag: Optional[str] = Depends(company_etag("settings")),
     company: WhopCompany = Depends(get_whop_company_with_auth),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get company settings"""
     return {
@@ -150,8 +276,11 @@ async def get_company_settings(
 
 
 @router.post("/companies/{company_id}/settings")
+@limiter.limit(plan_limits)
 async def update_company_settings(
     company_id: str,
+    request: Request,
+    response: Response,
     settings: CompanySettingsUpdate,
     company: WhopCompany = Depends(get_whop_company_with_auth),
     db: Session = Depends(get_db)
@@ -168,21 +297,33 @@ async def update_company_settings(
     if settings.sender_email is not None:
         company.sender_email = settings.sender_email
     if settings.retry_schedule is not None:
-        company.retry_schedule = settings.retry_schedule
+        try:
+            schedule = parse_retry_schedule(settings.retry_schedule)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        company.retry_schedule = schedule.to_days_string()
+        company.retry_schedule_hours = schedule.to_json()
     if settings.dunning_enabled is not None:
         company.dunning_enabled = settings.dunning_enabled
     if settings.email_enabled is not None:
         company.email_enabled = settings.email_enabled
+    company.settings_version = WhopCompany.settings_version + 1
+    company.data_version = WhopCompany.data_version + 1
     
     db.commit()
     db.refresh(company)
+    session_router.mark_write(company_id, response)
+    email_template_service.invalidate(company.id)
+    retry_schedule_service.invalidate(company.id)
     
     return {"message": "Settings updated successfully"}
 
 
 @router.post("/companies/{company_id}/stripe/connect")
+@limiter.limit(plan_limits)
 async def initiate_stripe_connect(
     company_id: str,
+    request: Request,
     company: WhopCompany = Depends(get_whop_company_with_auth),
     db: Session = Depends(get_db)
 ):
@@ -200,29 +341,36 @@ async def initiate_stripe_connect(
 
 
 @router.get("/companies/{company_id}/billing")
+@limiter.limit(plan_limits)
 async def get_billing_info(
     company_id: str,
+    request: Request,
     company: WhopCompany = Depends(get_whop_company_with_auth),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get billing information for a company"""
+    balance = fee_ledger_service.balance(db, company.id)
     return {
-        "total_recovered": company.total_recovered / 100,  # Convert to dollars
-        "total_fees_owed": company.total_fees_owed / 100,
-        "total_fees_paid": company.total_fees_paid / 100,
+        "total_recovered": balance.total_recovered / 100,  # Convert to dollars
+        "total_fees_owed": balance.total_fees_owed / 100,
+        "total_fees_paid": balance.total_fees_paid / 100,
         "fee_percentage": whop_payment_service.fee_percentage * 100,  # As percentage
         "payment_methods": await whop_payment_service.get_payment_methods(company.whop_company_id)
     }
 
 
 @router.post("/companies/{company_id}/billing/process")
+@limiter.limit(plan_limits)
 async def process_pending_fees(
     company_id: str,
+    request: Request,
+    response: Response,
     company: WhopCompany = Depends(get_whop_company_with_auth),
     db: Session = Depends(get_db)
 ):
     """Process pending fees for a company"""
     result = await whop_payment_service.process_batch_fees(db, company)
+    session_router.mark_write(company_id, response)
     return result
 
 
@@ -268,10 +416,76 @@ async def handle_whop_webhook(
             company.is_active = False
             db.commit()
     
+    elif event_type and event_type.startswith("charge."):
+        return await whop_payment_service.handle_payment_webhook(body)
+    
     return {"status": "processed"}
 
 
+@router.post("/webhooks/resend")
+async def handle_resend_webhook(
+    request: Request,
+    webhook_verified: bool = Depends(verify_resend_webhook),
+    db: Session = Depends(get_db)
+):
+    """Handle Resend delivery webhooks (bounces and spam complaints)"""
+    
+    body = await request.json()
+    flagged = suppression_index.handle_resend_event(db, body)
+    db.commit()
+    
+    return {"status": "processed", "suppressed": flagged}
+
+
+UNSUBSCRIBE_PAGE = """<!DOCTYPE html>
+<html>
+<body style="font-family:Helvetica,Arial,sans-serif;text-align:center;padding:48px 16px;">
+  <p>Stop payment reminder emails to {email}?</p>
+  <form method="post" action="{action}">
+    <button type="submit">Unsubscribe</button>
+  </form>
+</body>
+</html>
+"""
+
+
+def _check_unsubscribe_token(company: int, email: str, token: str) -> None:
+    if not hmac.compare_digest(token, unsubscribe_token(company, email)):
+        raise HTTPException(status_code=400, detail="Invalid unsubscribe link")
+
+
+@router.get("/unsubscribe", response_class=HTMLResponse)
+async def unsubscribe_page(request: Request, company: int, email: str, token: str):
+    """
+    Unsubscribe link target: a confirmation page only
+
+    Mail scanners and prefetchers follow links, so nothing is changed until
+    the form is posted.
+    """
+    _check_unsubscribe_token(company, email, token)
+    return UNSUBSCRIBE_PAGE.format(email=html.escape(email), action=html.escape(str(request.url)))
+
+
+@router.post("/unsubscribe")
+async def unsubscribe(
+    company: int,
+    email: str,
+    token: str,
+    db: Session = Depends(get_db)
+):
+    """Confirmation form and one-click List-Unsubscribe (RFC 8058) target"""
+    
+    _check_unsubscribe_token(company, email, token)
+    
+    suppression_index.suppress(db, email, company_id=company)
+    db.commit()
+    
+    return {"message": "You have been unsubscribed"}
+
+
 @router.post("/webhooks/stripe/{company_id}")
+@limiter.limit(RateLimits.WEBHOOK, key_func=webhook_key)
+@limiter.shared_limit(RateLimits.WEBHOOK_PER_IP, scope="stripe_webhooks", key_func=get_remote_address)
 async def handle_stripe_webhook(
     company_id: str,
     request: Request,
@@ -333,10 +547,17 @@ async def handle_stripe_webhook(
         customer.total_failed_amount += amount
         customer.last_failed_payment_at = datetime.utcnow()
         customer.recovery_status = RecoveryStatus.IN_PROGRESS
+        member_sketch_service.record(db, company.id, "failed", customer.stripe_customer_id)
         
-        db.commit()
+        # Persist the dunning steps; app/workers/dunning_scheduler.py fires them.
+        # Steps are timed from when Stripe saw the failure, not from delivery.
+        failed_at = datetime.utcfromtimestamp(body["created"]) if body.get("created") else None
+        dunning_service.schedule_sequence(
+            db, company, customer, invoice.get("id"),
+            failed_at=failed_at, amount=amount, currency=invoice.get("currency", "usd")
+        )
         
-        # TODO: Trigger dunning sequence
+        db.commit()
         
     elif event_type == "invoice.payment_succeeded":
         # Handle recovered payment
@@ -366,36 +587,25 @@ async def handle_stripe_webhook(
             customer.total_recovered_amount += amount
             customer.last_recovered_payment_at = datetime.utcnow()
             customer.recovery_status = RecoveryStatus.RECOVERED
+            member_sketch_service.record(db, company.id, "recovered", customer.stripe_customer_id)
+            dunning_service.cancel_sequence(db, customer.id, invoice.get("id"))
             
-            # Update company totals and calculate fees
-            company.total_recovered += amount
+            # Append to the fee ledger rather than updating company counters
             fee = whop_payment_service.calculate_fee(amount)
-            company.total_fees_owed += fee
-            
-            db.commit()
+            fee_ledger_service.record_recovery(db, company.id, amount, fee, reference=body.get("id"))
             
-            # Trigger immediate fee collection for larger amounts
+            # Larger recoveries get their fee charged right away; the intent
+            # commits with the recovery and app/workers/outbox_dispatcher.py
+            # makes the Whop call
             if amount >= 10000:  # $100 or more recovered
-                try:
-                    await whop_payment_service.create_transaction_fee_charge(
-                        company=company,
-                        recovered_amount=amount,
-                        transaction_metadata={
-                            "immediate_charge": True,
-                            "stripe_event_id": body.get("id"),
-                            "stripe_invoice_id": invoice.get("id")
-                        }
-                    )
-                    # Reset fees owed since we just charged them
-                    company.total_fees_paid += fee
-                    company.total_fees_owed -= fee
-                    db.commit()
-                except Exception as e:
-                    # Log error but don't fail the webhook
-                    print(f"Failed to charge immediate fee: {str(e)}")
-    
-    # Update last webhook timestamp
+                outbox_service.enqueue_fee_charge(db, company.id, fee, body.get("id"), invoice.get("id"))
+            
+            db.commit()
+    
+    # Update last webhook timestamp; events may have changed the stats
     company.last_webhook_at = datetime.utcnow()
+    company.data_version = WhopCompany.data_version + 1
     db.commit()
+    session_router.mark_write(company_id)
     
     return {"status": "processed"}
\ No newline at end of file
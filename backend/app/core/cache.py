@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import math
+import time
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class TTLCache:
+    """
+    Small in-process cache with per-entry expiry and LRU eviction
+
+    Entries live in the worker process only, so values must be safe to
+    serve slightly stale across workers.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or ``default`` if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (self.clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry if present"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_MISSING = object()
+
+
+class SharedGenerations:
+    """
+    Invalidation counters shared by the worker processes on a host
+
+    Kept in a ``limits`` storage, normally the ``shm://`` file of
+    app/core/rate_limit_storage.py, so bumping a key in one worker is seen
+    by the others on their next read. ``expiry_seconds`` must be at least
+    the lifetime of the cache entries the counters guard.
+
+    A bump moves the counter to a microsecond timestamp (or one past its
+    value), not just up by one: a counter that expired or lost its slot
+    starts over, and counting up from 1 again would bring back versions
+    that entries still remember.
+    """
+
+    def __init__(
+        self,
+        storage: Any,
+        namespace: str,
+        expiry_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.storage = storage
+        self.namespace = namespace
+        self.expiry_seconds = int(math.ceil(expiry_seconds))
+        self.clock = clock
+
+    def version(self, key: Hashable) -> Tuple[int, int]:
+        """Counters for everything and for ``key``; a change in either invalidates"""
+        return self.storage.get(f"{self.namespace}:*"), self.storage.get(f"{self.namespace}:{key}")
+
+    def _bump(self, name: str) -> None:
+        counter = f"{self.namespace}:{name}"
+        token = int(self.clock() * 1_000_000)
+        self.storage.incr(counter, self.expiry_seconds, max(1, token - self.storage.get(counter)))
+
+    def bump(self, key: Hashable) -> None:
+        self._bump(str(key))
+
+    def bump_all(self) -> None:
+        self._bump("*")
+
+
+class StaleWhileRevalidateCache:
+    """
+    Async cache that serves stale entries while refreshing them
+
+    An entry is fresh for ``ttl_seconds``; for ``stale_seconds`` after that
+    it is still returned immediately and a background refresh is started.
+    Only one load per key runs at a time: concurrent misses await the same
+    load. A failed background refresh keeps the stale value; a failed load
+    on a miss raises to the caller. ``invalidate`` also discards the result
+    of any load already in flight for the key.
+
+    Entries live in the worker process. With ``shared`` generations,
+    ``invalidate`` and ``clear`` also reach the other workers on the host:
+    each entry remembers the generation it was loaded under and is treated
+    as a miss once that has moved on.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        stale_seconds: float,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+        shared: Optional[SharedGenerations] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.clock = clock
+        self.shared = shared
+        # Load time, value and shared generation; expires once too old to serve stale
+        self._entries = TTLCache(ttl_seconds + stale_seconds, max_entries, clock)
+        self._loads: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self._generations: Dict[Hashable, int] = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and self.shared is not None and entry[2] != self.shared.version(key):
+            # Invalidated by another worker
+            self._drop(key)
+            entry = None
+        if entry is not None:
+            loaded_at, value, _ = entry
+            if self.clock() - loaded_at >= self.ttl_seconds and key not in self._loads:
+                self._start_load(key, loader)
+            return value
+
+        load = self._loads.get(key) or self._start_load(key, loader)
+        return await asyncio.shield(load)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        generation = self._generations.get(key, 0)
+        # Read before loading, so an invalidation during the load isn't missed
+        shared_version = self.shared.version(key) if self.shared is not None else None
+
+        async def load() -> Any:
+            try:
+                value = await loader()
+                if self._generations.get(key, 0) == generation:
+                    self._entries.set(key, (self.clock(), value, shared_version))
+                return value
+            finally:
+                # An invalidate may already have replaced this load
+                if self._loads.get(key) is asyncio.current_task():
+                    del self._loads[key]
+
+        task = asyncio.ensure_future(load())
+        task.add_done_callback(_log_failed_load)
+        self._loads[key] = task
+        return task
+
+    def invalidate(self, key: Hashable) -> None:
+        self._drop(key)
+        if self.shared is not None:
+            self.shared.bump(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for key in list(self._loads):
+            self._drop(key)
+        if self.shared is not None:
+            self.shared.bump_all()
+
+    def _drop(self, key: Hashable) -> None:
+        self._entries.invalidate(key)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self._loads.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _log_failed_load(task: "asyncio.Future[Any]") -> None:
+    # Also marks the exception retrieved when nobody awaited a background refresh
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Cache load failed", error=str(task.exception()))
@@ -1,6 +1,11 @@
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from fastapi import Request, Response
 from app.core.config import settings
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+import time
 import structlog
 
 logger = structlog.get_logger()
@@ -23,15 +28,162 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# Optional read replica for read-only dashboard routes
+READ_DATABASE_URL = settings.READ_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+
+read_engine = create_async_engine(
+    READ_DATABASE_URL,
+    echo=settings.DEBUG,
+    pool_pre_ping=True,
+    pool_recycle=300,
+) if READ_DATABASE_URL else None
+
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+) if read_engine is not None else None
+
 class Base(DeclarativeBase):
     pass
 
+
+async def probe_replica_lag(session: AsyncSession) -> float:
+    """
+    Seconds the replica is behind the primary
+
+    Uses the last replayed transaction time, so an idle primary reads as
+    growing lag; that only sends reads to the primary, never stale data.
+    Non-Postgres replicas (local SQLite setups) report no lag.
+    """
+    if session.bind.dialect.name != "postgresql":
+        return 0.0
+    result = await session.execute(text(
+        "SELECT CASE WHEN pg_is_in_recovery() "
+        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+        "ELSE 0 END"
+    ))
+    return float(result.scalar() or 0.0)
+
+
+# Sent with write responses; clients echo it so their next reads, on any
+# worker, go to the primary until the replica has caught up
+READ_PRIMARY_HEADER = "X-Read-Primary-Until"
+
+
+class SessionRouter:
+    """
+    Chooses between the primary and the read replica for read-only routes
+
+    Reads go to the primary when no replica is configured, when replica lag
+    exceeds the threshold (or can't be measured), and for a short window
+    after a write so users see their own changes. That window is kept per
+    key in this process and, when the write's response is passed to
+    ``mark_write``, handed to the client as a ``READ_PRIMARY_HEADER``
+    timestamp that any worker honours.
+    """
+    
+    def __init__(
+        self,
+        primary: async_sessionmaker,
+        replica: Optional[async_sessionmaker] = None,
+        max_lag_seconds: float = settings.REPLICA_MAX_LAG_SECONDS,
+        lag_check_seconds: float = settings.REPLICA_LAG_CHECK_SECONDS,
+        sticky_seconds: float = settings.REPLICA_STICKY_SECONDS,
+        lag_probe: Callable[[AsyncSession], Awaitable[float]] = probe_replica_lag,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self.sticky_seconds = sticky_seconds
+        self.lag_probe = lag_probe
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._sticky_until: Dict[Hashable, float] = {}
+        self._lag: Optional[float] = None
+        self._lag_checked_at: Optional[float] = None
+    
+    def mark_write(self, key: Optional[Hashable], response: Optional[Response] = None) -> None:
+        """Pin reads for ``key`` (and the client, given its ``response``) to the primary while the replica catches up"""
+        if self.replica is None:
+            return
+        if response is not None:
+            response.headers[READ_PRIMARY_HEADER] = f"{self.wall_clock() + self.sticky_seconds:.3f}"
+        if key is None:
+            return
+        now = self.clock()
+        self._sticky_until[key] = now + self.sticky_seconds
+        # Drop expired pins so the map stays bounded by recent writers
+        if len(self._sticky_until) > 10000:
+            self._sticky_until = {k: t for k, t in self._sticky_until.items() if t > now}
+    
+    async def replica_lag(self) -> Optional[float]:
+        """Cached replica lag in seconds, None if the probe failed"""
+        now = self.clock()
+        if self._lag_checked_at is None or now - self._lag_checked_at >= self.lag_check_seconds:
+            self._lag_checked_at = now
+            try:
+                async with self.replica() as session:
+                    self._lag = await self.lag_probe(session)
+            except Exception as e:
+                logger.warning("Replica lag check failed", error=str(e))
+                self._lag = None
+        return self._lag
+    
+    def pinned_by_client(self, read_primary_until: Optional[str]) -> bool:
+        """Whether a client's ``READ_PRIMARY_HEADER`` value is still running"""
+        try:
+            until = float(read_primary_until)
+        except (TypeError, ValueError):
+            return False
+        now = self.wall_clock()
+        # Values further out than one window weren't issued here; ignored so
+        # a client can't keep itself off the replica
+        return now < until <= now + self.sticky_seconds + 1
+    
+    async def read_sessionmaker(
+        self,
+        key: Optional[Hashable] = None,
+        read_primary_until: Optional[str] = None,
+    ) -> async_sessionmaker:
+        """Session factory to use for a read-only request"""
+        if self.replica is None:
+            return self.primary
+        if self.pinned_by_client(read_primary_until):
+            return self.primary
+        
+        sticky_until = self._sticky_until.get(key) if key is not None else None
+        if sticky_until is not None:
+            if sticky_until > self.clock():
+                return self.primary
+            del self._sticky_until[key]
+        
+        lag = await self.replica_lag()
+        if lag is None or lag > self.max_lag_seconds:
+            return self.primary
+        return self.replica
+
+
+session_router = SessionRouter(AsyncSessionLocal, ReadSessionLocal)
+
 async def create_tables():
     """Create all database tables"""
     try:
         async with engine.begin() as conn:
             from app.models import user, customer, invoice, recovery_attempt, event, settings as settings_model
-            await conn.run_sync(Base.metadata.create_all)
+            if conn.dialect.name == "postgresql":
+                # recovery_events is range-partitioned by month on Postgres
+                from app.core.partitioning import create_partitioned_tables
+                await conn.run_sync(
+                    create_partitioned_tables,
+                    datetime.now(timezone.utc),
+                    settings.RECOVERY_EVENTS_PREMAKE_MONTHS,
+                )
+            else:
+                await conn.run_sync(Base.metadata.create_all)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error("Failed to create database tables", error=str(e))
@@ -47,4 +199,20 @@ async def get_db() -> AsyncSession:
             logger.error("Database session error", error=str(e))
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+async def get_read_db(request: Request) -> AsyncSession:
+    """Dependency to get a session for read-only routes (replica when healthy)"""
+    sessionmaker = await session_router.read_sessionmaker(
+        request.path_params.get("company_id"),
+        request.headers.get(READ_PRIMARY_HEADER),
+    )
+    async with sessionmaker() as session:
+        try:
+            yield session
+        except Exception as e:
+            await session.rollback()
+            logger.error("Database session error", error=str(e))
+            raise
+        finally:
+            await session.close()
@@ -7,6 +7,7 @@ from app.core.security import verify_token
 from app.services.user_service import UserService
 from app.models.user import User
 from app.schemas.user import TokenData
+from app.middleware.rate_limit import remember_tenant_plan, user_key
 import structlog
 
 logger = structlog.get_logger()
@@ -57,6 +58,7 @@ async def get_current_user(
             )
         
         logger.debug("User authenticated successfully", user_id=user.id, email=user.email)
+        remember_tenant_plan(user_key(user.id), user.plan)
         return user
         
     except HTTPException:
@@ -0,0 +1,18 @@
+from typing import Optional
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from everything the response body depends on"""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches (weak comparison, as RFC 9110 asks for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
@@ -0,0 +1,176 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+import re
+
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, inspect, text
+from sqlalchemy.engine import Connection
+import structlog
+
+logger = structlog.get_logger()
+
+RECOVERY_EVENTS_TABLE = "recovery_events"
+
+# Monthly partitions are named e.g. recovery_events_p2024_03
+PARTITION_NAME_RE = re.compile(r"^recovery_events_p(\d{4})_(\d{2})$")
+
+# Catches rows for months without a partition (e.g. a backfill, or maintenance
+# not having run); they are moved to their month's partition on the next run
+DEFAULT_PARTITION = f"{RECOVERY_EVENTS_TABLE}_default"
+
+
+def month_start(value: datetime) -> datetime:
+    """First instant of the value's month, in UTC"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Shift a month start by a number of months"""
+    index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{RECOVERY_EVENTS_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """Month covered by a partition, or None if the name isn't ours"""
+    match = PARTITION_NAME_RE.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def build_partitioned_recovery_events() -> Table:
+    """
+    Copy of the ``recovery_events`` table declared as range-partitioned
+
+    Postgres requires the partition key in every unique constraint, so the
+    primary key becomes ``(id, created_at)``. The ORM mapping keeps ``id``
+    as its identity, which stays unique through the shared sequence.
+    """
+    from app.core.database import Base
+
+    metadata = MetaData()
+    # Foreign key targets have to exist in the same MetaData to compile
+    for name in ("whop_companies", "whop_customers"):
+        Base.metadata.tables[name].to_metadata(metadata)
+
+    table = Base.metadata.tables[RECOVERY_EVENTS_TABLE].to_metadata(metadata)
+    table.dialect_options["postgresql"]["partition_by"] = "RANGE (created_at)"
+    table.c.id.autoincrement = True
+    table.c.created_at.nullable = False
+    table.c.created_at.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint(table.c.id, table.c.created_at))
+    return table
+
+
+def is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name)"
+    ), {"name": RECOVERY_EVENTS_TABLE}).scalar())
+
+
+def list_partitions(conn: Connection) -> List[str]:
+    """Names of partitions currently attached to ``recovery_events``"""
+    rows = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE parent.relname = :name ORDER BY child.relname"
+    ), {"name": RECOVERY_EVENTS_TABLE})
+    return [row[0] for row in rows]
+
+
+def list_detached_partitions(conn: Connection) -> List[str]:
+    """Partition tables that were detached but not yet archived and dropped"""
+    rows = conn.execute(text(
+        "SELECT relname FROM pg_class "
+        "WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern "
+        "ORDER BY relname"
+    ), {"pattern": f"{RECOVERY_EVENTS_TABLE}_p%"})
+    return [row[0] for row in rows if PARTITION_NAME_RE.match(row[0])]
+
+
+def default_partition_months(conn: Connection) -> List[datetime]:
+    """Months that have rows sitting in the default partition"""
+    rows = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') FROM \"{DEFAULT_PARTITION}\""
+    ))
+    return sorted(month_start(row[0]) for row in rows)
+
+
+def create_month_partition(conn: Connection, start: datetime, has_default_rows: bool) -> str:
+    """
+    Create one month's partition, taking over its rows from the default
+
+    Postgres refuses a new partition whose range already has rows in the
+    default partition, so those are moved into a standalone table that is
+    then attached.
+    """
+    name = partition_name(start)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+    if not has_default_rows:
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {RECOVERY_EVENTS_TABLE} FOR VALUES {bounds}'
+        ))
+        return name
+
+    in_month = "created_at >= :start AND created_at < :end"
+    params = {"start": start, "end": add_months(start, 1)}
+    conn.execute(text(
+        f'CREATE TABLE "{name}" (LIKE {RECOVERY_EVENTS_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    ))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE {in_month} RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved'
+    ), params)
+    conn.execute(text(f'ALTER TABLE {RECOVERY_EVENTS_TABLE} ATTACH PARTITION "{name}" FOR VALUES {bounds}'))
+    return name
+
+
+def ensure_monthly_partitions(conn: Connection, now: datetime, months_ahead: int) -> List[str]:
+    """
+    Create partitions for the current month and ``months_ahead`` after it,
+    and for any month that has rows in the default partition
+    """
+    created = []
+    existing = set(list_partitions(conn))
+    current = month_start(now)
+    stray = default_partition_months(conn) if DEFAULT_PARTITION in existing else []
+    months = sorted({add_months(current, offset) for offset in range(months_ahead + 1)} | set(stray))
+
+    for start in months:
+        if partition_name(start) in existing:
+            continue
+        created.append(create_month_partition(conn, start, start in stray))
+
+    if created:
+        logger.info("Created recovery_events partitions", partitions=created)
+    return created
+
+
+def create_partitioned_tables(conn: Connection, now: datetime, months_ahead: int) -> None:
+    """
+    Create the schema on Postgres with ``recovery_events`` partitioned by month
+
+    An existing unpartitioned ``recovery_events`` table is left untouched;
+    it has to be copied into a partitioned table by a one-off migration.
+    """
+    from app.core.database import Base
+
+    tables = [t for t in Base.metadata.sorted_tables if t.name != RECOVERY_EVENTS_TABLE]
+    Base.metadata.create_all(conn, tables=tables)
+
+    if not inspect(conn).has_table(RECOVERY_EVENTS_TABLE):
+        build_partitioned_recovery_events().create(conn)
+    elif not is_partitioned(conn):
+        logger.warning("recovery_events exists but is not partitioned; skipping partition setup")
+        return
+
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF {RECOVERY_EVENTS_TABLE} DEFAULT'))
+    ensure_monthly_partitions(conn, now, months_ahead)
@@ -0,0 +1,211 @@
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import urllib.parse
+from typing import Callable, Optional, Tuple
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport
+
+_MAGIC = b"CCRL0001"
+_HEADER = struct.Struct("<8sQ")  # magic, slot count
+# key hash, window index, current count, previous count, expires at
+_SLOT = struct.Struct("<Qqqqd")
+_MAX_PROBES = 8
+
+
+def _key_hash(key: str) -> int:
+    # Stable across processes (builtin hash() is salted per process); 0 marks a free slot
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+class SharedMemoryStorage(Storage, SlidingWindowCounterSupport):
+    """
+    Rate limit counters shared by every worker process on the host
+
+    Counters live in a fixed-size open-addressing hash table in a memory
+    mapped file (``shm:///dev/shm/chargechase-ratelimit?slots=65536``).
+    Each key holds one slot with its current and previous window counts, so
+    a sliding-window-counter check is a hash, a short probe and a few
+    struct reads under one ``flock``: O(1) regardless of traffic. The file
+    outlives worker restarts, so deploys don't reset limits.
+
+    When every probed slot is live the oldest one is recycled, which can
+    only make a limit more lenient; size ``slots`` well above the number of
+    active keys.
+    """
+
+    STORAGE_SCHEME = ["shm"]
+
+    def __init__(
+        self,
+        uri: str = "shm://",
+        wrap_exceptions: bool = False,
+        slots: int = 65536,
+        clock: Callable[[], float] = time.time,
+        **options,
+    ):
+        parsed = urllib.parse.urlparse(uri)
+        query = urllib.parse.parse_qs(parsed.query)
+        self.path = (parsed.netloc + parsed.path) or _default_path()
+        self.slots = int(query.get("slots", [slots])[0])
+        self.clock = clock
+        self._thread_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._open()
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def _open(self) -> None:
+        if self._pid is not None:
+            # Inherited from the parent process
+            self._map.close()
+            os.close(self._fd)
+        size = _HEADER.size + self.slots * _SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+            magic, slots = _HEADER.unpack_from(self._map, 0)
+            if magic != _MAGIC or slots != self.slots:
+                # New file, or one laid out for another size: start empty
+                self._map[:] = bytes(size)
+                _HEADER.pack_into(self._map, 0, _MAGIC, self.slots)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _locked(self):
+        # A forked child must not share the parent's open file: flock is
+        # held per open file, so both would hold it at once
+        if self._pid != os.getpid():
+            self._open()
+        return _FileLock(self._fd, self._thread_lock)
+
+    def _offset(self, index: int) -> int:
+        return _HEADER.size + index * _SLOT.size
+
+    def _find(self, key: str, now: float, create: bool) -> Tuple[Optional[int], Tuple]:
+        """Slot offset and contents for ``key``; claims a slot if ``create``"""
+        key_hash = _key_hash(key)
+        start = key_hash % self.slots
+        free, oldest, oldest_expiry = None, None, math.inf
+        for probe in range(_MAX_PROBES):
+            offset = self._offset((start + probe) % self.slots)
+            slot = _SLOT.unpack_from(self._map, offset)
+            if slot[0] == key_hash:
+                if slot[4] > now:
+                    return offset, slot
+                free = offset if free is None else free
+                break
+            if slot[0] == 0 or slot[4] <= now:
+                free = offset if free is None else free
+            elif slot[4] < oldest_expiry:
+                oldest, oldest_expiry = offset, slot[4]
+        if not create:
+            return None, (key_hash, 0, 0, 0, 0.0)
+        offset = free if free is not None else oldest
+        return offset, (key_hash, 0, 0, 0, 0.0)
+
+    # Sliding window counter
+
+    def _window(self, key: str, expiry: int, now: float, create: bool):
+        offset, (key_hash, window, current, previous, _) = self._find(key, now, create)
+        index = int(now // expiry)
+        if window == index - 1:
+            previous, current = current, 0
+        elif window != index:
+            previous, current = 0, 0
+        # Weight of the previous window still inside the sliding window
+        previous_ttl = expiry - (now % expiry) if previous else 0.0
+        current_ttl = 2 * expiry - (now % expiry)
+        return offset, key_hash, index, previous, previous_ttl, current, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        with self._locked():
+            now = self.clock()
+            offset, key_hash, index, previous, previous_ttl, current, _ = self._window(key, expiry, now, True)
+            if math.floor(previous * previous_ttl / expiry + current) + amount > limit:
+                return False
+            _SLOT.pack_into(self._map, offset, key_hash, index, current + amount, previous, (index + 2) * expiry)
+            return True
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        with self._locked():
+            _, _, _, previous, previous_ttl, current, current_ttl = self._window(key, expiry, self.clock(), False)
+        return previous, previous_ttl, current, current_ttl
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        self.clear(key)
+
+    # Fixed window (limits' default strategy)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        with self._locked():
+            now = self.clock()
+            offset, (key_hash, _, count, _, expires_at) = self._find(key, now, True)
+            if expires_at <= now:
+                count, expires_at = 0, now + expiry
+            _SLOT.pack_into(self._map, offset, key_hash, -1, count + amount, 0, expires_at)
+            return count + amount
+
+    def get(self, key: str) -> int:
+        with self._locked():
+            _, slot = self._find(key, self.clock(), False)
+        return slot[2]
+
+    def get_expiry(self, key: str) -> float:
+        with self._locked():
+            now = self.clock()
+            _, slot = self._find(key, now, False)
+        return slot[4] or now
+
+    def check(self) -> bool:
+        return True
+
+    def reset(self) -> Optional[int]:
+        with self._locked():
+            self._map[_HEADER.size:] = bytes(self.slots * _SLOT.size)
+        return None
+
+    def clear(self, key: str) -> None:
+        with self._locked():
+            offset, slot = self._find(key, self.clock(), False)
+            if offset is not None:
+                _SLOT.pack_into(self._map, offset, 0, 0, 0, 0, 0.0)
+
+
+class _FileLock:
+    """Exclusive across threads (``threading.Lock``) and processes (``flock``)"""
+
+    __slots__ = ("fd", "thread_lock")
+
+    def __init__(self, fd: int, thread_lock: threading.Lock):
+        self.fd = fd
+        self.thread_lock = thread_lock
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+def _default_path() -> str:
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else "/tmp"
+    return os.path.join(base, "chargechase-ratelimit")
@@ -1,11 +1,17 @@
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.core.database import get_db
 from app.models import WhopCompany, WhopUser
+from app.middleware.rate_limit import check_auth_failures, company_key, count_auth_failure, remember_tenant_plan
 import requests
 from typing import Optional
+import base64
+import hashlib
+import hmac
 import os
+import time
 
 security = HTTPBearer()
 
@@ -59,14 +65,30 @@ class WhopAuthService:
 whop_auth_service = WhopAuthService()
 
 
+async def limit_failed_auth(request: Request) -> None:
+    """
+    Turn away addresses over their failed-auth budget before any token is
+    checked; requests without one are counted here, as ``security`` rejects them
+    """
+    check_auth_failures(request)
+    if not request.headers.get("Authorization"):
+        count_auth_failure(request)
+
+
 async def get_current_whop_user(
+    request: Request,
+    _limited: None = Depends(limit_failed_auth),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> WhopUser:
     """Get current Whop user from token"""
     
     # Verify token with Whop
-    whop_user_data = await whop_auth_service.verify_whop_token(credentials.credentials)
+    try:
+        whop_user_data = await whop_auth_service.verify_whop_token(credentials.credentials)
+    except HTTPException:
+        count_auth_failure(request)
+        raise
     
     # Get or create user in our database
     user = db.query(WhopUser).filter(WhopUser.whop_user_id == whop_user_data["id"]).first()
@@ -122,22 +144,30 @@ async def get_whop_company(
         company.profile_pic_url = company_data.get("profile_pic_url") or company.profile_pic_url
         db.commit()
     
+    # Routes check their rate limit after this runs; the tier comes from here
+    remember_tenant_plan(company_key(company_id), company.plan)
     return company
 
 
 async def get_whop_company_with_auth(
     company_id: str,
+    request: Request,
     user: WhopUser = Depends(get_current_whop_user),
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> WhopCompany:
     """Get company and verify user has access to it"""
     
-    company = await get_whop_company(company_id, credentials, db)
+    try:
+        company = await get_whop_company(company_id, credentials, db)
+    except HTTPException:
+        count_auth_failure(request)
+        raise
     
-    # In a real implementation, you'd verify the user has access to this company
-    # through the Whop API or by checking membership
-    # For now, we'll assume access is granted
+    # Only the company's owner is admitted until Whop team membership is checked
+    if company.whop_owner_id != user.whop_user_id:
+        count_auth_failure(request)
+        raise HTTPException(status_code=403, detail="Not authorized for this company")
     
     return company
 
@@ -163,4 +193,41 @@ async def verify_whop_webhook(request: Request) -> bool:
     if provided_secret != webhook_secret:
         raise HTTPException(status_code=401, detail="Invalid webhook signature")
     
-    return True
\ No newline at end of file
+    return True
+
+def resend_signature_valid(secret: str, msg_id: str, timestamp: str, body: bytes, signatures: str) -> bool:
+    """Check a Svix-style ``svix-signature`` header as sent by Resend webhooks"""
+    key = base64.b64decode(secret.split("_", 1)[1] if secret.startswith("whsec_") else secret)
+    signed = f"{msg_id}.{timestamp}.".encode() + body
+    expected = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest()).decode()
+    return any(
+        hmac.compare_digest(expected, candidate.split(",", 1)[-1])
+        for candidate in signatures.split()
+    )
+
+
+async def verify_resend_webhook(request: Request) -> bool:
+    """Verify that a webhook request came from Resend"""
+    
+    if not settings.RESEND_WEBHOOK_SECRET:
+        raise HTTPException(status_code=500, detail="Webhook secret not configured")
+    
+    msg_id = request.headers.get("svix-id")
+    timestamp = request.headers.get("svix-timestamp")
+    signatures = request.headers.get("svix-signature")
+    if not (msg_id and timestamp and signatures):
+        raise HTTPException(status_code=401, detail="Missing webhook signature")
+    
+    # Reject replays of old deliveries
+    try:
+        too_old = abs(time.time() - int(timestamp)) > 300
+    except ValueError:
+        too_old = True
+    if too_old:
+        raise HTTPException(status_code=401, detail="Webhook timestamp out of range")
+    
+    body = await request.body()
+    if not resend_signature_valid(settings.RESEND_WEBHOOK_SECRET, msg_id, timestamp, body, signatures):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    return True
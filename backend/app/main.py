@@ -1,12 +1,14 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
 import structlog
 
 from app.core.config import settings
-from app.core.database import create_tables
+from app.core.database import AsyncSessionLocal, READ_PRIMARY_HEADER, create_tables
+from app.services.suppression import suppression_index
 from app.api.routes import auth, webhooks, dashboard, onboarding, health
+from app.middleware.access_log import AccessLogMiddleware, access_log_writer
 from app.middleware.security_headers import SecurityHeadersMiddleware, RequestSizeMiddleware
 from app.middleware.rate_limit import limiter, rate_limit_handler
 from slowapi import _rate_limit_exceeded_handler
@@ -37,8 +39,11 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     logger.info("Starting ChargeChase API")
     await create_tables()
+    async with AsyncSessionLocal() as session:
+        await suppression_index.load(session)
     yield
     logger.info("Shutting down ChargeChase API")
+    access_log_writer.stop()
 
 # Create FastAPI application
 app = FastAPI(
@@ -53,7 +58,11 @@ app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
 
 # Security middlewares (order matters - apply from innermost to outermost)
-app.add_middleware(RequestSizeMiddleware, max_size=16 * 1024 * 1024)  # 16MB limit
+app.add_middleware(
+    RequestSizeMiddleware,
+    max_size=settings.MAX_REQUEST_BODY_BYTES,
+    route_limits=settings.REQUEST_BODY_LIMITS,
+)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.ALLOWED_HOSTS)
 
@@ -64,25 +73,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
     allow_headers=["*"],
+    expose_headers=[READ_PRIMARY_HEADER],
 )
 
-# Request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(
-        "Request received",
-        method=request.method,
-        path=request.url.path,
-        client_host=request.client.host if request.client else None
-    )
-    response = await call_next(request)
-    logger.info(
-        "Response sent",
-        status_code=response.status_code,
-        method=request.method,
-        path=request.url.path
-    )
-    return response
+# Request logging middleware (outermost)
+app.add_middleware(AccessLogMiddleware)
 
 # Include API routes
 app.include_router(health.router, prefix="/api", tags=["health"])
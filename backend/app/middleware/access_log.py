@@ -0,0 +1,132 @@
+import fnmatch
+import queue
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+_STOP = object()
+
+
+class AccessLogWriter:
+    """
+    Writes access log lines from a background thread
+
+    The request path only queues a dict; rendering and writing the line
+    happen on the writer thread, off the event loop. If the queue is full
+    the line is dropped (and counted) rather than blocking a request.
+    """
+
+    def __init__(self, max_queue: int = 10000, sink: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.sink = sink or (lambda fields: logger.info("Request handled", **fields))
+        self.dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, fields: Dict[str, Any]) -> None:
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write out what's queued and stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        reported = 0
+        while True:
+            fields = self._queue.get()
+            if fields is _STOP:
+                break
+            try:
+                self.sink(fields)
+                if self.dropped != reported:
+                    logger.warning("Access log lines dropped", count=self.dropped - reported)
+                    reported = self.dropped
+            except Exception:
+                # A failed write must not stop the writer
+                pass
+
+
+access_log_writer = AccessLogWriter(max_queue=settings.ACCESS_LOG_QUEUE_SIZE)
+
+
+class AccessLogMiddleware:
+    """
+    Logs one line per HTTP request: method, path, status and latency
+
+    Responses with status 400 and above are always logged. Successful ones
+    on paths matching a ``sample_rates`` glob pattern (first match wins) are
+    logged at that rate, with ``sample_rate`` in the line so counts can be
+    scaled back up; other paths are logged in full.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rates: Optional[Dict[str, float]] = None,
+        writer: Optional[AccessLogWriter] = None,
+    ):
+        self.app = app
+        rates = settings.ACCESS_LOG_SAMPLE_RATES if sample_rates is None else sample_rates
+        self.sample_rates = [(re.compile(fnmatch.translate(pattern)), rate) for pattern, rate in rates.items()]
+        self.writer = writer or access_log_writer
+
+    def sample_rate(self, path: str) -> float:
+        for pattern, rate in self.sample_rates:
+            if pattern.match(path):
+                return rate
+        return 1.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_and_record(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            rate = 1.0 if status_code >= 400 else self.sample_rate(scope["path"])
+            if rate >= 1.0 or random.random() < rate:
+                client = scope.get("client")
+                fields = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "client_host": client[0] if client else None,
+                }
+                if rate < 1.0:
+                    fields["sample_rate"] = rate
+                self.writer.submit(fields)
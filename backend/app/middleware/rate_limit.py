@@ -2,16 +2,80 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
-from fastapi import Request, Response
-from typing import Dict, Any
+from fastapi import HTTPException, Request, Response
+from limits import parse_many
+from typing import Dict, Any, Optional
+import math
+import time
 import structlog
 
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.security import verify_token
+from app.core import rate_limit_storage  # noqa: F401 - registers the shm:// storage scheme
+from app.models.user import PlanType
+
 logger = structlog.get_logger()
 
+# Plan of each tenant key, filled by the auth dependencies that already load
+# the company or user row, so picking a tier never queries the database
+tenant_plans = TTLCache(ttl_seconds=settings.TENANT_PLAN_CACHE_TTL_SECONDS, max_entries=50000)
+
+
+def company_key(whop_company_id: str) -> str:
+    return f"company:{whop_company_id}"
+
+
+def user_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def remember_tenant_plan(key: str, plan: Optional[PlanType]) -> None:
+    """Record the plan of a tenant just loaded from the database"""
+    tenant_plans.set(key, plan or PlanType.STARTER)
+
+
+def tenant_key(request: Request) -> str:
+    """
+    Rate limit key for a request: the company in the path, else the user of
+    a valid bearer token, else the client IP
+
+    Keying by tenant keeps creators behind a shared NAT from sharing one
+    budget. Routes run their auth dependencies before the limit is checked,
+    so a company key is only counted for callers allowed to use it.
+    """
+    company_id = request.path_params.get("company_id")
+    if company_id:
+        return company_key(company_id)
+
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = verify_token(token)
+        if payload and payload.get("sub"):
+            return user_key(payload["sub"])
+
+    return get_remote_address(request)
+
+
+def webhook_key(request: Request) -> str:
+    """
+    Per-company key for webhooks, so one busy account can't starve the rest
+
+    Unsigned webhooks pair it with a ``get_remote_address`` shared limit
+    (one scope across every company's URL), since anyone can post to them.
+    """
+    company_id = request.path_params.get("company_id")
+    if company_id:
+        return company_key(company_id)
+    return get_remote_address(request)
+
+
 # Create limiter instance
 limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["1000/day", "100/hour"]
+    key_func=tenant_key,
+    default_limits=["1000/day", "100/hour"],
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
 )
 
 # Custom rate limit exceeded handler
@@ -22,15 +86,21 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded) -> Respon
     logger.warning(
         "Rate limit exceeded",
         client_ip=client_ip,
+        tenant=tenant_key(request),
         path=request.url.path,
         limit=str(exc.detail)
     )
     
+    # slowapi leaves the limit that was hit (and its key) on request.state
+    item, args = request.state.view_rate_limit
+    reset_at = limiter.limiter.get_window_stats(item, *args).reset_time
+    retry_after = max(1, math.ceil(reset_at - time.time()))
+    
     response = Response(
-        content=f'{{"detail": "Rate limit exceeded: {exc.detail}", "retry_after": {exc.retry_after}}}',
+        content=f'{{"detail": "Rate limit exceeded: {exc.detail}", "retry_after": {retry_after}}}',
         status_code=429,
         headers={
-            "Retry-After": str(exc.retry_after),
+            "Retry-After": str(retry_after),
             "X-RateLimit-Limit": str(exc.detail),
             "Content-Type": "application/json"
         }
@@ -38,23 +108,81 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded) -> Respon
     return response
 
 # Rate limiting decorators for different endpoint types
+# (limit strings are ";"-separated: slowapi reads a list as no limits at all)
 class RateLimits:
     """Predefined rate limits for different endpoint categories"""
     
     # Authentication endpoints (more restrictive)
-    AUTH_STRICT = ["5/minute", "20/hour", "100/day"]
+    AUTH_STRICT = "5/minute;20/hour;100/day"
     
     # General API endpoints
-    API_GENERAL = ["30/minute", "300/hour", "1000/day"] 
+    API_GENERAL = "30/minute;300/hour;1000/day"
     
     # Read-only endpoints (less restrictive)
-    READ_ONLY = ["100/minute", "1000/hour", "5000/day"]
+    READ_ONLY = "100/minute;1000/hour;5000/day"
     
     # Admin/sensitive operations (very restrictive)
-    ADMIN = ["2/minute", "10/hour", "50/day"]
+    ADMIN = "2/minute;10/hour;50/day"
     
     # Webhook endpoints
-    WEBHOOK = ["60/minute", "1000/hour"]
+    WEBHOOK = "60/minute;1000/hour"
+    
+    # Per sender address alongside WEBHOOK; Stripe delivers every account's
+    # events from a few shared addresses, so this is well above one company's
+    WEBHOOK_PER_IP = "1000/minute"
+    
+    # Per client address, for requests that fail authentication
+    AUTH_FAILURES = "30/minute;300/hour"
+
+
+# Tenant API limits by plan; tenants not seen yet get the starter tier
+PLAN_LIMITS = {
+    PlanType.STARTER: "60/minute;1000/hour;10000/day",
+    PlanType.GROWTH: "300/minute;5000/hour;50000/day",
+    PlanType.PRO: "1200/minute;20000/hour;200000/day",
+}
+
+
+def plan_limits(key: str) -> str:
+    """Dynamic limit for ``@limiter.limit``: the tier of the tenant behind ``key``"""
+    return PLAN_LIMITS[tenant_plans.get(key, PlanType.STARTER)]
+
+def check_route_limit(request: Request) -> None:
+    """
+    Count the request against its route's ``@limiter.limit`` now
+
+    For dependencies that can end a request before the endpoint runs, which
+    is where slowapi checks; the decorator then sees the check is done.
+    """
+    if getattr(request.state, "_rate_limiting_complete", False):
+        return
+    limiter._check_request_limit(request, request.scope["endpoint"], False)
+    request.state._rate_limiting_complete = True
+
+# Tenant limits are checked after authentication, so requests that fail it
+# are only ever counted here
+auth_failure_limits = parse_many(RateLimits.AUTH_FAILURES)
+
+
+def check_auth_failures(request: Request) -> None:
+    """Answer 429 if the client's address has used up its failed-auth budget"""
+    key = get_remote_address(request)
+    for item in auth_failure_limits:
+        if not limiter.limiter.test(item, "auth_failures", key):
+            reset_at = limiter.limiter.get_window_stats(item, "auth_failures", key).reset_time
+            raise HTTPException(
+                status_code=429,
+                detail="Too many failed authentication attempts",
+                headers={"Retry-After": str(max(1, math.ceil(reset_at - time.time())))},
+            )
+
+
+def count_auth_failure(request: Request) -> None:
+    """Count a request that failed authentication against its address"""
+    key = get_remote_address(request)
+    for item in auth_failure_limits:
+        limiter.limiter.hit(item, "auth_failures", key)
+    logger.info("Authentication failed", client_ip=key, path=request.url.path)
 
 def get_limiter():
     """Get the limiter instance"""
@@ -1,16 +1,49 @@
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from typing import Callable
+from typing import Dict, Iterable, List, Optional, Tuple
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import structlog
 
 logger = structlog.get_logger()
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """Middleware to add security headers to all responses"""
-    
+# Content Security Policy (basic)
+CONTENT_SECURITY_POLICY = "; ".join([
+    "default-src 'self'",
+    "script-src 'self' 'unsafe-inline'",
+    "style-src 'self' 'unsafe-inline'",
+    "img-src 'self' data: https:",
+    "font-src 'self'",
+    "connect-src 'self'",
+    "frame-ancestors 'none'",
+    "base-uri 'self'",
+    "form-action 'self'",
+])
+
+
+def _encode(headers: Iterable[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+def get_header(scope: Scope, name: bytes) -> Optional[bytes]:
+    """First value of a request header (``name`` lowercase) straight from the ASGI scope"""
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class SecurityHeadersMiddleware:
+    """
+    Middleware to add security headers to all responses
+
+    Plain ASGI rather than ``BaseHTTPMiddleware``: the header block is
+    encoded once here and appended to ``http.response.start``, and the body
+    passes through untouched, so streaming responses keep streaming.
+    """
+
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         hsts_max_age: int = 31536000,  # 1 year
         include_subdomains: bool = True,
         frame_options: str = "DENY",
@@ -19,112 +52,136 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         referrer_policy: str = "strict-origin-when-cross-origin",
         permissions_policy: str = "geolocation=(), microphone=(), camera=()"
     ):
-        super().__init__(app)
-        self.hsts_max_age = hsts_max_age
-        self.include_subdomains = include_subdomains
-        self.frame_options = frame_options
-        self.content_type_nosniff = content_type_nosniff
-        self.xss_protection = xss_protection
-        self.referrer_policy = referrer_policy
-        self.permissions_policy = permissions_policy
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        """Add security headers to the response"""
-        
-        response = await call_next(request)
-        
-        # HTTP Strict Transport Security (HSTS)
-        if request.url.scheme == "https":
-            hsts_value = f"max-age={self.hsts_max_age}"
-            if self.include_subdomains:
-                hsts_value += "; includeSubDomains"
-            response.headers["Strict-Transport-Security"] = hsts_value
-        
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = self.frame_options
-        
-        # Prevent MIME sniffing
-        if self.content_type_nosniff:
-            response.headers["X-Content-Type-Options"] = "nosniff"
-        
-        # XSS Protection
-        if self.xss_protection:
-            response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Referrer Policy
-        response.headers["Referrer-Policy"] = self.referrer_policy
-        
-        # Permissions Policy (formerly Feature Policy)
-        response.headers["Permissions-Policy"] = self.permissions_policy
-        
-        # Content Security Policy (basic)
-        csp_directives = [
-            "default-src 'self'",
-            "script-src 'self' 'unsafe-inline'",
-            "style-src 'self' 'unsafe-inline'",
-            "img-src 'self' data: https:",
-            "font-src 'self'",
-            "connect-src 'self'",
-            "frame-ancestors 'none'",
-            "base-uri 'self'",
-            "form-action 'self'"
+        self.app = app
+
+        headers = [
+            ("X-Frame-Options", frame_options),  # Prevent clickjacking
+            ("Referrer-Policy", referrer_policy),
+            ("Permissions-Policy", permissions_policy),  # Formerly Feature Policy
+            ("Content-Security-Policy", CONTENT_SECURITY_POLICY),
+            ("X-Security-Headers", "enabled"),
         ]
-        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
-        
-        # Remove server information
-        response.headers.pop("Server", None)
-        
-        # Add custom security header
-        response.headers["X-Security-Headers"] = "enabled"
-        
-        logger.debug(
-            "Security headers applied",
-            path=request.url.path,
-            method=request.method,
-            status_code=response.status_code
-        )
-        
-        return response
-
-class RequestSizeMiddleware(BaseHTTPMiddleware):
-    """Middleware to limit request body size"""
-    
-    def __init__(self, app, max_size: int = 16 * 1024 * 1024):  # 16MB default
-        super().__init__(app)
+        if content_type_nosniff:
+            headers.append(("X-Content-Type-Options", "nosniff"))
+        if xss_protection:
+            headers.append(("X-XSS-Protection", "1; mode=block"))
+        self.headers = _encode(headers)
+
+        # HTTP Strict Transport Security (HSTS), only sent over https
+        hsts_value = f"max-age={hsts_max_age}"
+        if include_subdomains:
+            hsts_value += "; includeSubDomains"
+        self.https_headers = self.headers + _encode([("Strict-Transport-Security", hsts_value)])
+
+        # Replaced if the app set them, plus the server banner
+        self.dropped = frozenset(name for name, _ in self.https_headers) | {b"server"}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = self.https_headers if scope.get("scheme") == "https" else self.headers
+        dropped = self.dropped
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    header for header in message.get("headers", ()) if header[0] not in dropped
+                ] + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+class RequestSizeMiddleware:
+    """
+    Middleware to limit request body size
+
+    The body is counted as it streams in through ``receive``, so chunked
+    uploads without a ``Content-Length`` are held to the limit too and are
+    cut off at the first chunk past it: the app never buffers more than
+    the limit plus one chunk. ``route_limits`` maps path prefixes to their
+    own limit (longest prefix wins), e.g. a small one for webhooks.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_size: int = 16 * 1024 * 1024,  # 16MB default
+        route_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.app = app
         self.max_size = max_size
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        self.route_limits = sorted((route_limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def limit_for(self, path: str) -> int:
+        for prefix, limit in self.route_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """Check request size and reject if too large"""
-        
-        # Get content length from headers
-        content_length = request.headers.get("content-length")
-        
-        if content_length:
-            content_length = int(content_length)
-            if content_length > self.max_size:
-                logger.warning(
-                    "Request too large",
-                    content_length=content_length,
-                    max_size=self.max_size,
-                    client_ip=request.client.host if request.client else "unknown",
-                    path=request.url.path
-                )
-                
-                return Response(
-                    content='{"detail": "Request entity too large"}',
-                    status_code=413,
-                    headers={"Content-Type": "application/json"}
-                )
-        
-        response = await call_next(request)
-        return response
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope["path"])
+        content_length = get_header(scope, b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            self._log_rejection(scope, limit, content_length=int(content_length))
+            await _too_large(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def counted_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    self._log_rejection(scope, limit, received=received)
+                    # Rendered as 413 by the app's HTTPException handler
+                    raise HTTPException(status_code=413, detail="Request entity too large")
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, counted_receive, tracked_send)
+        except HTTPException as exc:
+            # Raised outside the app's exception handling
+            if exc.status_code != 413 or response_started:
+                raise
+            await _too_large(scope, receive, send)
+
+    def _log_rejection(self, scope: Scope, limit: int, **size) -> None:
+        client = scope.get("client")
+        logger.warning(
+            "Request too large",
+            **size,
+            max_size=limit,
+            client_ip=client[0] if client else "unknown",
+            path=scope["path"]
+        )
+
+
+async def _too_large(scope: Scope, receive: Receive, send: Send) -> None:
+    response = JSONResponse({"detail": "Request entity too large"}, status_code=413)
+    await response(scope, receive, send)
 
 def create_security_middleware():
     """Factory function to create security middleware with default settings"""
     return SecurityHeadersMiddleware
 
-def create_request_size_middleware(max_size: int = 16 * 1024 * 1024):
+def create_request_size_middleware(max_size: int = 16 * 1024 * 1024, route_limits: Optional[Dict[str, int]] = None):
     """Factory function to create request size middleware"""
     def middleware_factory(app):
-        return RequestSizeMiddleware(app, max_size=max_size)
-    return middleware_factory
\ No newline at end of file
+        return RequestSizeMiddleware(app, max_size=max_size, route_limits=route_limits)
+    return middleware_factory
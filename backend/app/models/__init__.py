@@ -2,7 +2,13 @@
 from .user import User
 from .customer import Customer
 from .whop_user import WhopCompany, WhopUser
-from .whop_customer import WhopCustomer, RecoveryEvent, RecoveryStatus
+from .whop_customer import WhopCustomer, RecoveryEvent, RecoveryEventRollup, RecoveryEventCustomerRollup, RecoveryStatus
+from .member_sketch import MemberSketch
+from .dunning import DunningJob, DunningJobStatus
+from .recovery_timing import RecoveryTiming
+from .fee_batch import FeeBatchRun, FeeCharge, FeeChargeStatus
+from .fee_ledger import FeeLedgerEntry, FeeLedgerEntryType, FeeBalanceSnapshot
+from .outbox import OutboxMessage, OutboxStatus
 
 __all__ = [
     "User",
@@ -11,5 +17,19 @@ __all__ = [
     "WhopUser",
     "WhopCustomer",
     "RecoveryEvent",
-    "RecoveryStatus"
+    "RecoveryEventRollup",
+    "RecoveryEventCustomerRollup",
+    "RecoveryStatus",
+    "MemberSketch",
+    "DunningJob",
+    "DunningJobStatus",
+    "RecoveryTiming",
+    "FeeBatchRun",
+    "FeeCharge",
+    "FeeChargeStatus",
+    "FeeLedgerEntry",
+    "FeeLedgerEntryType",
+    "FeeBalanceSnapshot",
+    "OutboxMessage",
+    "OutboxStatus"
 ]
@@ -0,0 +1,53 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index, JSON, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class DunningJobStatus(enum.Enum):
+    PENDING = "pending"
+    CLAIMED = "claimed"  # Leased by a worker
+    SENT = "sent"
+    CANCELLED = "cancelled"
+
+
+class DunningJob(Base):
+    """
+    A single scheduled dunning step for a failed invoice
+    """
+    __tablename__ = "dunning_jobs"
+    __table_args__ = (
+        UniqueConstraint("customer_id", "stripe_invoice_id", "attempt", name="uq_dunning_jobs_step"),
+        # Due-time index the scheduler pages through
+        Index("ix_dunning_jobs_status_due_at", "status", "due_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, index=True)
+    customer_id = Column(Integer, ForeignKey("whop_customers.id"), nullable=False, index=True)
+    stripe_invoice_id = Column(String, nullable=True)  # Invoice that opened the sequence
+    failed_at = Column(DateTime(timezone=True), nullable=True)
+    # Outstanding invoices coalesced into this sequence: [{"id", "amount", "currency"}]
+    invoices = Column(JSON, nullable=True)
+    
+    # Step info
+    attempt = Column(Integer, nullable=False)  # 1-based position in the schedule
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    status = Column(Enum(DunningJobStatus), default=DunningJobStatus.PENDING, nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Worker lease; an expired lease makes the step claimable again
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Relationships
+    company = relationship("WhopCompany")
+    customer = relationship("WhopCustomer")
+    
+    def __repr__(self):
+        return f"<DunningJob(customer_id={self.customer_id}, attempt={self.attempt}, due_at='{self.due_at}')>"
@@ -0,0 +1,78 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Enum, Text, JSON, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class FeeChargeStatus(enum.Enum):
+    PENDING = "pending"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class FeeBatchRun(Base):
+    """
+    One nightly fee batch run; ``period`` (e.g. "2024-01-31") is unique so a
+    restarted run picks up its own checkpoint instead of starting over
+    """
+    __tablename__ = "fee_batch_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    period = Column(String, nullable=False, unique=True, index=True)
+    status = Column(String, default="running", nullable=False)  # running, completed
+    
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    summary = Column(JSON, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    charges = relationship("FeeCharge", back_populates="run")
+    
+    def __repr__(self):
+        return f"<FeeBatchRun(period='{self.period}', status='{self.status}')>"
+
+
+class FeeCharge(Base):
+    """
+    A company's fee charge within a batch run
+
+    The amount is frozen when the run is planned and the idempotency key is
+    derived from the company and period, so retrying the row after a crash
+    can never charge twice. A charge requested from ``/billing/process``
+    has no run; its period is ``manual-<fees paid>-<fees owed>``.
+    """
+    __tablename__ = "fee_charges"
+    __table_args__ = (
+        UniqueConstraint("company_id", "period", name="uq_fee_charges_company_period"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("fee_batch_runs.id"), nullable=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, index=True)
+    period = Column(String, nullable=False)
+    
+    amount = Column(Integer, nullable=False)  # In cents
+    idempotency_key = Column(String, nullable=False, unique=True)
+    status = Column(Enum(FeeChargeStatus), default=FeeChargeStatus.PENDING, nullable=False)
+    
+    # Outcome
+    whop_charge_id = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    duration_ms = Column(Float, nullable=True)
+    charged_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    # Relationships
+    run = relationship("FeeBatchRun", back_populates="charges")
+    company = relationship("WhopCompany")
+    
+    def __repr__(self):
+        return f"<FeeCharge(company_id={self.company_id}, period='{self.period}', amount={self.amount})>"
@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index, text
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class FeeLedgerEntryType(enum.Enum):
+    RECOVERY = "recovery"  # Payment recovered; fee accrues
+    CHARGE = "charge"  # Accrued fees charged through Whop
+    ADJUSTMENT = "adjustment"  # Correction written by the reconciliation job
+
+
+class FeeLedgerEntry(Base):
+    """
+    Append-only record of a change to a company's recovery and fee totals
+
+    Rows are only ever inserted, so concurrent webhooks never contend on the
+    company row. Amounts are signed deltas in cents.
+    """
+    __tablename__ = "fee_ledger"
+    __table_args__ = (
+        # Tail reads: entries after a company's snapshot
+        Index("ix_fee_ledger_company_id_id", "company_id", "id"),
+        # A charge (keyed by its idempotency key) is recorded at most once
+        Index(
+            "uq_fee_ledger_charge_reference", "reference", unique=True,
+            postgresql_where=text("entry_type = 'CHARGE'"),
+            sqlite_where=text("entry_type = 'CHARGE'"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False)
+    entry_type = Column(Enum(FeeLedgerEntryType), nullable=False)
+    reference = Column(String, nullable=True)  # Stripe event id, fee charge key, ...
+    
+    recovered_delta = Column(Integer, default=0, nullable=False)
+    fees_owed_delta = Column(Integer, default=0, nullable=False)
+    fees_paid_delta = Column(Integer, default=0, nullable=False)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    
+    def __repr__(self):
+        return f"<FeeLedgerEntry(company_id={self.company_id}, type='{self.entry_type}', owed={self.fees_owed_delta})>"
+
+
+class FeeBalanceSnapshot(Base):
+    """
+    Company totals folded from the ledger up to ``last_entry_id``
+
+    Written only by the compaction job; current balances are the snapshot
+    plus ledger entries after it.
+    """
+    __tablename__ = "fee_balance_snapshots"
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, unique=True, index=True)
+    last_entry_id = Column(Integer, nullable=False)
+    
+    # Totals in cents
+    total_recovered = Column(Integer, default=0, nullable=False)
+    total_fees_owed = Column(Integer, default=0, nullable=False)
+    total_fees_paid = Column(Integer, default=0, nullable=False)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<FeeBalanceSnapshot(company_id={self.company_id}, last_entry_id={self.last_entry_id})>"
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, LargeBinary, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class MemberSketch(Base):
+    """
+    One shard of a daily HyperLogLog sketch of distinct members for a company and metric
+
+    Members are spread over a few rows per day so concurrent webhooks don't
+    all lock the same row; reads merge every shard of the range.
+    """
+    __tablename__ = "member_sketches"
+    __table_args__ = (
+        UniqueConstraint("company_id", "metric", "day", "shard", name="uq_member_sketches_day_shard"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, index=True)
+    
+    metric = Column(String, nullable=False)  # 'failed', 'recovered'
+    day = Column(Date, nullable=False)
+    shard = Column(Integer, nullable=False, default=0, server_default="0")
+    registers = Column(LargeBinary, nullable=False)  # Serialized HyperLogLog
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<MemberSketch(company_id={self.company_id}, metric='{self.metric}', day='{self.day}', shard={self.shard})>"
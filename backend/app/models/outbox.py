@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index, Text, JSON
+from sqlalchemy.sql import func
+from app.core.database import Base
+import enum
+
+
+class OutboxStatus(enum.Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    DEAD = "dead"  # Gave up after OUTBOX_MAX_ATTEMPTS
+
+
+class OutboxMessage(Base):
+    """
+    An outbound side effect written in the same transaction as the change
+    that caused it, delivered later by app/workers/outbox_dispatcher.py
+    """
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        # Due-time index the dispatcher claims from
+        Index("ix_outbox_messages_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # e.g. "fee_charge"
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=True, index=True)
+    payload = Column(JSON, nullable=False)
+    idempotency_key = Column(String, nullable=False, unique=True)
+    
+    # Delivery state; a claim pushes next_attempt_at out as the lease
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(Text, nullable=True)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<OutboxMessage(kind='{self.kind}', key='{self.idempotency_key}', status='{self.status}')>"
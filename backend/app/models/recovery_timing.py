@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class RecoveryTiming(Base):
+    """
+    Per-company lookup table for timing dunning steps
+
+    ``slot_delays`` holds 168 bytes, one per UTC hour of the week (Monday
+    00:00 first): how many hours to push a step due in that hour so it lands
+    in an hour when the company's customers historically pay.
+    """
+    __tablename__ = "recovery_timings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, unique=True, index=True)
+    
+    slot_delays = Column(LargeBinary, nullable=False)
+    sample_size = Column(Integer, nullable=False)  # Recoveries the histogram was built from
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<RecoveryTiming(company_id={self.company_id}, sample_size={self.sample_size})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, ForeignKey, Text, Enum, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -88,4 +88,54 @@ class RecoveryEvent(Base):
     customer = relationship("WhopCustomer", back_populates="recovery_events")
     
     def __repr__(self):
-        return f"<RecoveryEvent(event_type='{self.event_type}', amount={self.amount})>"
\ No newline at end of file
+        return f"<RecoveryEvent(event_type='{self.event_type}', amount={self.amount})>"
+
+
+class RecoveryEventRollup(Base):
+    """
+    Monthly per-company totals for recovery events past the retention window
+    """
+    __tablename__ = "recovery_event_rollups"
+    __table_args__ = (
+        UniqueConstraint("company_id", "month", "event_type", name="uq_recovery_event_rollups_month"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, index=True)
+    
+    month = Column(DateTime(timezone=True), nullable=False)  # First instant of the month (UTC)
+    event_type = Column(String, nullable=False)
+    event_count = Column(Integer, nullable=False, default=0)
+    total_amount = Column(BigInteger, nullable=False, default=0)  # In cents
+    total_fees = Column(BigInteger, nullable=True)  # Sum of per-event fees; NULL on older rollups
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<RecoveryEventRollup(month='{self.month}', event_type='{self.event_type}', count={self.event_count})>"
+
+
+class RecoveryEventCustomerRollup(Base):
+    """
+    Monthly per-customer failed/recovered amounts for months past the
+    retention window, so customer totals stay verifiable
+    """
+    __tablename__ = "recovery_event_customer_rollups"
+    __table_args__ = (
+        UniqueConstraint("customer_id", "month", "event_type", name="uq_recovery_event_customer_rollups_month"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("whop_companies.id"), nullable=False, index=True)
+    customer_id = Column(Integer, ForeignKey("whop_customers.id"), nullable=False, index=True)
+    
+    month = Column(DateTime(timezone=True), nullable=False)  # First instant of the month (UTC)
+    event_type = Column(String, nullable=False)  # 'payment_failed' or 'payment_recovered'
+    total_amount = Column(BigInteger, nullable=False, default=0)  # In cents
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<RecoveryEventCustomerRollup(customer_id={self.customer_id}, month='{self.month}', event_type='{self.event_type}')>"
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, Enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
+from app.models.user import PlanType
 
 
 class WhopCompany(Base):
@@ -23,6 +24,7 @@ class WhopCompany(Base):
     
     # ChargeChase-specific settings
     is_active = Column(Boolean, default=True)
+    plan = Column(Enum(PlanType), default=PlanType.STARTER)  # Picks the API rate limit tier
     
     # Connected Stripe account (their store)
     connected_stripe_account_id = Column(String, nullable=True)
@@ -41,12 +43,18 @@ class WhopCompany(Base):
     dunning_enabled = Column(Boolean, default=True)
     email_enabled = Column(Boolean, default=True)
     retry_schedule = Column(String, default="1,3,7")  # Days after failure
+    retry_schedule_hours = Column(JSON, nullable=True)  # Validated form: {"offsets_hours": [24, 72, 168]}
+    settings_version = Column(Integer, default=1, nullable=False)  # Bumped on every settings save
+    # Bumped with every change to settings, connection or stats data; the
+    # ETag of those endpoints, so clients revalidate without a full fetch
+    data_version = Column(Integer, default=1, nullable=False)
     
     # App installation info
     app_installed_at = Column(DateTime(timezone=True), server_default=func.now())
     last_webhook_at = Column(DateTime(timezone=True), nullable=True)
     
-    # Revenue tracking (for transaction fees)
+    # Revenue tracking (for transaction fees). Frozen opening balances: changes
+    # go to fee_ledger, read them through app/services/fee_ledger.py
     total_recovered = Column(Integer, default=0)  # In cents
     total_fees_owed = Column(Integer, default=0)  # In cents (2.9% of recovered)
     total_fees_paid = Column(Integer, default=0)  # In cents
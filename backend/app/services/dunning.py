@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import DunningJob, DunningJobStatus, WhopCompany, WhopCustomer
+from app.services.recovery_timing import recovery_timing_service, snap
+from app.services.retry_schedule import retry_schedule_service
+
+OPEN_STATUSES = (DunningJobStatus.PENDING, DunningJobStatus.CLAIMED)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """Compare DB timestamps (aware on Postgres, naive on SQLite) as naive UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def step_invoices(job: DunningJob) -> List[Dict[str, Any]]:
+    """Outstanding invoices a step covers (older rows only know their own invoice)"""
+    if job.invoices is not None:
+        return list(job.invoices)
+    return [{"id": job.stripe_invoice_id, "amount": 0, "currency": "usd"}]
+
+
+def _snap(due_at: datetime, delays: Optional[bytes]) -> datetime:
+    return snap(due_at, delays) if delays else due_at
+
+
+class DunningService:
+    """Creates and cancels persisted dunning steps for failed invoices"""
+
+    def schedule_sequence(
+        self,
+        db: Session,
+        company: WhopCompany,
+        customer: WhopCustomer,
+        stripe_invoice_id: Optional[str],
+        failed_at: Optional[datetime] = None,
+        amount: int = 0,
+        currency: str = "usd",
+    ) -> List[DunningJob]:
+        """
+        Persist every step of the company's schedule for a failed invoice
+
+        A failure within ``DUNNING_COALESCE_WINDOW_MINUTES`` of an open
+        sequence for the same customer is added to that sequence's pending
+        steps instead of starting a new one, so the customer gets one email
+        covering all of them. While the customer already has an open
+        sequence, a new one's steps wait at least the window, so a burst of
+        failures collapses; a first failure's immediate step is not held.
+        Concurrent calls for one customer are serialized on the customer row.
+        New steps are snapped to the company's best recovery hours when a
+        timing table exists (see ``recovery_timing``).
+        Invoices already tracked (e.g. from a retried Stripe webhook) are
+        skipped. Returns the steps created or extended. Does not commit.
+        """
+        if not company.dunning_enabled:
+            return []
+
+        failed_at = failed_at or datetime.utcnow()
+        invoice = {"id": stripe_invoice_id, "amount": amount, "currency": currency}
+        db.query(WhopCustomer.id).filter(WhopCustomer.id == customer.id).with_for_update().one()
+        open_steps = db.query(DunningJob).filter(
+            DunningJob.customer_id == customer.id,
+            DunningJob.status.in_(OPEN_STATUSES),
+        ).with_for_update().populate_existing().all()
+        if any(stripe_invoice_id in {inv["id"] for inv in step_invoices(job)} for job in open_steps):
+            return []
+
+        window = timedelta(minutes=settings.DUNNING_COALESCE_WINDOW_MINUTES)
+        recent = [
+            job for job in open_steps
+            if job.status == DunningJobStatus.PENDING
+            and job.failed_at is not None and _naive_utc(job.failed_at) >= failed_at - window
+        ]
+        if recent:
+            anchor = max(recent, key=lambda job: _naive_utc(job.failed_at)).stripe_invoice_id
+            sequence = [job for job in recent if job.stripe_invoice_id == anchor]
+            for job in sequence:
+                job.invoices = step_invoices(job) + [invoice]
+            return sequence
+
+        hold = window if open_steps else timedelta(0)
+        schedule = retry_schedule_service.schedule_for(company)
+        delays = recovery_timing_service.delays_for(db, company.id)
+        existing = {
+            attempt for (attempt,) in db.query(DunningJob.attempt).filter(
+                DunningJob.customer_id == customer.id,
+                DunningJob.stripe_invoice_id == stripe_invoice_id,
+            ).all()
+        }
+
+        jobs = [
+            DunningJob(
+                company_id=company.id,
+                customer_id=customer.id,
+                stripe_invoice_id=stripe_invoice_id,
+                attempt=attempt,
+                failed_at=failed_at,
+                due_at=_snap(max(schedule.due_at(failed_at, attempt), failed_at + hold), delays),
+                status=DunningJobStatus.PENDING,
+                invoices=[invoice],
+            )
+            for attempt in range(1, schedule.attempts + 1)
+            if attempt not in existing
+        ]
+        db.add_all(jobs)
+        return jobs
+
+    def cancel_sequence(
+        self,
+        db: Session,
+        customer_id: int,
+        stripe_invoice_id: Optional[str] = None,
+    ) -> int:
+        """
+        Cancel pending or leased steps for a customer (optionally one invoice)
+
+        A paid invoice is removed from coalesced sequences; a step is only
+        cancelled once none of its invoices are outstanding. Returns the
+        number of steps cancelled. Does not commit.
+        """
+        query = db.query(DunningJob).filter(
+            DunningJob.customer_id == customer_id,
+            DunningJob.status.in_(OPEN_STATUSES),
+        )
+        if stripe_invoice_id is None:
+            return query.update(
+                {DunningJob.status: DunningJobStatus.CANCELLED, DunningJob.completed_at: datetime.utcnow()},
+                synchronize_session=False,
+            )
+
+        cancelled = 0
+        for job in query.all():
+            invoices = step_invoices(job)
+            remaining = [inv for inv in invoices if inv["id"] != stripe_invoice_id]
+            if len(remaining) == len(invoices):
+                continue
+            if remaining:
+                job.invoices = remaining
+            else:
+                job.status = DunningJobStatus.CANCELLED
+                job.completed_at = datetime.utcnow()
+                cancelled += 1
+        return cancelled
+
+
+# Global service instance
+dunning_service = DunningService()
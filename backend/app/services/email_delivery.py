@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from email.utils import parseaddr
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class EmailMessage:
+    """One email in Resend's send format"""
+    from_email: str
+    to: List[str]
+    subject: str
+    html: str
+    text: Optional[str] = None
+    reply_to: Optional[str] = None
+    tags: Dict[str, str] = field(default_factory=dict)
+    headers: Dict[str, str] = field(default_factory=dict)
+    idempotency_key: Optional[str] = None  # Stable id of what this email is for, e.g. a job; not sent
+
+    @property
+    def sender_domain(self) -> str:
+        return parseaddr(self.from_email)[1].rpartition("@")[2].lower()
+
+    def to_payload(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "from": self.from_email,
+            "to": self.to,
+            "subject": self.subject,
+            "html": self.html,
+        }
+        if self.text:
+            payload["text"] = self.text
+        if self.reply_to:
+            payload["reply_to"] = self.reply_to
+        if self.headers:
+            payload["headers"] = self.headers
+        if self.tags:
+            payload["tags"] = [{"name": k, "value": v} for k, v in self.tags.items()]
+        return payload
+
+
+def batch_idempotency_key(batch: Sequence[EmailMessage]) -> str:
+    """
+    Idempotency key for one batch request, the same on every retry of it
+
+    Built from the payload, plus the messages' own keys when they all have
+    one, so a batch re-sent later for the same jobs is deduplicated too.
+    Resend answers 409 to a reused key with a different body, so content
+    re-rendered since (e.g. after a settings change) gets a key of its own.
+    """
+    source = json.dumps([message.to_payload() for message in batch], sort_keys=True)
+    keys = [message.idempotency_key for message in batch]
+    if all(keys):
+        source = "\n".join(keys + [source])
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class EmailDeliveryError(Exception):
+    """A batch Resend did not accept; ``retryable`` if a later attempt may succeed"""
+
+    def __init__(self, message: str, retryable: bool, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status_code = status_code
+
+
+@dataclass
+class DeliveryResult:
+    """Outcome per message, keyed by its index in the list passed to ``send``"""
+    sent: Dict[int, str] = field(default_factory=dict)  # index -> Resend email id
+    failed: Dict[int, EmailDeliveryError] = field(default_factory=dict)
+
+    @property
+    def retryable(self) -> List[int]:
+        return sorted(i for i, error in self.failed.items() if error.retryable)
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, up to ``capacity`` banked"""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await self.sleep((1 - self.tokens) / self.rate)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmailDeliveryService:
+    """
+    Sends email through Resend's batch endpoint
+
+    Messages are grouped by sender domain and chunked into batches of up to
+    ``batch_size``. At most ``max_concurrency`` batch requests are in flight,
+    each sender domain is limited to ``domain_rate`` requests per second,
+    and 429/5xx/network failures are retried with exponential backoff
+    (honouring ``Retry-After``). Any batch still failing is reported in the
+    result rather than raised, so callers can retry just those messages.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        domain_rate: Optional[float] = None,
+        domain_burst: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_base_seconds: Optional[float] = None,
+        retry_max_seconds: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        sleep: Callable[[float], Any] = asyncio.sleep,
+    ):
+        self.api_key = api_key if api_key is not None else settings.RESEND_API_KEY
+        self.base_url = base_url or settings.RESEND_API_BASE
+        self.batch_size = min(batch_size or settings.EMAIL_BATCH_SIZE, 100)
+        self.max_concurrency = max_concurrency or settings.EMAIL_MAX_CONCURRENCY
+        self.domain_rate = domain_rate or settings.EMAIL_DOMAIN_RATE_PER_SECOND
+        self.domain_burst = domain_burst or settings.EMAIL_DOMAIN_BURST
+        self.max_retries = max_retries if max_retries is not None else settings.EMAIL_MAX_RETRIES
+        self.retry_base_seconds = retry_base_seconds if retry_base_seconds is not None else settings.EMAIL_RETRY_BASE_SECONDS
+        self.retry_max_seconds = retry_max_seconds if retry_max_seconds is not None else settings.EMAIL_RETRY_MAX_SECONDS
+        self.transport = transport
+        self.sleep = sleep
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _bucket(self, domain: str) -> TokenBucket:
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = TokenBucket(self.domain_rate, self.domain_burst, sleep=self.sleep)
+        return bucket
+
+    def _batches(self, messages: Sequence[EmailMessage]) -> List[Tuple[str, List[int]]]:
+        by_domain: Dict[str, List[int]] = {}
+        for index, message in enumerate(messages):
+            by_domain.setdefault(message.sender_domain, []).append(index)
+        return [
+            (domain, indexes[start:start + self.batch_size])
+            for domain, indexes in by_domain.items()
+            for start in range(0, len(indexes), self.batch_size)
+        ]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    async def send(self, messages: Sequence[EmailMessage]) -> DeliveryResult:
+        result = DeliveryResult()
+        if not messages:
+            return result
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        async with httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            transport=self.transport,
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+        ) as client:
+
+            async def run(domain: str, indexes: List[int]) -> None:
+                async with semaphore:
+                    try:
+                        ids = await self._post_batch(client, domain, [messages[i] for i in indexes])
+                    except EmailDeliveryError as e:
+                        logger.warning(
+                            "Email batch failed",
+                            domain=domain,
+                            size=len(indexes),
+                            error=str(e),
+                            retryable=e.retryable,
+                        )
+                        result.failed.update((i, e) for i in indexes)
+                        return
+                    result.sent.update(zip(indexes, ids))
+
+            await asyncio.gather(*(run(domain, indexes) for domain, indexes in self._batches(messages)))
+
+        logger.info("Email batch send finished", sent=len(result.sent), failed=len(result.failed))
+        return result
+
+    async def _post_batch(self, client: httpx.AsyncClient, domain: str, batch: List[EmailMessage]) -> List[str]:
+        payload = [message.to_payload() for message in batch]
+        # Same key on every attempt, so a batch Resend accepted but whose
+        # response was lost is not sent twice
+        headers = {"Idempotency-Key": batch_idempotency_key(batch)}
+        bucket = self._bucket(domain)
+
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                response = await client.post("/emails/batch", json=payload, headers=headers)
+            except httpx.TransportError as e:
+                error = EmailDeliveryError(f"Resend request failed: {e}", retryable=True)
+                delay = None
+            else:
+                if response.status_code < 300:
+                    return [item["id"] for item in response.json()["data"]]
+                retryable = response.status_code in RETRYABLE_STATUS
+                error = EmailDeliveryError(
+                    f"Resend returned {response.status_code}: {response.text[:200]}",
+                    retryable=retryable,
+                    status_code=response.status_code,
+                )
+                if not retryable:
+                    raise error
+                delay = _retry_after(response)
+
+            if attempt >= self.max_retries:
+                raise error
+            await self.sleep(delay if delay is not None else self._backoff(attempt))
+            attempt += 1
+
+
+# Global service instance
+email_delivery_service = EmailDeliveryService()
@@ -0,0 +1,200 @@
+import re
+from dataclasses import dataclass
+from html import escape
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import WhopCompany
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+DUNNING_SUBJECT = "Action needed: your {{ company_name }} payment failed"
+
+DUNNING_HTML = """<!DOCTYPE html>
+<html>
+<body style="margin:0;padding:0;background:#f4f4f5;font-family:Helvetica,Arial,sans-serif;">
+  <table role="presentation" width="100%" cellpadding="0" cellspacing="0">
+    <tr><td align="center" style="padding:32px 16px;">
+      <table role="presentation" width="560" cellpadding="0" cellspacing="0" style="background:#ffffff;border-radius:8px;">
+        <tr><td style="background:{{ brand_color }};height:6px;border-radius:8px 8px 0 0;"></td></tr>
+        <tr><td style="padding:32px;">
+          <h1 style="margin:0 0 16px;font-size:20px;color:#111827;">{{ company_name }}</h1>
+          <p style="color:#374151;">{{ greeting }}</p>
+          <p style="color:#374151;">{{ custom_message }}</p>
+          {{ invoices_html }}
+          <p style="color:#374151;">Please update your payment method to keep your {{ company_name }} membership active.</p>
+          <p style="color:#6b7280;font-size:12px;">This reminder was sent to {{ customer_email }} on behalf of {{ sender_name }}.
+            <a href="{{ unsubscribe_url }}" style="color:#6b7280;">Unsubscribe</a></p>
+        </td></tr>
+      </table>
+    </td></tr>
+  </table>
+</body>
+</html>
+"""
+
+DUNNING_TEXT = """{{ greeting }}
+
+{{ custom_message }}
+{{ invoices_text }}
+Please update your payment method to keep your {{ company_name }} membership active.
+
+This reminder was sent to {{ customer_email }} on behalf of {{ sender_name }}.
+Unsubscribe: {{ unsubscribe_url }}
+"""
+
+DEFAULT_CUSTOM_MESSAGE = "We couldn't process your latest payment."
+
+DEFAULT_BRAND_COLOR = "#3B82F6"
+
+# brand_color goes into a style attribute, where escaping alone doesn't help
+_HEX_COLOR = re.compile(r"^#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+
+
+def is_hex_color(value: str) -> bool:
+    return bool(_HEX_COLOR.match(value))
+
+
+class CompiledTemplate:
+    """
+    A template with company fields already substituted
+
+    Stored as alternating literal chunks and recipient field names, so
+    rendering is a single join with no parsing.
+    """
+
+    __slots__ = ("literals", "fields", "escape_html")
+
+    def __init__(self, literals: Tuple[str, ...], fields: Tuple[str, ...], escape_html: bool):
+        self.literals = literals
+        self.fields = fields
+        self.escape_html = escape_html
+
+    def render(self, values: Mapping[str, str]) -> str:
+        literals = self.literals
+        parts = [literals[0]]
+        for field_name, literal in zip(self.fields, literals[1:]):
+            value = values[field_name]
+            # ``*_html`` fields carry pre-rendered markup
+            if self.escape_html and not field_name.endswith("_html"):
+                value = escape(value)
+            parts.append(value)
+            parts.append(literal)
+        return "".join(parts)
+
+
+def compile_template(source: str, fixed: Mapping[str, str], escape_html: bool = True) -> CompiledTemplate:
+    """Substitute ``fixed`` fields now and leave the rest for ``render``"""
+    literals: List[str] = [""]
+    fields: List[str] = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(source):
+        literals[-1] += source[position:match.start()]
+        name = match.group(1)
+        if name in fixed:
+            literals[-1] += escape(fixed[name]) if escape_html else fixed[name]
+        else:
+            fields.append(name)
+            literals.append("")
+        position = match.end()
+    literals[-1] += source[position:]
+    return CompiledTemplate(tuple(literals), tuple(fields), escape_html)
+
+
+@dataclass(frozen=True)
+class CompiledDunningEmail:
+    """One company's dunning email, ready for per-recipient rendering"""
+    settings_version: int
+    from_email: str
+    subject: CompiledTemplate
+    html: CompiledTemplate
+    text: CompiledTemplate
+
+    def render(self, values: Mapping[str, str]) -> Tuple[str, str, str]:
+        """Subject, HTML and text bodies for one recipient"""
+        return self.subject.render(values), self.html.render(values), self.text.render(values)
+
+
+def sender_for(company: WhopCompany) -> str:
+    """Company's branded sender if configured, otherwise the app default"""
+    if company.sender_email:
+        return f"{company.sender_name or company.name} <{company.sender_email}>"
+    return settings.FROM_EMAIL
+
+
+def company_fields(company: WhopCompany) -> Dict[str, str]:
+    return {
+        "company_name": company.name,
+        # Values saved before brand_color was validated fall back to the default
+        "brand_color": company.brand_color if is_hex_color(company.brand_color or "") else DEFAULT_BRAND_COLOR,
+        "custom_message": company.custom_message or DEFAULT_CUSTOM_MESSAGE,
+        "sender_name": company.sender_name or company.name,
+    }
+
+
+def format_amount(amount: int, currency: str) -> str:
+    return f"{(amount or 0) / 100:,.2f} {(currency or 'usd').upper()}"
+
+
+def recipient_fields(
+    name: Optional[str],
+    email: str,
+    invoices: Sequence[Mapping[str, Any]] = (),
+    unsubscribe_url: str = "",
+) -> Dict[str, str]:
+    """Per-recipient values, including the list of outstanding invoices"""
+    lines = [
+        (f"Invoice {invoice['id']}" if invoice.get("id") else "Invoice", format_amount(invoice.get("amount"), invoice.get("currency")))
+        for invoice in invoices
+    ]
+    invoices_html = ""
+    invoices_text = ""
+    if lines:
+        items = "".join(f"<li>{escape(label)}: {escape(amount)}</li>" for label, amount in lines)
+        invoices_html = f'<ul style="color:#374151;">{items}</ul>'
+        invoices_text = "\n" + "".join(f"- {label}: {amount}\n" for label, amount in lines)
+    return {
+        "greeting": f"Hi {name}," if name else "Hi,",
+        "customer_email": email,
+        "invoices_html": invoices_html,
+        "invoices_text": invoices_text,
+        "unsubscribe_url": unsubscribe_url,
+    }
+
+
+class EmailTemplateService:
+    """
+    Compiles each company's dunning email once and caches it
+
+    Entries carry the company's ``settings_version``; a bumped version
+    (settings saved in any process) forces a recompile, and the process
+    that saved the settings also drops its entry straight away.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.cache = TTLCache(ttl_seconds or settings.EMAIL_TEMPLATE_CACHE_TTL_SECONDS)
+
+    def compile(self, company: WhopCompany) -> CompiledDunningEmail:
+        fixed = company_fields(company)
+        return CompiledDunningEmail(
+            settings_version=company.settings_version or 0,
+            from_email=sender_for(company),
+            subject=compile_template(DUNNING_SUBJECT, fixed, escape_html=False),
+            html=compile_template(DUNNING_HTML, fixed),
+            text=compile_template(DUNNING_TEXT, fixed, escape_html=False),
+        )
+
+    def dunning_email(self, company: WhopCompany) -> CompiledDunningEmail:
+        compiled = self.cache.get(company.id)
+        if compiled is None or compiled.settings_version != (company.settings_version or 0):
+            compiled = self.compile(company)
+            self.cache.set(company.id, compiled)
+        return compiled
+
+    def invalidate(self, company_id: int) -> None:
+        self.cache.invalidate(company_id)
+
+
+# Global service instance
+email_template_service = EmailTemplateService()
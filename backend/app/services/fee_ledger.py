@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import FeeBalanceSnapshot, FeeLedgerEntry, FeeLedgerEntryType, WhopCompany
+
+
+@dataclass(frozen=True)
+class FeeBalance:
+    """A company's recovery and fee totals, in cents"""
+    total_recovered: int = 0
+    total_fees_owed: int = 0
+    total_fees_paid: int = 0
+
+
+def ledger_tail(up_to_id: Optional[int] = None):
+    """Per-company sums of the entries after each company's snapshot"""
+    query = (
+        select(
+            FeeLedgerEntry.company_id.label("company_id"),
+            func.sum(FeeLedgerEntry.recovered_delta).label("recovered"),
+            func.sum(FeeLedgerEntry.fees_owed_delta).label("owed"),
+            func.sum(FeeLedgerEntry.fees_paid_delta).label("paid"),
+            func.max(FeeLedgerEntry.id).label("last_entry_id"),
+        )
+        .outerjoin(FeeBalanceSnapshot, FeeBalanceSnapshot.company_id == FeeLedgerEntry.company_id)
+        .where(FeeLedgerEntry.id > func.coalesce(FeeBalanceSnapshot.last_entry_id, 0))
+        .group_by(FeeLedgerEntry.company_id)
+    )
+    if up_to_id is not None:
+        query = query.where(FeeLedgerEntry.id <= up_to_id)
+    return query.subquery()
+
+
+def balances_select(company_ids: Optional[Iterable[int]] = None):
+    """
+    Current balances as ``(company_id, total_recovered, total_fees_owed,
+    total_fees_paid)`` rows: snapshot plus ledger tail
+
+    Companies without a snapshot start from the legacy counters on
+    ``whop_companies``. Works with sync and async sessions.
+    """
+    tail = ledger_tail()
+
+    def total(snapshot_column, legacy_column, delta):
+        base = func.coalesce(snapshot_column, legacy_column, 0)
+        return base + func.coalesce(delta, 0)
+
+    query = (
+        select(
+            WhopCompany.id.label("company_id"),
+            total(FeeBalanceSnapshot.total_recovered, WhopCompany.total_recovered, tail.c.recovered).label("total_recovered"),
+            total(FeeBalanceSnapshot.total_fees_owed, WhopCompany.total_fees_owed, tail.c.owed).label("total_fees_owed"),
+            total(FeeBalanceSnapshot.total_fees_paid, WhopCompany.total_fees_paid, tail.c.paid).label("total_fees_paid"),
+        )
+        .outerjoin(FeeBalanceSnapshot, FeeBalanceSnapshot.company_id == WhopCompany.id)
+        .outerjoin(tail, tail.c.company_id == WhopCompany.id)
+    )
+    if company_ids is not None:
+        query = query.where(WhopCompany.id.in_(list(company_ids)))
+    return query
+
+
+class FeeLedgerService:
+    """Appends fee ledger entries and reads balances back"""
+
+    def recovery_entry(self, company_id: int, amount: int, fee: int, reference: Optional[str] = None) -> FeeLedgerEntry:
+        """A recovered payment and the fee it accrues"""
+        return FeeLedgerEntry(
+            company_id=company_id,
+            entry_type=FeeLedgerEntryType.RECOVERY,
+            reference=reference,
+            recovered_delta=amount,
+            fees_owed_delta=fee,
+            fees_paid_delta=0,
+        )
+
+    def charge_entry(self, company_id: int, fee_amount: int, reference: Optional[str] = None) -> FeeLedgerEntry:
+        """Fees moved from owed to paid by a Whop charge"""
+        return FeeLedgerEntry(
+            company_id=company_id,
+            entry_type=FeeLedgerEntryType.CHARGE,
+            reference=reference,
+            recovered_delta=0,
+            fees_owed_delta=-fee_amount,
+            fees_paid_delta=fee_amount,
+        )
+
+    def record_recovery(
+        self, db: Session, company_id: int, amount: int, fee: int, reference: Optional[str] = None
+    ) -> FeeLedgerEntry:
+        """Append a recovery entry; returns it. Does not commit."""
+        entry = self.recovery_entry(company_id, amount, fee, reference)
+        db.add(entry)
+        return entry
+
+    def record_charge(
+        self, db: Session, company_id: int, fee_amount: int, reference: Optional[str] = None
+    ) -> FeeLedgerEntry:
+        """Append a charge entry; returns it. Does not commit."""
+        entry = self.charge_entry(company_id, fee_amount, reference)
+        db.add(entry)
+        return entry
+
+    def balance(self, db: Session, company_id: int) -> FeeBalance:
+        row = db.execute(balances_select([company_id])).first()
+        if row is None:
+            return FeeBalance()
+        return FeeBalance(row.total_recovered, row.total_fees_owed, row.total_fees_paid)
+
+
+# Global service instance
+fee_ledger_service = FeeLedgerService()
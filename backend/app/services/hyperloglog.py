@@ -0,0 +1,112 @@
+from hashlib import blake2b
+from typing import Iterable, Optional
+import math
+
+import numpy as np
+
+DEFAULT_PRECISION = 12  # 4096 registers, ~1.6% standard error
+
+# Serialized sketches start with a format byte and the precision
+_DENSE = 0
+_SPARSE = 1
+
+
+def _hash64(value: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Mergeable distinct-count sketch
+
+    Sketches built on different days (or processes) merge by taking the
+    register-wise maximum, so a range is answered by merging its daily
+    sketches. Standard error is ``1.04 / sqrt(2 ** precision)``.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[np.ndarray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("HyperLogLog precision must be between 4 and 16")
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        elif registers.shape != (self.m,):
+            raise ValueError("Register count does not match precision")
+        self.registers = registers
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value: str) -> bool:
+        """Add a value, returning True if any register changed"""
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        remainder = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Fold another sketch into this one in place"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int = DEFAULT_PRECISION) -> "HyperLogLog":
+        """Merge many sketches at once"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls(precision)
+        stacked = np.stack([sketch.registers for sketch in sketches])
+        return cls(sketches[0].precision, stacked.max(axis=0))
+
+    def count(self) -> int:
+        """Estimated number of distinct values added"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the sketch
+
+        Small sketches use a sparse (index, rank) encoding, which keeps a
+        quiet company's daily sketch to a few bytes instead of ``2 ** p``.
+        """
+        nonzero = np.flatnonzero(self.registers)
+        if nonzero.size * 3 < self.m:
+            body = np.empty(nonzero.size, dtype=[("index", ">u2"), ("rank", "u1")])
+            body["index"] = nonzero
+            body["rank"] = self.registers[nonzero]
+            return bytes([_SPARSE, self.precision]) + body.tobytes()
+        return bytes([_DENSE, self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        fmt, precision = data[0], data[1]
+        sketch = cls(precision)
+        if fmt == _DENSE:
+            sketch.registers = np.frombuffer(data, dtype=np.uint8, offset=2).copy()
+        elif fmt == _SPARSE:
+            body = np.frombuffer(data, dtype=[("index", ">u2"), ("rank", "u1")], offset=2)
+            sketch.registers[body["index"]] = body["rank"]
+        else:
+            raise ValueError(f"Unknown HyperLogLog format: {fmt}")
+        return sketch
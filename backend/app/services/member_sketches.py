@@ -0,0 +1,142 @@
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import MemberSketch
+from app.services.hyperloglog import HyperLogLog
+
+METRICS = ("failed", "recovered")
+GRANULARITIES = ("day", "week", "month")
+
+
+def period_start(day: date, granularity: str) -> date:
+    """Bucket a day into its day, ISO week (Monday) or month"""
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+class MemberSketchService:
+    """Maintains sharded daily distinct-member sketches and answers range queries"""
+
+    def __init__(self, shards: Optional[int] = None):
+        self.shards = shards or settings.MEMBER_SKETCH_SHARDS
+
+    def shard_for(self, member_key: str) -> int:
+        """A member always lands in the same shard, so repeats stay no-ops"""
+        return zlib.crc32(member_key.encode("utf-8")) % self.shards
+
+    def record(
+        self,
+        db: Session,
+        company_id: int,
+        metric: str,
+        member_key: str,
+        day: Optional[date] = None,
+    ) -> None:
+        """
+        Add a member to the company's sketch for ``day``
+
+        Does not commit; the caller's transaction covers the update. Only the
+        member's shard of the day is locked, and only when the member changes
+        its registers; a lost race to create the shard turns into an update.
+        """
+        day = day or datetime.utcnow().date()
+        shard = self.shard_for(member_key)
+        seen = self._row(db, company_id, metric, day, shard)
+        if seen is not None and not HyperLogLog.from_bytes(seen.registers).add(member_key):
+            # Registers only grow, so a member the shard already covers needs no lock
+            return
+        row = self._locked_row(db, company_id, metric, day, shard)
+
+        if row is None:
+            sketch = HyperLogLog()
+            sketch.add(member_key)
+            try:
+                # In a savepoint: if another transaction creates the day's row
+                # first, only this insert is rolled back, not the caller's work
+                with db.begin_nested():
+                    db.add(MemberSketch(
+                        company_id=company_id,
+                        metric=metric,
+                        day=day,
+                        shard=shard,
+                        registers=sketch.to_bytes(),
+                    ))
+                return
+            except IntegrityError:
+                row = self._locked_row(db, company_id, metric, day, shard)
+
+        sketch = HyperLogLog.from_bytes(row.registers)
+        if sketch.add(member_key):
+            row.registers = sketch.to_bytes()
+
+    def _shard_query(self, db: Session, company_id: int, metric: str, day: date, shard: int):
+        return db.query(MemberSketch).filter(
+            MemberSketch.company_id == company_id,
+            MemberSketch.metric == metric,
+            MemberSketch.day == day,
+            MemberSketch.shard == shard,
+        )
+
+    def _row(self, db: Session, company_id: int, metric: str, day: date, shard: int) -> Optional[MemberSketch]:
+        return self._shard_query(db, company_id, metric, day, shard).first()
+
+    def _locked_row(self, db: Session, company_id: int, metric: str, day: date, shard: int) -> Optional[MemberSketch]:
+        # populate_existing: the unlocked read may have loaded older registers
+        return self._shard_query(db, company_id, metric, day, shard).with_for_update().populate_existing().first()
+
+    def _load(self, db: Session, company_id: int, metric: str, start: date, end: date) -> List[Any]:
+        return db.query(MemberSketch.day, MemberSketch.registers).filter(
+            MemberSketch.company_id == company_id,
+            MemberSketch.metric == metric,
+            MemberSketch.day >= start,
+            MemberSketch.day <= end,
+        ).all()
+
+    def distinct_members(self, db: Session, company_id: int, metric: str, start: date, end: date) -> int:
+        """Estimated distinct members over an inclusive day range"""
+        rows = self._load(db, company_id, metric, start, end)
+        return HyperLogLog.union(HyperLogLog.from_bytes(row.registers) for row in rows).count()
+
+    def distinct_members_series(
+        self,
+        db: Session,
+        company_id: int,
+        metric: str,
+        start: date,
+        end: date,
+        granularity: str = "day",
+    ) -> Dict[str, Any]:
+        """Distinct members per day/week/month plus the total for the range"""
+        buckets: Dict[date, List[HyperLogLog]] = defaultdict(list)
+        for row in self._load(db, company_id, metric, start, end):
+            buckets[period_start(row.day, granularity)].append(HyperLogLog.from_bytes(row.registers))
+
+        merged = {period: HyperLogLog.union(sketches) for period, sketches in buckets.items()}
+        total = HyperLogLog.union(merged.values())
+        return {
+            "metric": metric,
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "total": total.count(),
+            "relative_error": round(total.relative_error, 4),
+            "series": [
+                {"period": period.isoformat(), "members": merged[period].count()}
+                for period in sorted(merged)
+            ],
+        }
+
+
+# Global service instance
+member_sketch_service = MemberSketchService()
@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import OutboxMessage, OutboxStatus
+
+FEE_CHARGE = "fee_charge"
+
+
+def pending_companies(kind: str):
+    """Subquery of company ids with undelivered messages of ``kind``"""
+    return select(OutboxMessage.company_id).where(
+        OutboxMessage.kind == kind,
+        OutboxMessage.status == OutboxStatus.PENDING,
+    )
+
+
+class OutboxService:
+    """Writes outbox messages inside the caller's transaction"""
+
+    def enqueue(
+        self,
+        db: Session,
+        kind: str,
+        payload: Dict[str, Any],
+        idempotency_key: str,
+        company_id: Optional[int] = None,
+    ) -> Optional[OutboxMessage]:
+        """
+        Add a message unless one with the same key exists (e.g. a retried
+        webhook). Returns the new message, or None. Does not commit.
+        """
+        exists = db.execute(
+            select(OutboxMessage.id).where(OutboxMessage.idempotency_key == idempotency_key)
+        ).first()
+        if exists:
+            return None
+        message = OutboxMessage(
+            kind=kind,
+            company_id=company_id,
+            payload=payload,
+            idempotency_key=idempotency_key,
+            status=OutboxStatus.PENDING,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+        )
+        db.add(message)
+        return message
+
+    def enqueue_fee_charge(
+        self,
+        db: Session,
+        company_id: int,
+        fee_amount: int,
+        stripe_event_id: Optional[str],
+        stripe_invoice_id: Optional[str] = None,
+    ) -> Optional[OutboxMessage]:
+        """Charge a recovery's fee right away, keyed on the Stripe event"""
+        return self.enqueue(
+            db,
+            FEE_CHARGE,
+            {
+                "company_id": company_id,
+                "amount": fee_amount,
+                "stripe_event_id": stripe_event_id,
+                "stripe_invoice_id": stripe_invoice_id,
+            },
+            idempotency_key=f"chargechase-fee-{company_id}-{stripe_event_id}",
+            company_id=company_id,
+        )
+
+    def has_pending(self, db: Session, company_id: int, kind: str) -> bool:
+        return db.execute(
+            pending_companies(kind).where(OutboxMessage.company_id == company_id).limit(1)
+        ).first() is not None
+
+
+# Global service instance
+outbox_service = OutboxService()
@@ -0,0 +1,259 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import RecoveryEvent
+
+# Histogram bucket edges for time-to-recovery, in hours. The last bucket is
+# open-ended.
+TIME_TO_RECOVERY_BIN_HOURS = (0, 1, 6, 24, 72, 168, 336, 720)
+
+# Checkpoints (days since first failure) for cohort recovery curves
+COHORT_CURVE_DAYS = (1, 3, 7, 14, 30)
+
+SECONDS_PER_HOUR = 3600.0
+SECONDS_PER_DAY = 86400.0
+
+
+@dataclass
+class RecoveryColumns:
+    """Failure and recovery events for one company, stored column-wise"""
+    customer_id: np.ndarray  # int64
+    invoice_id: np.ndarray  # object (str or None)
+    is_failure: np.ndarray  # bool
+    created_at: np.ndarray  # float64, seconds since epoch (UTC)
+
+    def __len__(self) -> int:
+        return len(self.customer_id)
+
+
+@dataclass
+class RecoveryPairs:
+    """One row per (customer, invoice) that has at least one failure"""
+    failed_at: np.ndarray  # float64, first failure
+    recovered_at: np.ndarray  # float64, first recovery after it, NaN if none
+    attempts: np.ndarray  # int64, failures up to recovery (or all failures)
+
+    @property
+    def recovered(self) -> np.ndarray:
+        return ~np.isnan(self.recovered_at)
+
+    def __len__(self) -> int:
+        return len(self.failed_at)
+
+
+def _epoch_seconds(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def load_recovery_columns(db: Session, company_id: int) -> RecoveryColumns:
+    """Fetch a company's failure/recovery events in one query as columns"""
+    rows = db.execute(
+        select(
+            RecoveryEvent.customer_id,
+            RecoveryEvent.stripe_invoice_id,
+            RecoveryEvent.event_type,
+            RecoveryEvent.created_at,
+        ).where(
+            RecoveryEvent.company_id == company_id,
+            RecoveryEvent.event_type.in_(["payment_failed", "payment_recovered"]),
+        )
+    ).all()
+
+    if not rows:
+        return RecoveryColumns(
+            customer_id=np.empty(0, dtype=np.int64),
+            invoice_id=np.empty(0, dtype=object),
+            is_failure=np.empty(0, dtype=bool),
+            created_at=np.empty(0, dtype=np.float64),
+        )
+
+    customer_ids, invoice_ids, event_types, created_ats = zip(*rows)
+    return RecoveryColumns(
+        customer_id=np.fromiter(customer_ids, dtype=np.int64, count=len(rows)),
+        invoice_id=np.array(invoice_ids, dtype=object),
+        is_failure=np.array(event_types, dtype=object) == "payment_failed",
+        created_at=np.fromiter(
+            (_epoch_seconds(value) for value in created_ats),
+            dtype=np.float64,
+            count=len(rows),
+        ),
+    )
+
+
+def pair_failures_and_recoveries(columns: RecoveryColumns) -> RecoveryPairs:
+    """
+    Match each (customer, invoice) first failure with its first later recovery
+
+    Events without an invoice id are grouped per customer.
+    """
+    if len(columns) == 0:
+        empty = np.empty(0, dtype=np.float64)
+        return RecoveryPairs(failed_at=empty, recovered_at=empty, attempts=np.empty(0, dtype=np.int64))
+
+    invoice_keys = np.where(columns.invoice_id == None, "", columns.invoice_id).astype(str)  # noqa: E711
+    _, invoice_codes = np.unique(invoice_keys, return_inverse=True)
+    _, pair = np.unique(
+        np.stack([columns.customer_id, invoice_codes.astype(np.int64)], axis=1),
+        axis=0,
+        return_inverse=True,
+    )
+    pair = pair.ravel()
+    n_pairs = int(pair.max()) + 1
+
+    failed = columns.is_failure
+    ts = columns.created_at
+
+    failed_at = np.full(n_pairs, np.inf)
+    np.minimum.at(failed_at, pair[failed], ts[failed])
+
+    # Recoveries only count if they follow the first failure of their pair
+    recovery = ~failed & (ts >= failed_at[pair])
+    recovered_at = np.full(n_pairs, np.inf)
+    np.minimum.at(recovered_at, pair[recovery], ts[recovery])
+
+    counted = failed & (ts <= recovered_at[pair])
+    attempts = np.bincount(pair[counted], minlength=n_pairs)
+
+    has_failure = np.isfinite(failed_at)
+    recovered_at = np.where(np.isfinite(recovered_at), recovered_at, np.nan)
+    return RecoveryPairs(
+        failed_at=failed_at[has_failure],
+        recovered_at=recovered_at[has_failure],
+        attempts=attempts[has_failure],
+    )
+
+
+def time_to_recovery_histogram(
+    pairs: RecoveryPairs,
+    bin_hours: Sequence[float] = TIME_TO_RECOVERY_BIN_HOURS,
+) -> Dict[str, Any]:
+    """Histogram and percentiles of hours from first failure to recovery"""
+    hours = (pairs.recovered_at[pairs.recovered] - pairs.failed_at[pairs.recovered]) / SECONDS_PER_HOUR
+    edges = np.append(np.asarray(bin_hours, dtype=np.float64), np.inf)
+    counts, _ = np.histogram(hours, bins=edges)
+
+    return {
+        "bins_hours": [
+            {"from": float(low), "to": float(high) if np.isfinite(high) else None}
+            for low, high in zip(edges[:-1], edges[1:])
+        ],
+        "counts": counts.tolist(),
+        "median_hours": float(np.median(hours)) if hours.size else None,
+        "p90_hours": float(np.percentile(hours, 90)) if hours.size else None,
+    }
+
+
+def cohort_recovery_curves(
+    pairs: RecoveryPairs,
+    now: float,
+    days: Sequence[int] = COHORT_CURVE_DAYS,
+) -> List[Dict[str, Any]]:
+    """
+    Share of each monthly failure cohort recovered within N days
+
+    Pairs whose first failure is less than N days old are left out of the
+    N-day rate, so young cohorts aren't shown as under-recovering.
+    """
+    if len(pairs) == 0:
+        return []
+
+    months = pairs.failed_at.astype("datetime64[s]").astype("datetime64[M]")
+    labels, cohort = np.unique(months, return_inverse=True)
+    cohort = cohort.ravel()
+    sizes = np.bincount(cohort, minlength=len(labels))
+
+    elapsed_days = (pairs.recovered_at - pairs.failed_at) / SECONDS_PER_DAY
+    curves = {}
+    for day in days:
+        eligible = pairs.failed_at <= now - day * SECONDS_PER_DAY
+        within = eligible & pairs.recovered & (elapsed_days <= day)
+        denominator = np.bincount(cohort, weights=eligible, minlength=len(labels))
+        numerator = np.bincount(cohort, weights=within, minlength=len(labels))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curves[day] = np.where(denominator > 0, numerator / denominator, np.nan)
+
+    return [
+        {
+            "cohort": str(label),
+            "size": int(sizes[i]),
+            "recovered_within_days": {
+                str(day): (None if np.isnan(curves[day][i]) else round(float(curves[day][i]), 4))
+                for day in days
+            },
+        }
+        for i, label in enumerate(labels)
+    ]
+
+
+def recovery_rate_by_attempt(pairs: RecoveryPairs, max_attempt: int) -> List[Dict[str, Any]]:
+    """
+    Recovery rate at each failed attempt
+
+    The rate for attempt N is the share of pairs that reached N failures and
+    recovered before a further failure. The last bucket includes every pair
+    with ``max_attempt`` or more failures.
+    """
+    attempts = np.clip(pairs.attempts, 1, max_attempt)
+    ended_at = np.bincount(attempts, minlength=max_attempt + 1)[1:]
+    recovered_at = np.bincount(attempts[pairs.recovered], minlength=max_attempt + 1)[1:]
+    reached = np.cumsum(ended_at[::-1])[::-1]
+
+    return [
+        {
+            "attempt": attempt,
+            "reached": int(reached[attempt - 1]),
+            "recovered": int(recovered_at[attempt - 1]),
+            "rate": round(float(recovered_at[attempt - 1] / reached[attempt - 1]), 4)
+            if reached[attempt - 1] else None,
+        }
+        for attempt in range(1, max_attempt + 1)
+    ]
+
+
+def compute_recovery_analytics(columns: RecoveryColumns, now: Optional[float] = None) -> Dict[str, Any]:
+    """Build the full analytics payload from a company's event columns"""
+    now = datetime.now(timezone.utc).timestamp() if now is None else now
+    pairs = pair_failures_and_recoveries(columns)
+    recovered = int(pairs.recovered.sum())
+
+    return {
+        "failed_invoices": len(pairs),
+        "recovered_invoices": recovered,
+        "recovery_rate": round(recovered / len(pairs), 4) if len(pairs) else 0.0,
+        "time_to_recovery": time_to_recovery_histogram(pairs),
+        "cohorts": cohort_recovery_curves(pairs, now),
+        "by_attempt": recovery_rate_by_attempt(pairs, settings.MAX_DUNNING_ATTEMPTS),
+    }
+
+
+class RecoveryAnalyticsService:
+    """Computes and caches per-company recovery analytics"""
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        self.cache = TTLCache(ttl_seconds or settings.ANALYTICS_CACHE_TTL_SECONDS)
+
+    def get_company_analytics(self, db: Session, company_id: int) -> Dict[str, Any]:
+        """Return cached analytics for a company, computing them on a miss"""
+        result = self.cache.get(company_id)
+        if result is None:
+            result = compute_recovery_analytics(load_recovery_columns(db, company_id))
+            result["generated_at"] = datetime.now(timezone.utc).isoformat()
+            self.cache.set(company_id, result)
+        return result
+
+    def invalidate(self, company_id: int) -> None:
+        """Drop cached analytics for a company"""
+        self.cache.invalidate(company_id)
+
+
+# Global service instance
+recovery_analytics_service = RecoveryAnalyticsService()
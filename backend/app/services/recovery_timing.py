@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import RecoveryTiming
+
+HOURS_PER_WEEK = 168
+
+# 1970-01-01 was a Thursday; shift so hour 0 of the week is Monday 00:00 UTC
+_EPOCH_HOUR_OF_WEEK = 3 * 24
+
+_NO_TABLE = object()
+
+
+def hour_of_week(epoch_seconds: np.ndarray) -> np.ndarray:
+    """UTC hour of the week (Monday 00:00 = 0) for an array of timestamps"""
+    hours = np.floor_divide(epoch_seconds, 3600).astype(np.int64)
+    return (hours + _EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+
+def build_histograms(company_ids: np.ndarray, paid_at: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hour-of-week recovery counts for every company in one pass
+
+    Returns the sorted unique company ids and a ``(companies, 168)`` count
+    matrix whose rows line up with them.
+    """
+    companies, rows = np.unique(company_ids, return_inverse=True)
+    cells = rows * HOURS_PER_WEEK + hour_of_week(paid_at)
+    counts = np.bincount(cells, minlength=len(companies) * HOURS_PER_WEEK)
+    return companies, counts.reshape(len(companies), HOURS_PER_WEEK)
+
+
+def slot_delays(
+    histogram: np.ndarray,
+    top_fraction: Optional[float] = None,
+    max_delay_hours: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Per-hour delay (uint8) to the next good slot, 0 if none within reach
+
+    The histogram is smoothed over neighbouring hours (wrapping around the
+    week) and the best ``top_fraction`` of hours become good slots.
+    """
+    top_fraction = top_fraction or settings.RECOVERY_TIMING_TOP_FRACTION
+    max_delay_hours = max_delay_hours or settings.RECOVERY_TIMING_MAX_DELAY_HOURS
+
+    counts = histogram.astype(np.float64)
+    smoothed = 0.25 * np.roll(counts, 1) + 0.5 * counts + 0.25 * np.roll(counts, -1)
+    slots = max(1, int(round(HOURS_PER_WEEK * top_fraction)))
+    threshold = np.sort(smoothed)[-slots]
+    good = np.flatnonzero((smoothed >= threshold) & (smoothed > 0))
+    if good.size == 0:
+        return np.zeros(HOURS_PER_WEEK, dtype=np.uint8)
+
+    # Next good hour at or after each hour, looking into the following week
+    ahead = np.concatenate([good, good + HOURS_PER_WEEK])
+    hours = np.arange(HOURS_PER_WEEK)
+    delays = ahead[np.searchsorted(ahead, hours)] - hours
+    delays[delays > max_delay_hours] = 0
+    return delays.astype(np.uint8)
+
+
+def snap(due_at: datetime, delays: bytes) -> datetime:
+    """Move ``due_at`` to the start of its best nearby hour (one table lookup)"""
+    delay = delays[due_at.weekday() * 24 + due_at.hour]
+    if not delay:
+        return due_at
+    return due_at.replace(minute=0, second=0, microsecond=0) + timedelta(hours=delay)
+
+
+class RecoveryTimingService:
+    """Serves per-company timing tables for dunning steps"""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.cache = TTLCache(ttl_seconds or settings.RECOVERY_TIMING_CACHE_TTL_SECONDS)
+
+    def delays_for(self, db: Session, company_id: int) -> Optional[bytes]:
+        """The company's 168-byte table, or None if it hasn't got enough history"""
+        delays = self.cache.get(company_id)
+        if delays is None:
+            row = db.execute(
+                select(RecoveryTiming.slot_delays).where(RecoveryTiming.company_id == company_id)
+            ).scalar_one_or_none()
+            delays = row if row is not None else _NO_TABLE
+            self.cache.set(company_id, delays)
+        return None if delays is _NO_TABLE else delays
+
+    def snap(self, db: Session, company_id: int, due_at: datetime) -> datetime:
+        delays = self.delays_for(db, company_id)
+        return snap(due_at, delays) if delays else due_at
+
+    def invalidate(self, company_id: Optional[int] = None) -> None:
+        if company_id is None:
+            self.cache.clear()
+        else:
+            self.cache.invalidate(company_id)
+
+
+# Global service instance
+recovery_timing_service = RecoveryTimingService()
@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import WhopCompany
+
+MAX_OFFSET_DAYS = 60
+
+
+@dataclass(frozen=True)
+class RetrySchedule:
+    """Validated dunning schedule: hours after the failure for each step"""
+    offsets_hours: Tuple[int, ...]
+
+    @property
+    def attempts(self) -> int:
+        return len(self.offsets_hours)
+
+    def due_at(self, failed_at: datetime, attempt: int) -> datetime:
+        """Due time of a 1-based ``attempt``"""
+        return failed_at + timedelta(hours=self.offsets_hours[attempt - 1])
+
+    def to_days_string(self) -> str:
+        """Legacy comma form, e.g. "1,3,7" (whole days only)"""
+        return ",".join(str(hours // 24) for hours in self.offsets_hours)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"offsets_hours": list(self.offsets_hours)}
+
+
+def parse_retry_schedule(value: Union[str, Sequence[int], Dict[str, Any]]) -> RetrySchedule:
+    """
+    Parse and validate a schedule
+
+    Accepts the settings form (comma-separated days, "1,3,7"), a list of
+    days, or the stored ``{"offsets_hours": [...]}`` form. Raises
+    ``ValueError`` with a user-facing message when invalid.
+    """
+    if isinstance(value, dict):
+        hours = list(value.get("offsets_hours") or [])
+    else:
+        if isinstance(value, str):
+            parts = [part.strip() for part in value.split(",") if part.strip()]
+        else:
+            parts = list(value)
+        try:
+            days = [int(part) for part in parts]
+        except (TypeError, ValueError):
+            raise ValueError("retry_schedule must be comma-separated whole days, e.g. \"1,3,7\"")
+        hours = [day * 24 for day in days]
+
+    if not hours:
+        raise ValueError("retry_schedule needs at least one retry")
+    if len(hours) > settings.MAX_DUNNING_ATTEMPTS:
+        raise ValueError(f"retry_schedule allows at most {settings.MAX_DUNNING_ATTEMPTS} retries")
+    if any(not isinstance(h, int) or h < 0 or h > MAX_OFFSET_DAYS * 24 for h in hours):
+        raise ValueError(f"retry days must be between 0 and {MAX_OFFSET_DAYS}")
+    if any(later <= earlier for earlier, later in zip(hours, hours[1:])):
+        raise ValueError("retry days must be strictly increasing")
+    return RetrySchedule(tuple(hours))
+
+
+DEFAULT_RETRY_SCHEDULE = RetrySchedule(tuple(sorted(settings.DEFAULT_DUNNING_SCHEDULE))[:settings.MAX_DUNNING_ATTEMPTS])
+
+
+def _legacy_schedule(value: Optional[str]) -> RetrySchedule:
+    """Lenient parse of rows saved before the structured column existed"""
+    try:
+        days = {int(part) for part in (value or "").split(",") if part.strip()}
+    except ValueError:
+        days = set()
+    hours = sorted(day * 24 for day in days if 0 <= day <= MAX_OFFSET_DAYS)
+    return RetrySchedule(tuple(hours[:settings.MAX_DUNNING_ATTEMPTS])) if hours else DEFAULT_RETRY_SCHEDULE
+
+
+def _stored_schedule(company: WhopCompany) -> RetrySchedule:
+    """Schedule from the structured column, falling back to the legacy string"""
+    if company.retry_schedule_hours:
+        try:
+            return parse_retry_schedule(company.retry_schedule_hours)
+        except ValueError:
+            pass
+    return _legacy_schedule(company.retry_schedule)
+
+
+class RetryScheduleService:
+    """
+    Parsed schedules cached per company
+
+    Entries are checked against ``settings_version`` so a save in another
+    process is picked up; the saving process also invalidates directly.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.cache = TTLCache(ttl_seconds or settings.COMPANY_SETTINGS_CACHE_TTL_SECONDS)
+
+    def schedule_for(self, company: WhopCompany) -> RetrySchedule:
+        version = company.settings_version or 0
+        entry = self.cache.get(company.id)
+        if entry is None or entry[0] != version:
+            entry = (version, _stored_schedule(company))
+            self.cache.set(company.id, entry)
+        return entry[1]
+
+    def invalidate(self, company_id: int) -> None:
+        self.cache.invalidate(company_id)
+
+
+# Global service instance
+retry_schedule_service = RetryScheduleService()
@@ -0,0 +1,178 @@
+import hashlib
+import hmac
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import Customer, WhopCustomer
+import structlog
+
+logger = structlog.get_logger()
+
+COMPANY = "company"  # WhopCustomer rows, scoped by company_id
+USER = "user"  # Legacy Customer rows, scoped by user_id
+
+SuppressionKey = Tuple[str, int, str]
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def unsubscribe_token(company_id: int, email: str) -> str:
+    """Signed token for unsubscribe links, so addresses can't be opted out by guessing"""
+    message = f"{company_id}:{normalize_email(email)}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def unsubscribe_url(company_id: int, email: str) -> str:
+    query = urlencode({"company": company_id, "email": email, "token": unsubscribe_token(company_id, email)})
+    return f"{settings.PUBLIC_API_URL}/whop/unsubscribe?{query}"
+
+
+class SuppressionIndex:
+    """
+    In-memory set of suppressed ``(scope, owner, email)`` keys
+
+    Mirrors the ``dont_email`` flags so send paths can drop recipients
+    without a query each. A plain set is exact and small enough here (one
+    short tuple per suppressed address), so there is no Bloom filter false
+    positive to re-check. The flags stay the source of truth: changes made
+    in this process are applied immediately, and ``refresh_if_stale``
+    reloads the set so other processes' changes show up within
+    ``refresh_seconds``.
+    """
+
+    def __init__(self, refresh_seconds: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.refresh_seconds = refresh_seconds or settings.SUPPRESSION_REFRESH_SECONDS
+        self.clock = clock
+        self.loaded_at: Optional[float] = None
+        self._keys: Set[SuppressionKey] = set()
+
+    @staticmethod
+    def key(owner_id: int, email: str, scope: str = COMPANY) -> SuppressionKey:
+        return (scope, owner_id, normalize_email(email))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, owner_id: int, email: str, scope: str = COMPANY) -> None:
+        self._keys.add(self.key(owner_id, email, scope))
+
+    def discard(self, owner_id: int, email: str, scope: str = COMPANY) -> None:
+        self._keys.discard(self.key(owner_id, email, scope))
+
+    def is_suppressed(self, owner_id: int, email: str, scope: str = COMPANY) -> bool:
+        return self.key(owner_id, email, scope) in self._keys
+
+    def filter(
+        self,
+        owner_id: int,
+        items: Iterable[Any],
+        email_of: Callable[[Any], str] = lambda item: item,
+        scope: str = COMPANY,
+    ) -> List[Any]:
+        """Items whose address is not suppressed for ``owner_id``"""
+        keys = self._keys
+        return [item for item in items if (scope, owner_id, normalize_email(email_of(item))) not in keys]
+
+    async def load(self, session: AsyncSession) -> int:
+        """Rebuild the set from the ``dont_email`` flags"""
+        keys: Set[SuppressionKey] = set()
+        for scope, owner, email, flag in (
+            (COMPANY, WhopCustomer.company_id, WhopCustomer.email, WhopCustomer.dont_email),
+            (USER, Customer.user_id, Customer.email, Customer.dont_email),
+        ):
+            result = await session.execute(select(owner, email).where(flag.is_(True)))
+            keys.update((scope, owner_id, normalize_email(address)) for owner_id, address in result)
+
+        self._keys = keys
+        self.loaded_at = self.clock()
+        logger.info("Suppression index loaded", suppressed=len(keys))
+        return len(keys)
+
+    async def refresh_if_stale(self, session: AsyncSession) -> None:
+        if self.loaded_at is None or self.clock() - self.loaded_at >= self.refresh_seconds:
+            await self.load(session)
+
+    def suppress(self, db: Session, email: str, company_id: Optional[int] = None) -> int:
+        """
+        Flag an address as ``dont_email`` (for one company, or everywhere)
+
+        Updates the rows and the index. Returns the number of customer rows
+        flagged. Does not commit.
+        """
+        address = normalize_email(email)
+        query = db.query(WhopCustomer.id, WhopCustomer.company_id).filter(func.lower(WhopCustomer.email) == address)
+        if company_id is not None:
+            query = query.filter(WhopCustomer.company_id == company_id)
+        rows = query.all()
+        if rows:
+            db.execute(
+                update(WhopCustomer)
+                .where(WhopCustomer.id.in_([row.id for row in rows]))
+                .values(dont_email=True)
+                .execution_options(synchronize_session="fetch")
+            )
+        for row in rows:
+            self._keys.add((COMPANY, row.company_id, address))
+        if company_id is not None:
+            self._keys.add((COMPANY, company_id, address))
+
+        if company_id is None:
+            users = db.query(Customer.id, Customer.user_id).filter(func.lower(Customer.email) == address).all()
+            if users:
+                db.execute(
+                    update(Customer)
+                    .where(Customer.id.in_([row.id for row in users]))
+                    .values(dont_email=True)
+                    .execution_options(synchronize_session="fetch")
+                )
+            self._keys.update((USER, row.user_id, address) for row in users)
+            rows = rows + users
+
+        return len(rows)
+
+    def handle_resend_event(self, db: Session, event: Dict[str, Any]) -> int:
+        """
+        Apply a Resend ``email.bounced`` / ``email.complained`` webhook
+
+        Hard bounces mean the address is dead, so it is suppressed for every
+        company; complaints only for the company that sent the email (from
+        the ``company_id`` tag). Does not commit.
+        """
+        event_type = event.get("type")
+        if event_type not in ("email.bounced", "email.complained"):
+            return 0
+
+        data = event.get("data") or {}
+        company_id = None
+        if event_type == "email.complained":
+            company_id = _tag_value(data.get("tags"), "company_id")
+
+        flagged = 0
+        for address in data.get("to") or []:
+            flagged += self.suppress(db, address, company_id)
+        logger.info("Suppressed recipients", event_type=event_type, company_id=company_id, rows=flagged)
+        return flagged
+
+
+def _tag_value(tags: Any, name: str) -> Optional[int]:
+    """Resend sends tags as either a mapping or a list of name/value pairs"""
+    if isinstance(tags, dict):
+        value = tags.get(name)
+    else:
+        value = next((tag.get("value") for tag in tags or [] if tag.get("name") == name), None)
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# Global service instance
+suppression_index = SuppressionIndex()
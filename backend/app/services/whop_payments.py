@@ -1,20 +1,58 @@
 import os
+import httpx
 import requests
+from limits.storage import storage_from_string
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.models import WhopCompany
-from typing import Dict, Any
+from app.core import rate_limit_storage  # noqa: F401 - registers the shm:// storage scheme
+from app.core.cache import SharedGenerations, StaleWhileRevalidateCache
+from app.core.config import settings
+from app.models import FeeCharge, FeeChargeStatus, WhopCompany
+from app.services.fee_ledger import fee_ledger_service
+from app.services.outbox import FEE_CHARGE, outbox_service
+from typing import Dict, Any, Optional
 from datetime import datetime
 import json
 
 
+class WhopChargeError(Exception):
+    """
+    A Whop charge request that failed
+
+    Only a 4xx answer (other than timeout, conflict and rate limit) says the
+    charge was refused. Anything else, including no answer at all, may have
+    been charged, so it must be retried with the same idempotency key
+    rather than given up on.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def rejected(self) -> bool:
+        return self.status_code is not None and 400 <= self.status_code < 500 and self.status_code not in (408, 409, 429)
+
+
 class WhopPaymentService:
     """Service for handling Whop's payment system integration"""
     
-    def __init__(self):
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.whop_api_base = "https://api.whop.com/v1"
         self.app_id = os.getenv("WHOP_APP_ID")
         self.api_key = os.getenv("WHOP_API_KEY")
-        self.fee_percentage = 0.029  # 2.9% transaction fee
+        self.fee_basis_points = settings.TRANSACTION_FEE_BASIS_POINTS
+        self.fee_percentage = self.fee_basis_points / 10000  # For display
+        self.transport = transport
+        self.payment_methods_cache = StaleWhileRevalidateCache(
+            settings.PAYMENT_METHODS_CACHE_TTL_SECONDS,
+            settings.PAYMENT_METHODS_STALE_SECONDS,
+            shared=SharedGenerations(
+                storage_from_string(settings.CACHE_INVALIDATION_STORAGE_URI),
+                "payment-methods",
+                settings.PAYMENT_METHODS_CACHE_TTL_SECONDS + settings.PAYMENT_METHODS_STALE_SECONDS,
+            ),
+        )
     
     async def create_transaction_fee_charge(
         self, 
@@ -25,7 +63,7 @@ class WhopPaymentService:
         """
         Create a transaction fee charge through Whop's payment system
         """
-        fee_amount = int(recovered_amount * self.fee_percentage)
+        fee_amount = self.calculate_fee(recovered_amount)
         
         payload = {
             "company_id": company.whop_company_id,
@@ -58,61 +96,167 @@ class WhopPaymentService:
         except requests.RequestException as e:
             raise Exception(f"Failed to create Whop charge: {str(e)}")
     
+    async def create_fee_charge(
+        self,
+        company: WhopCompany,
+        fee_amount: int,  # in cents
+        idempotency_key: str,
+        transaction_metadata: Dict[str, Any] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> Dict[str, Any]:
+        """
+        Charge accumulated fees through Whop
+
+        ``idempotency_key`` makes retries of the same charge safe: Whop returns
+        the original charge instead of creating a second one.
+        """
+        payload = {
+            "company_id": company.whop_company_id,
+            "amount": fee_amount,
+            "currency": "usd",
+            "description": f"ChargeChase fees: ${fee_amount/100:.2f}",
+            "metadata": {
+                "app_id": self.app_id,
+                "transaction_type": "recovery_fee_batch",
+                **(transaction_metadata or {})
+            }
+        }
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "X-Whop-App-ID": self.app_id or "",
+            "Idempotency-Key": idempotency_key,
+        }
+        
+        try:
+            if client is None:
+                async with httpx.AsyncClient(timeout=30.0, transport=self.transport) as own_client:
+                    response = await own_client.post(f"{self.whop_api_base}/charges", headers=headers, json=payload)
+            else:
+                response = await client.post(f"{self.whop_api_base}/charges", headers=headers, json=payload)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            raise WhopChargeError(f"Failed to create Whop charge: {str(e)}", e.response.status_code)
+        except httpx.HTTPError as e:
+            raise WhopChargeError(f"Failed to create Whop charge: {str(e)}")
+    
     async def process_batch_fees(self, db: Session, company: WhopCompany) -> Dict[str, Any]:
         """
         Process accumulated fees for a company
         """
-        if company.total_fees_owed <= 0:
+        if outbox_service.has_pending(db, company.id, FEE_CHARGE):
+            # Its fee is part of the balance; charging now would take it twice
+            return {"message": "An immediate fee charge is still being processed", "amount": 0}
+        if db.query(FeeCharge.id).filter(
+            FeeCharge.company_id == company.id,
+            FeeCharge.status == FeeChargeStatus.PENDING,
+        ).first():
+            # A batch charge of these fees is in flight or awaiting retry
+            return {"message": "A batch fee charge is still being processed", "amount": 0}
+        
+        balance = fee_ledger_service.balance(db, company.id)
+        fees_owed = balance.total_fees_owed
+        if fees_owed <= 0:
             return {"message": "No fees owed", "amount": 0}
         
+        # Same balance -> same key, so a double-submitted request charges once
+        idempotency_key = f"chargechase-fees-{company.id}-{balance.total_fees_paid}-{fees_owed}"
+        
+        # Claim the charge before calling Whop: the fee batch doesn't plan
+        # companies with a pending row, and a concurrent request for the
+        # same balance loses on the unique key
+        claim = FeeCharge(
+            company_id=company.id,
+            period=f"manual-{balance.total_fees_paid}-{fees_owed}",
+            amount=fees_owed,
+            idempotency_key=idempotency_key,
+            status=FeeChargeStatus.PENDING,
+            attempts=1,
+        )
+        db.add(claim)
         try:
-            # Create charge through Whop
-            charge = await self.create_transaction_fee_charge(
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return {"message": "This fee charge has already been submitted", "amount": 0}
+        
+        try:
+            charge = await self.create_fee_charge(
                 company=company,
-                recovered_amount=company.total_recovered,  # Use total recovered as base
+                fee_amount=fees_owed,
+                idempotency_key=idempotency_key,
                 transaction_metadata={
                     "batch_processing": True,
-                    "fees_owed": company.total_fees_owed,
+                    "fees_owed": fees_owed,
+                    "fee_charge_id": claim.id,
                     "processing_date": datetime.utcnow().isoformat()
                 }
             )
-            
-            # Update company record
-            company.total_fees_paid += company.total_fees_owed
-            company.total_fees_owed = 0
-            db.commit()
-            
-            return {
-                "status": "success",
-                "charge_id": charge.get("id"),
-                "amount_charged": charge.get("amount"),
-                "company_id": company.whop_company_id
-            }
-            
         except Exception as e:
+            if isinstance(e, WhopChargeError) and e.rejected:
+                claim.status = FeeChargeStatus.FAILED
+            # Otherwise left pending: the next fee batch retries it under the same key
+            claim.error = str(e)
+            db.commit()
             return {
                 "status": "error",
                 "error": str(e),
                 "company_id": company.whop_company_id
             }
+        
+        # The fee batch may have settled this row meanwhile; only one records it
+        settled = db.query(FeeCharge).filter(
+            FeeCharge.id == claim.id,
+            FeeCharge.status == FeeChargeStatus.PENDING,
+        ).update({
+            FeeCharge.status: FeeChargeStatus.SUCCEEDED,
+            FeeCharge.whop_charge_id: charge.get("id"),
+            FeeCharge.charged_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        if settled:
+            # Move only what was charged; fees accrued meanwhile stay owed
+            fee_ledger_service.record_charge(db, company.id, fees_owed, reference=idempotency_key)
+        db.commit()
+        
+        return {
+            "status": "success",
+            "charge_id": charge.get("id"),
+            "amount_charged": charge.get("amount"),
+            "company_id": company.whop_company_id
+        }
     
-    async def get_payment_methods(self, company_id: str) -> Dict[str, Any]:
+    async def fetch_payment_methods(self, company_id: str) -> Dict[str, Any]:
         """
-        Get available payment methods for a company through Whop
+        Get available payment methods for a company from Whop (uncached)
         """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
-            "X-Whop-App-ID": self.app_id,
+            "X-Whop-App-ID": self.app_id or "",
         }
         
-        try:
-            response = requests.get(
+        async with httpx.AsyncClient(timeout=10.0, transport=self.transport) as client:
+            response = await client.get(
                 f"{self.whop_api_base}/companies/{company_id}/payment_methods",
                 headers=headers
             )
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
+    
+    async def get_payment_methods(self, company_id: str) -> Dict[str, Any]:
+        """
+        Get available payment methods for a company through Whop
+
+        Served from a per-company stale-while-revalidate cache; dropped in
+        every worker on the host when a ``charge.*`` webhook arrives for the
+        company. Other hosts pick the change up at their next refresh, once
+        the TTL has passed.
+        """
+        try:
+            return await self.payment_methods_cache.get(
+                company_id, lambda: self.fetch_payment_methods(company_id)
+            )
+        except httpx.HTTPError as e:
             return {"error": f"Failed to get payment methods: {str(e)}"}
     
     async def create_subscription_charge(
@@ -165,8 +309,8 @@ class WhopPaymentService:
             raise Exception(f"Failed to create Whop subscription: {str(e)}")
     
     def calculate_fee(self, recovered_amount: int) -> int:
-        """Calculate transaction fee for a recovered amount"""
-        return int(recovered_amount * self.fee_percentage)
+        """Calculate transaction fee for a recovered amount (integer math, truncated)"""
+        return recovered_amount * self.fee_basis_points // 10000
     
     async def handle_payment_webhook(self, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -174,6 +318,14 @@ class WhopPaymentService:
         """
         event_type = webhook_data.get("type")
         
+        if event_type and event_type.startswith("charge."):
+            # A charge may have added, used or failed a payment method
+            company_id = webhook_data.get("data", {}).get("object", {}).get("company_id")
+            if company_id:
+                self.payment_methods_cache.invalidate(company_id)
+            else:
+                self.payment_methods_cache.clear()
+        
         if event_type == "charge.succeeded":
             # Payment successful
             charge = webhook_data.get("data", {}).get("object", {})
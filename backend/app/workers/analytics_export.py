@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from sqlalchemy import func, or_, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import RecoveryEvent, WhopCustomer
+import structlog
+
+logger = structlog.get_logger()
+
+WATERMARK_FILE = "_watermarks.json"
+
+# Arrow schemas for the extract. ``company_id`` and ``month`` are partition
+# columns and are stored in the directory layout rather than in the files.
+RECOVERY_EVENTS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("company_id", pa.int64()),
+    ("customer_id", pa.int64()),
+    ("event_type", pa.string()),
+    ("stripe_event_id", pa.string()),
+    ("stripe_invoice_id", pa.string()),
+    ("amount", pa.int64()),
+    ("currency", pa.string()),
+    ("retry_attempt", pa.int32()),
+    ("recovery_email_sent", pa.bool_()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("stripe_created_at", pa.timestamp("us", tz="UTC")),
+    ("month", pa.string()),
+])
+
+WHOP_CUSTOMERS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("company_id", pa.int64()),
+    ("stripe_customer_id", pa.string()),
+    ("email", pa.string()),
+    ("name", pa.string()),
+    ("recovery_status", pa.string()),
+    ("total_failed_amount", pa.int64()),
+    ("total_recovered_amount", pa.int64()),
+    ("dont_email", pa.bool_()),
+    ("last_failed_payment_at", pa.timestamp("us", tz="UTC")),
+    ("last_recovery_email_sent_at", pa.timestamp("us", tz="UTC")),
+    ("last_recovered_payment_at", pa.timestamp("us", tz="UTC")),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("updated_at", pa.timestamp("us", tz="UTC")),
+    ("changed_at", pa.timestamp("us", tz="UTC")),
+    ("month", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("company_id", pa.int64()), ("month", pa.string())]),
+    flavor="hive",
+)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Normalize naive (SQLite) and aware (Postgres) timestamps to UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _month_key(value: Optional[datetime]) -> str:
+    """Partition key for a timestamp, e.g. ``2024-03``"""
+    value = _as_utc(value) or datetime.now(timezone.utc)
+    return value.strftime("%Y-%m")
+
+
+class AnalyticsExporter:
+    """
+    Incrementally exports recovery data to a partitioned Parquet extract
+
+    Files are laid out as ``<root>/<table>/company_id=<id>/month=<YYYY-MM>/``
+    and are never rewritten. Progress is tracked per table in a watermark
+    file, so each run only reads rows added or changed since the last one.
+
+    Only rows older than ``lag_seconds`` are exported: ids and timestamps
+    are handed out before commit, so a recent row can still be followed by
+    an earlier one committing late and land behind the watermark. Keeping
+    the lag above the longest webhook transaction means none are skipped.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        lag_seconds: Optional[int] = None,
+    ):
+        self.root = root or settings.ANALYTICS_EXPORT_DIR
+        self.batch_size = batch_size or settings.ANALYTICS_EXPORT_BATCH_SIZE
+        self.lag_seconds = settings.ANALYTICS_EXPORT_LAG_SECONDS if lag_seconds is None else lag_seconds
+
+    def _cutoff(self, now: Optional[datetime]) -> datetime:
+        return (now or datetime.utcnow()) - timedelta(seconds=self.lag_seconds)
+
+    # Watermarks
+
+    def _watermark_path(self) -> str:
+        return os.path.join(self.root, WATERMARK_FILE)
+
+    def load_watermarks(self) -> Dict[str, Any]:
+        """Load the per-table watermarks, empty on the first run"""
+        try:
+            with open(self._watermark_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save_watermarks(self, watermarks: Dict[str, Any]) -> None:
+        """Atomically persist watermarks after a batch has been written"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self._watermark_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(watermarks, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._watermark_path())
+
+    # Writing
+
+    def _write_batch(self, table_name: str, table: pa.Table, basename: str) -> None:
+        """Append one batch to the extract, split by company and month"""
+        ds.write_dataset(
+            table,
+            base_dir=os.path.join(self.root, table_name),
+            format="parquet",
+            partitioning=PARTITIONING,
+            basename_template=basename + "-{i}.parquet",
+            # Batch file names are derived from the watermark range, so a
+            # batch replayed after a crash overwrites its own files only.
+            existing_data_behavior="overwrite_or_ignore",
+        )
+
+    async def export_recovery_events(
+        self, db: AsyncSession, watermarks: Dict[str, Any], now: Optional[datetime] = None
+    ) -> int:
+        """Export recovery events with ``id`` above the stored watermark"""
+        state = watermarks.setdefault("recovery_events", {"id": 0})
+        exported = 0
+        columns = [c for c in RecoveryEvent.__table__.c if c.name in RECOVERY_EVENTS_SCHEMA.names]
+        up_to_id = (await db.execute(
+            select(func.max(RecoveryEvent.id)).where(RecoveryEvent.created_at <= self._cutoff(now))
+        )).scalar_one_or_none()
+        if up_to_id is None:
+            return 0
+
+        while True:
+            result = await db.execute(
+                select(*columns)
+                .where(RecoveryEvent.id > state["id"], RecoveryEvent.id <= up_to_id)
+                .order_by(RecoveryEvent.id)
+                .limit(self.batch_size)
+            )
+            rows = result.mappings().all()
+            if not rows:
+                break
+
+            data: Dict[str, List[Any]] = {name: [] for name in RECOVERY_EVENTS_SCHEMA.names}
+            for row in rows:
+                for column in columns:
+                    value = row[column.name]
+                    if column.name in ("created_at", "stripe_created_at"):
+                        value = _as_utc(value)
+                    data[column.name].append(value)
+                data["month"].append(_month_key(row["created_at"]))
+
+            first_id, last_id = rows[0]["id"], rows[-1]["id"]
+            table = pa.Table.from_pydict(data, schema=RECOVERY_EVENTS_SCHEMA)
+            self._write_batch("recovery_events", table, f"part-{first_id:012d}-{last_id:012d}")
+
+            state["id"] = last_id
+            self.save_watermarks(watermarks)
+            exported += len(rows)
+
+        return exported
+
+    async def export_whop_customers(
+        self, db: AsyncSession, watermarks: Dict[str, Any], now: Optional[datetime] = None
+    ) -> int:
+        """
+        Export customer snapshots changed since the stored watermark
+
+        Customers are mutable, so each change is appended as a new snapshot
+        row; readers take the latest ``changed_at`` per ``id``.
+        """
+        state = watermarks.setdefault("whop_customers", {"changed_at": None, "id": 0})
+        changed_at = func.coalesce(WhopCustomer.updated_at, WhopCustomer.created_at)
+        columns = [c for c in WhopCustomer.__table__.c if c.name in WHOP_CUSTOMERS_SCHEMA.names]
+        exported = 0
+        cutoff = self._cutoff(now)
+
+        while True:
+            query = select(*columns, changed_at.label("changed_at")).where(changed_at <= cutoff)
+            if state["changed_at"] is not None:
+                since = datetime.fromisoformat(state["changed_at"])
+                query = query.where(or_(
+                    changed_at > since,
+                    and_(changed_at == since, WhopCustomer.id > state["id"]),
+                ))
+            result = await db.execute(
+                query.order_by(changed_at, WhopCustomer.id).limit(self.batch_size)
+            )
+            rows = result.mappings().all()
+            if not rows:
+                break
+
+            data: Dict[str, List[Any]] = {name: [] for name in WHOP_CUSTOMERS_SCHEMA.names}
+            for row in rows:
+                for name in WHOP_CUSTOMERS_SCHEMA.names:
+                    if name == "month":
+                        continue
+                    value = row[name]
+                    if isinstance(value, datetime):
+                        value = _as_utc(value)
+                    elif name == "recovery_status" and value is not None:
+                        value = value.value
+                    data[name].append(value)
+                data["month"].append(_month_key(row["changed_at"]))
+
+            last = rows[-1]
+            table = pa.Table.from_pydict(data, schema=WHOP_CUSTOMERS_SCHEMA)
+            stamp = _as_utc(last["changed_at"]).strftime("%Y%m%dT%H%M%S%f")
+            self._write_batch("whop_customers", table, f"part-{stamp}-{last['id']:012d}")
+
+            # Keep the raw database value so the next comparison matches the
+            # column's own timezone handling.
+            state["changed_at"] = last["changed_at"].isoformat()
+            state["id"] = last["id"]
+            self.save_watermarks(watermarks)
+            exported += len(rows)
+
+        return exported
+
+    async def run(self) -> Dict[str, int]:
+        """Run one incremental export of every table"""
+        watermarks = self.load_watermarks()
+        async with AsyncSessionLocal() as db:
+            events = await self.export_recovery_events(db, watermarks)
+            customers = await self.export_whop_customers(db, watermarks)
+
+        summary = {"recovery_events": events, "whop_customers": customers}
+        logger.info("Analytics export completed", root=self.root, **summary)
+        return summary
+
+
+def read_extract(
+    table_name: str,
+    root: Optional[str] = None,
+    company_id: Optional[int] = None,
+    start_month: Optional[str] = None,
+    end_month: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    """
+    Read part of the extract into an Arrow table for local analysis
+
+    Company and month filters prune whole partition directories, so a query
+    for one company and quarter only opens the files for that range. Months
+    use the ``YYYY-MM`` format and both bounds are inclusive.
+    """
+    dataset = ds.dataset(
+        os.path.join(root or settings.ANALYTICS_EXPORT_DIR, table_name),
+        format="parquet",
+        partitioning=PARTITIONING,
+    )
+
+    conditions = []
+    if company_id is not None:
+        conditions.append(ds.field("company_id") == company_id)
+    if start_month is not None:
+        conditions.append(ds.field("month") >= start_month)
+    if end_month is not None:
+        conditions.append(ds.field("month") <= end_month)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def latest_customer_snapshots(table: pa.Table) -> pa.Table:
+    """Reduce appended ``whop_customers`` snapshots to the latest row per id"""
+    if table.num_rows == 0:
+        return table
+    ordered = table.sort_by([("id", "ascending"), ("changed_at", "descending")])
+    ids = ordered.column("id").to_pylist()
+    keep = [i for i, value in enumerate(ids) if i == 0 or ids[i - 1] != value]
+    return ordered.take(keep)
+
+
+if __name__ == "__main__":
+    asyncio.run(AnalyticsExporter().run())
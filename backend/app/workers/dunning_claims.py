@@ -0,0 +1,109 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models import DunningJob, DunningJobStatus
+
+
+def make_worker_id() -> str:
+    """Identifier recorded as the lease owner, unique per process"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _claimable(now: datetime):
+    """Pending steps, plus claimed steps whose worker's lease ran out"""
+    return or_(
+        DunningJob.status == DunningJobStatus.PENDING,
+        and_(
+            DunningJob.status == DunningJobStatus.CLAIMED,
+            DunningJob.lease_expires_at < now,
+        ),
+    )
+
+
+async def claim_due_jobs(
+    session: AsyncSession,
+    worker_id: str,
+    now: datetime,
+    limit: Optional[int] = None,
+    lease_seconds: Optional[int] = None,
+    job_ids: Optional[Sequence[int]] = None,
+) -> List[DunningJob]:
+    """
+    Lease up to ``limit`` due steps for this worker and commit the lease
+
+    On Postgres the candidates are selected ``FOR UPDATE SKIP LOCKED``, so
+    concurrent workers take disjoint batches without waiting on each other.
+    SQLite ignores the locking clause but runs the single UPDATE atomically.
+    Expired leases (a worker crashed mid-batch) are claimed like pending
+    steps.
+    """
+    limit = limit or settings.DUNNING_CLAIM_BATCH_SIZE
+    lease_seconds = lease_seconds or settings.DUNNING_LEASE_SECONDS
+
+    candidates = select(DunningJob.id).where(_claimable(now), DunningJob.due_at <= now)
+    if job_ids is not None:
+        candidates = candidates.where(DunningJob.id.in_(list(job_ids)))
+    candidates = (
+        candidates.order_by(DunningJob.due_at, DunningJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+
+    result = await session.execute(
+        update(DunningJob)
+        .where(DunningJob.id.in_(candidates.scalar_subquery()), _claimable(now))
+        .values(
+            status=DunningJobStatus.CLAIMED,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(DunningJob.id)
+        .execution_options(synchronize_session=False)
+    )
+    claimed_ids = [row[0] for row in result.all()]
+    await session.commit()
+
+    if not claimed_ids:
+        return []
+    result = await session.execute(
+        select(DunningJob)
+        .where(DunningJob.id.in_(claimed_ids))
+        .order_by(DunningJob.due_at, DunningJob.id)
+        .execution_options(populate_existing=True)
+    )
+    return list(result.scalars().all())
+
+
+async def complete_jobs(
+    session: AsyncSession,
+    worker_id: str,
+    job_ids: Sequence[int],
+    now: datetime,
+) -> int:
+    """
+    Mark leased steps as sent and commit
+
+    Only steps still leased to this worker are updated, so a worker whose
+    lease expired and was reclaimed can't overwrite the new owner's state.
+    """
+    if not job_ids:
+        return 0
+    result = await session.execute(
+        update(DunningJob)
+        .where(
+            DunningJob.id.in_(list(job_ids)),
+            DunningJob.status == DunningJobStatus.CLAIMED,
+            DunningJob.lease_owner == worker_id,
+        )
+        .values(status=DunningJobStatus.SENT, completed_at=now, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return result.rowcount
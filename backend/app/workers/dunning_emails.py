@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import DunningJob, WhopCompany, WhopCustomer
+from app.services.dunning import step_invoices
+from app.services.email_delivery import EmailMessage, email_delivery_service
+from app.services.email_templates import email_template_service, recipient_fields
+from app.services.suppression import suppression_index, unsubscribe_url
+import structlog
+
+logger = structlog.get_logger()
+
+
+def build_dunning_email(company: WhopCompany, customer: WhopCustomer, job: DunningJob) -> EmailMessage:
+    template = email_template_service.dunning_email(company)
+    unsubscribe = unsubscribe_url(company.id, customer.email)
+    subject, html, text = template.render(
+        recipient_fields(customer.name, customer.email, step_invoices(job), unsubscribe)
+    )
+    return EmailMessage(
+        from_email=template.from_email,
+        to=[customer.email],
+        subject=subject,
+        html=html,
+        text=text,
+        tags={"company_id": str(company.id), "attempt": str(job.attempt)},
+        headers={"List-Unsubscribe": f"<{unsubscribe}>", "List-Unsubscribe-Post": "List-Unsubscribe=One-Click"},
+        idempotency_key=f"dunning-job-{job.id}",
+    )
+
+
+async def send_dunning_emails(session: AsyncSession, jobs: List[DunningJob]) -> List[int]:
+    """
+    Dunning step handler: email each step's customer in one batched send
+
+    Returns the ids of steps that are done: sent, skipped (email disabled or
+    customer opted out) or permanently rejected. Steps whose send failed
+    transiently are left out so their lease expires and they are retried.
+    Suppressed recipients are dropped in memory before rendering.
+    """
+    await suppression_index.refresh_if_stale(session)
+    rows = (await session.execute(
+        select(WhopCustomer, WhopCompany)
+        .join(WhopCompany, WhopCompany.id == WhopCustomer.company_id)
+        .where(WhopCustomer.id.in_({job.customer_id for job in jobs}))
+    )).all()
+    by_customer = {customer.id: (customer, company) for customer, company in rows}
+
+    done: List[int] = []
+    to_send: List[DunningJob] = []
+    messages: List[EmailMessage] = []
+    for job in jobs:
+        customer, company = by_customer.get(job.customer_id, (None, None))
+        if (
+            customer is None
+            or not company.email_enabled
+            or customer.dont_email
+            or suppression_index.is_suppressed(company.id, customer.email)
+        ):
+            done.append(job.id)
+            continue
+        to_send.append(job)
+        messages.append(build_dunning_email(company, customer, job))
+
+    if not messages:
+        return done
+
+    result = await email_delivery_service.send(messages)
+    sent_at = datetime.utcnow()
+    for index, job in enumerate(to_send):
+        if index in result.sent:
+            by_customer[job.customer_id][0].last_recovery_email_sent_at = sent_at
+            done.append(job.id)
+        elif not result.failed[index].retryable:
+            logger.error("Dunning email rejected", job_id=job.id, error=str(result.failed[index]))
+            done.append(job.id)
+    await session.commit()
+
+    logger.info("Dunning emails sent", sent=len(result.sent), failed=len(result.failed))
+    return done
@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import DunningJob
+from app.services.dunning import _naive_utc
+from app.workers.dunning_claims import _claimable, claim_due_jobs, complete_jobs, make_worker_id
+import structlog
+
+logger = structlog.get_logger()
+
+# Handlers may return the ids they finished; the rest stay leased and are retried
+StepHandler = Callable[[AsyncSession, List[DunningJob]], Awaitable[Optional[Iterable[int]]]]
+
+
+async def log_due_steps(session: AsyncSession, jobs: List[DunningJob]) -> None:
+    """Default handler until a delivery pipeline is plugged in"""
+    logger.info("Dunning steps due", count=len(jobs), job_ids=[job.id for job in jobs])
+
+
+class SchedulerMetrics:
+    """Scheduling lag (fire time minus due time) and activity counters"""
+
+    def __init__(self, window: int = 10000):
+        self.fired = 0
+        self.pages_loaded = 0
+        self.max_lag_seconds = 0.0
+        self.lag_seconds: Deque[float] = deque(maxlen=window)
+
+    def record_fire(self, lag_seconds: float) -> None:
+        self.fired += 1
+        self.lag_seconds.append(lag_seconds)
+        self.max_lag_seconds = max(self.max_lag_seconds, lag_seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus lag percentiles over the most recent fires"""
+        lags = np.fromiter(self.lag_seconds, dtype=np.float64)
+        p50, p95, p99 = np.percentile(lags, [50, 95, 99]) if lags.size else (0.0, 0.0, 0.0)
+        return {
+            "fired": self.fired,
+            "pages_loaded": self.pages_loaded,
+            "lag_p50_seconds": float(p50),
+            "lag_p95_seconds": float(p95),
+            "lag_p99_seconds": float(p99),
+            "lag_max_seconds": self.max_lag_seconds,
+        }
+
+
+class DunningScheduler:
+    """
+    Fires dunning steps when they come due
+
+    The ``dunning_jobs`` table, indexed on ``(status, due_at)``, is the
+    persisted due-time index. The scheduler keeps only the next page of
+    pending steps in an in-memory min-heap and sleeps until the head is due,
+    so each wakeup costs one indexed page read instead of a customer scan.
+    The page is re-read when the heap drains and every ``poll_seconds`` to
+    pick up steps written by other processes; in-process producers can call
+    ``notify`` to be picked up immediately.
+
+    Several schedulers can run against one database: due steps are leased
+    in batches of ``claim_batch_size`` (see ``dunning_claims``), so each
+    worker handles a disjoint batch and a crashed worker's steps become
+    claimable again once its lease expires.
+    """
+
+    def __init__(
+        self,
+        handler: StepHandler = log_due_steps,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        page_size: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+        clock: Callable[[], datetime] = datetime.utcnow,
+        worker_id: Optional[str] = None,
+        claim_batch_size: Optional[int] = None,
+    ):
+        self.handler = handler
+        self.worker_id = worker_id or make_worker_id()
+        self.claim_batch_size = claim_batch_size or settings.DUNNING_CLAIM_BATCH_SIZE
+        self.session_factory = session_factory
+        self.page_size = page_size or settings.DUNNING_SCHEDULER_PAGE_SIZE
+        self.poll_seconds = poll_seconds or settings.DUNNING_SCHEDULER_POLL_SECONDS
+        self.clock = clock
+        self.metrics = SchedulerMetrics()
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._queued: Set[int] = set()
+        self._page_full = False
+        self._next_poll_at: Optional[datetime] = None
+        self._wakeup = asyncio.Event()
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def notify(self, job_id: int, due_at: datetime) -> None:
+        """Add a newly committed step without waiting for the next poll"""
+        if job_id in self._queued:
+            return
+        heapq.heappush(self._heap, (_naive_utc(due_at), job_id))
+        self._queued.add(job_id)
+        self._wakeup.set()
+
+    async def load_page(self) -> int:
+        """Replace the heap with the next ``page_size`` pending steps"""
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(DunningJob.due_at, DunningJob.id)
+                .where(_claimable(self.clock()))
+                .order_by(DunningJob.due_at, DunningJob.id)
+                .limit(self.page_size)
+            )
+            rows = result.all()
+
+        self._heap = [(_naive_utc(due_at), job_id) for due_at, job_id in rows]
+        heapq.heapify(self._heap)
+        self._queued = {job_id for _, job_id in self._heap}
+        self._page_full = len(rows) == self.page_size
+        self._next_poll_at = self.clock() + timedelta(seconds=self.poll_seconds)
+        self.metrics.pages_loaded += 1
+        return len(rows)
+
+    def next_wakeup(self) -> Optional[datetime]:
+        """When the scheduler next has work: head due time or next poll"""
+        candidates = [t for t in (self._heap[0][0] if self._heap else None, self._next_poll_at) if t]
+        return min(candidates) if candidates else None
+
+    async def run_due(self) -> int:
+        """Fire every step that is due now, paging in more as the heap drains"""
+        if self._next_poll_at is None or self.clock() >= self._next_poll_at:
+            await self.load_page()
+
+        fired = 0
+        while True:
+            now = self.clock()
+            due: List[Tuple[datetime, int]] = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.page_size:
+                entry = heapq.heappop(self._heap)
+                self._queued.discard(entry[1])
+                due.append(entry)
+
+            if due:
+                fired += await self._fire(due)
+
+            if self._heap and self._heap[0][0] <= self.clock():
+                continue
+            # A full page that drained may have more due work behind it
+            if not self._heap and self._page_full:
+                await self.load_page()
+                if self._heap and self._heap[0][0] <= self.clock():
+                    continue
+            return fired
+
+    async def _fire(self, due: List[Tuple[datetime, int]]) -> int:
+        due_at = {job_id: when for when, job_id in due}
+        remaining = list(due_at)
+        fired = 0
+
+        async with self.session_factory() as session:
+            while remaining:
+                jobs = await claim_due_jobs(
+                    session,
+                    self.worker_id,
+                    self.clock(),
+                    limit=self.claim_batch_size,
+                    job_ids=remaining,
+                )
+                if not jobs:
+                    # The rest were cancelled or leased by another worker
+                    break
+                claimed = {job.id for job in jobs}
+                remaining = [job_id for job_id in remaining if job_id not in claimed]
+
+                try:
+                    handled = await self.handler(session, jobs)
+                except Exception as e:
+                    # Leases are left to expire so the steps are retried later
+                    logger.error("Dunning handler failed", error=str(e), job_ids=sorted(claimed))
+                    await session.rollback()
+                    continue
+
+                done = claimed if handled is None else claimed & set(handled)
+                fired_at = self.clock()
+                await complete_jobs(session, self.worker_id, list(done), fired_at)
+                for job_id in done:
+                    self.metrics.record_fire((fired_at - due_at[job_id]).total_seconds())
+                fired += len(done)
+
+        return fired
+
+    async def run_forever(self) -> None:
+        """Sleep until the next step is due, fire it, repeat"""
+        logger.info("Dunning scheduler started", page_size=self.page_size, poll_seconds=self.poll_seconds)
+        while not self._stopped:
+            # Cleared before running so a notify() during the run isn't lost
+            self._wakeup.clear()
+            pages_before = self.metrics.pages_loaded
+            try:
+                await self.run_due()
+            except Exception as e:
+                logger.error("Dunning scheduler iteration failed", error=str(e))
+            if self.metrics.pages_loaded != pages_before:
+                logger.info("Dunning scheduler metrics", queued=len(self), **self.metrics.snapshot())
+
+            wakeup = self.next_wakeup()
+            timeout = self.poll_seconds
+            if wakeup is not None:
+                timeout = max(0.0, min(timeout, (wakeup - self.clock()).total_seconds()))
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wakeup.set()
+
+
+if __name__ == "__main__":
+    from app.workers.dunning_emails import send_dunning_emails
+
+    asyncio.run(DunningScheduler(send_dunning_emails).run_forever())
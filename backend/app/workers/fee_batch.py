@@ -0,0 +1,249 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import FeeBatchRun, FeeCharge, FeeChargeStatus, WhopCompany
+from app.services.fee_ledger import balances_select, fee_ledger_service
+from app.services.outbox import FEE_CHARGE, pending_companies
+from app.services.whop_payments import WhopChargeError, WhopPaymentService, whop_payment_service
+import structlog
+
+logger = structlog.get_logger()
+
+
+def fee_idempotency_key(company_id: int, period: str) -> str:
+    """One key per company and period; Whop dedupes retries on it"""
+    return f"chargechase-fees-{company_id}-{period}"
+
+
+class FeeBatchRunner:
+    """
+    Charges accumulated transaction fees for every company
+
+    A run is identified by its ``period`` (the UTC date by default) and
+    works in two committed phases:
+
+    1. Plan: one pending ``fee_charges`` row per company with fees owed,
+       amount frozen. This commit is the checkpoint.
+    2. Charge: pending rows are charged concurrently, at most
+       ``concurrency`` at a time. A success appends the fee ledger charge
+       entry in the same transaction that marks the row succeeded.
+
+    Re-running a period after a crash only retries rows still pending,
+    with the same idempotency key, so a charge that reached Whop before the
+    crash is returned rather than repeated.
+
+    Only a definite rejection (a 4xx from Whop) marks a row failed; its fees
+    stay owed for the next period. Timeouts, transport errors and 5xx may
+    have charged, so those rows stay pending and the run stays open. Every
+    run retries pending rows from earlier periods under their original key,
+    and companies with one are not planned again until it's resolved.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        concurrency: Optional[int] = None,
+        payment_service: WhopPaymentService = whop_payment_service,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.session_factory = session_factory
+        self.concurrency = concurrency or settings.FEE_BATCH_CONCURRENCY
+        self.payment_service = payment_service
+        self.transport = transport
+
+    async def run(self, period: Optional[str] = None) -> Dict[str, Any]:
+        """Run (or resume) the batch for ``period`` and return its summary"""
+        period = period or datetime.utcnow().date().isoformat()
+        started = time.perf_counter()
+
+        async with self.session_factory() as db:
+            run = await self._get_or_create_run(db, period)
+            if run.status == "completed":
+                logger.info("Fee batch already completed", period=period)
+                return run.summary
+            run_id = run.id
+            planned = await self._plan(db, run)
+
+            # This run's rows and any left unresolved by earlier runs
+            pending = (await db.execute(
+                select(FeeCharge.id)
+                .where(FeeCharge.status == FeeChargeStatus.PENDING)
+                .order_by(FeeCharge.id)
+            )).scalars().all()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(timeout=30.0, transport=self.transport) as client:
+            async def charge(charge_id: int) -> None:
+                async with semaphore:
+                    await self._charge(charge_id, client)
+
+            await asyncio.gather(*(charge(charge_id) for charge_id in pending))
+
+        async with self.session_factory() as db:
+            run = await db.get(FeeBatchRun, run_id)
+            charges = (await db.execute(
+                select(FeeCharge).where(FeeCharge.run_id == run_id)
+            )).scalars().all()
+            summary = self._summarize(period, charges, planned, len(pending), time.perf_counter() - started)
+            run.summary = summary
+            if not summary["pending"]:
+                run.status = "completed"
+                run.finished_at = datetime.utcnow()
+            await self._close_resolved_runs(db, run_id)
+            await db.commit()
+
+        logger.info("Fee batch finished", **{k: v for k, v in summary.items() if k not in ("failures", "unresolved")})
+        for failure in summary["failures"]:
+            logger.warning("Fee charge failed", period=period, **failure)
+        for unresolved in summary["unresolved"]:
+            logger.warning("Fee charge outcome unknown, will retry", period=period, **unresolved)
+        return summary
+
+    async def _close_resolved_runs(self, db: AsyncSession, current_run_id: int) -> None:
+        """Complete earlier runs whose last pending rows were just resolved"""
+        still_pending = select(FeeCharge.run_id).where(
+            FeeCharge.status == FeeChargeStatus.PENDING,
+            FeeCharge.run_id.is_not(None),
+        )
+        runs = (await db.execute(
+            select(FeeBatchRun).where(
+                FeeBatchRun.status == "running",
+                FeeBatchRun.id != current_run_id,
+                FeeBatchRun.id.not_in(still_pending),
+            )
+        )).scalars().all()
+        for run in runs:
+            run.status = "completed"
+            run.finished_at = datetime.utcnow()
+
+    async def _get_or_create_run(self, db: AsyncSession, period: str) -> FeeBatchRun:
+        run = (await db.execute(
+            select(FeeBatchRun).where(FeeBatchRun.period == period)
+        )).scalar_one_or_none()
+        if run is None:
+            run = FeeBatchRun(period=period, status="running", started_at=datetime.utcnow())
+            db.add(run)
+            await db.commit()
+        return run
+
+    async def _plan(self, db: AsyncSession, run: FeeBatchRun) -> int:
+        """Add pending charges for companies not yet in this run; commits"""
+        planned = select(FeeCharge.company_id).where(FeeCharge.period == run.period)
+        balances = balances_select().where(WhopCompany.is_active == True).subquery()
+        owing = (await db.execute(
+            select(balances.c.company_id, balances.c.total_fees_owed).where(
+                balances.c.total_fees_owed > 0,
+                balances.c.company_id.not_in(planned),
+                # An earlier charge may have gone through; retried first
+                balances.c.company_id.not_in(
+                    select(FeeCharge.company_id).where(FeeCharge.status == FeeChargeStatus.PENDING)
+                ),
+                # Their immediate charge is still in flight; picked up next period
+                balances.c.company_id.not_in(pending_companies(FEE_CHARGE)),
+            )
+        )).all()
+
+        db.add_all([
+            FeeCharge(
+                run_id=run.id,
+                company_id=company_id,
+                period=run.period,
+                amount=owed,
+                idempotency_key=fee_idempotency_key(company_id, run.period),
+                status=FeeChargeStatus.PENDING,
+            )
+            for company_id, owed in owing
+        ])
+        await db.commit()
+        return len(owing)
+
+    async def _charge(self, charge_id: int, client: httpx.AsyncClient) -> None:
+        async with self.session_factory() as db:
+            charge = await db.get(FeeCharge, charge_id)
+            company = await db.get(WhopCompany, charge.company_id)
+            charge.attempts += 1
+            started = time.perf_counter()
+            try:
+                result = await self.payment_service.create_fee_charge(
+                    company=company,
+                    fee_amount=charge.amount,
+                    idempotency_key=charge.idempotency_key,
+                    transaction_metadata={"batch_period": charge.period, "fee_charge_id": charge.id},
+                    client=client,
+                )
+            except Exception as e:
+                if isinstance(e, WhopChargeError) and e.rejected:
+                    charge.status = FeeChargeStatus.FAILED
+                # Otherwise left pending: Whop may have taken it, so only a
+                # retry with the same key may settle it
+                charge.error = str(e)
+                charge.duration_ms = (time.perf_counter() - started) * 1000
+                await db.commit()
+                return
+
+            # A manual charge of the same row may have settled it meanwhile
+            settled = await db.execute(
+                update(FeeCharge)
+                .where(FeeCharge.id == charge_id, FeeCharge.status == FeeChargeStatus.PENDING)
+                .values(
+                    status=FeeChargeStatus.SUCCEEDED,
+                    whop_charge_id=result.get("id"),
+                    charged_at=datetime.utcnow(),
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                )
+            )
+            if settled.rowcount == 1:
+                # Committed with the status change; fees accrued since planning stay owed
+                fee_ledger_service.record_charge(db, charge.company_id, charge.amount, reference=charge.idempotency_key)
+            await db.commit()
+
+    @staticmethod
+    def _summarize(
+        period: str,
+        charges: List[FeeCharge],
+        planned: int,
+        attempted: int,
+        elapsed: float,
+    ) -> Dict[str, Any]:
+        succeeded = [c for c in charges if c.status == FeeChargeStatus.SUCCEEDED]
+        failed = [c for c in charges if c.status == FeeChargeStatus.FAILED]
+        pending = [c for c in charges if c.status == FeeChargeStatus.PENDING]
+        durations = np.array([c.duration_ms for c in charges if c.duration_ms is not None], dtype=np.float64)
+        p50, p95 = np.percentile(durations, [50, 95]) if durations.size else (0.0, 0.0)
+        return {
+            "period": period,
+            "companies": len(charges),
+            "planned_this_run": planned,
+            "attempted_this_run": attempted,
+            "succeeded": len(succeeded),
+            "failed": len(failed),
+            "pending": len(pending),
+            "amount_charged": sum(c.amount for c in succeeded),
+            "amount_failed": sum(c.amount for c in failed),
+            "amount_pending": sum(c.amount for c in pending),
+            "duration_seconds": round(elapsed, 3),
+            "charge_ms_p50": round(float(p50), 1),
+            "charge_ms_p95": round(float(p95), 1),
+            "charge_ms_max": round(float(durations.max()), 1) if durations.size else 0.0,
+            "failures": [
+                {"company_id": c.company_id, "amount": c.amount, "error": c.error}
+                for c in failed
+            ],
+            "unresolved": [
+                {"company_id": c.company_id, "amount": c.amount, "error": c.error}
+                for c in pending
+            ],
+        }
+
+
+if __name__ == "__main__":
+    asyncio.run(FeeBatchRunner().run())
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import FeeBalanceSnapshot, FeeLedgerEntry, WhopCompany
+from app.services.fee_ledger import ledger_tail
+import structlog
+
+logger = structlog.get_logger()
+
+
+class FeeLedgerCompactionJob:
+    """
+    Folds the fee ledger tail into per-company balance snapshots
+
+    Only entries older than ``lag_seconds`` are folded: ids are handed out
+    before commit, so a recent id can still be followed by a lower one
+    committing late. Keeping the lag above the longest webhook transaction
+    means no entry is ever left behind a snapshot. The ledger itself is
+    never modified.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        lag_seconds: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.lag_seconds = settings.FEE_LEDGER_COMPACTION_LAG_SECONDS if lag_seconds is None else lag_seconds
+
+    async def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.utcnow()
+        async with self.session_factory() as db:
+            cutoff = (await db.execute(
+                select(func.max(FeeLedgerEntry.id)).where(
+                    FeeLedgerEntry.created_at <= now - timedelta(seconds=self.lag_seconds)
+                )
+            )).scalar_one_or_none()
+            if cutoff is None:
+                return {"companies": 0, "entries_up_to": 0}
+
+            tail = ledger_tail(up_to_id=cutoff)
+            rows = (await db.execute(
+                select(
+                    tail,
+                    WhopCompany.total_recovered,
+                    WhopCompany.total_fees_owed,
+                    WhopCompany.total_fees_paid,
+                ).join(WhopCompany, WhopCompany.id == tail.c.company_id)
+            )).all()
+            snapshots = {
+                snapshot.company_id: snapshot
+                for snapshot in (await db.execute(
+                    select(FeeBalanceSnapshot).where(
+                        FeeBalanceSnapshot.company_id.in_([row.company_id for row in rows])
+                    )
+                )).scalars()
+            }
+
+            for row in rows:
+                snapshot = snapshots.get(row.company_id)
+                if snapshot is None:
+                    # First snapshot starts from the legacy counters
+                    snapshot = FeeBalanceSnapshot(
+                        company_id=row.company_id,
+                        total_recovered=row.total_recovered or 0,
+                        total_fees_owed=row.total_fees_owed or 0,
+                        total_fees_paid=row.total_fees_paid or 0,
+                    )
+                    db.add(snapshot)
+                snapshot.total_recovered += row.recovered
+                snapshot.total_fees_owed += row.owed
+                snapshot.total_fees_paid += row.paid
+                snapshot.last_entry_id = row.last_entry_id
+            await db.commit()
+
+        stats = {"companies": len(rows), "entries_up_to": cutoff}
+        logger.info("Fee ledger compacted", **stats)
+        return stats
+
+
+if __name__ == "__main__":
+    asyncio.run(FeeLedgerCompactionJob().run())
@@ -0,0 +1,215 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import FeeLedgerEntry, FeeLedgerEntryType, OutboxMessage, OutboxStatus, WhopCompany
+from app.services.fee_ledger import fee_ledger_service
+from app.services.outbox import FEE_CHARGE
+from app.services.whop_payments import whop_payment_service
+import structlog
+
+logger = structlog.get_logger()
+
+# Delivers one message; raising leaves it for a retry. Ledger writes made on
+# ``session`` are committed together with the message being marked sent.
+OutboxHandler = Callable[[AsyncSession, OutboxMessage, httpx.AsyncClient], Awaitable[None]]
+
+
+async def deliver_fee_charge(session: AsyncSession, message: OutboxMessage, client: httpx.AsyncClient) -> None:
+    payload = message.payload
+    company = await session.get(WhopCompany, payload["company_id"])
+    await whop_payment_service.create_fee_charge(
+        company=company,
+        fee_amount=payload["amount"],
+        idempotency_key=message.idempotency_key,
+        transaction_metadata={
+            "immediate_charge": True,
+            "stripe_event_id": payload.get("stripe_event_id"),
+            "stripe_invoice_id": payload.get("stripe_invoice_id"),
+        },
+        client=client,
+    )
+    # The ledger's unique charge reference backs this up
+    recorded = await session.execute(select(FeeLedgerEntry.id).where(
+        FeeLedgerEntry.entry_type == FeeLedgerEntryType.CHARGE,
+        FeeLedgerEntry.reference == message.idempotency_key,
+    ))
+    if recorded.first() is None:
+        fee_ledger_service.record_charge(session, company.id, payload["amount"], reference=message.idempotency_key)
+
+
+DEFAULT_HANDLERS: Dict[str, OutboxHandler] = {FEE_CHARGE: deliver_fee_charge}
+
+
+class OutboxDispatcher:
+    """
+    Delivers outbox messages with retries
+
+    Due messages are claimed in batches by pushing ``next_attempt_at`` out by
+    ``lease_seconds`` (``FOR UPDATE SKIP LOCKED`` on Postgres, as in
+    ``dunning_claims``), so several dispatchers never deliver the same
+    message at once and a crashed dispatcher's messages come due again.
+    The lease is renewed as each message's delivery starts, and the result
+    is only committed while it is still held: a dispatcher that lost its
+    lease to another discards its ledger writes.
+
+    Failures back off exponentially with jitter. After ``max_attempts`` a
+    message is marked dead and logged, unless its error says the outcome is
+    unknown (``rejected`` is False, as on ``WhopChargeError``): those stay
+    pending and keep retrying with the same key, since the charge may have
+    gone through. Handlers send the message's idempotency key, so a
+    delivery retried after a crash is not repeated downstream.
+    """
+
+    def __init__(
+        self,
+        handlers: Optional[Dict[str, OutboxHandler]] = None,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        batch_size: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        poll_seconds: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        clock: Callable[[], datetime] = datetime.utcnow,
+    ):
+        self.handlers = handlers or DEFAULT_HANDLERS
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+        self.poll_seconds = poll_seconds or settings.OUTBOX_POLL_SECONDS
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.transport = transport
+        self.clock = clock
+        self._stopped = False
+
+    def retry_delay(self, attempts: int) -> float:
+        """Full-jitter exponential backoff in seconds"""
+        ceiling = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    async def claim(self, session: AsyncSession, now: datetime) -> List[int]:
+        """Lease up to ``batch_size`` due messages and commit the lease"""
+        due = and_(OutboxMessage.status == OutboxStatus.PENDING, OutboxMessage.next_attempt_at <= now)
+        candidates = (
+            select(OutboxMessage.id).where(due)
+            .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(candidates.scalar_subquery()), due)
+            .values(
+                next_attempt_at=now + timedelta(seconds=self.lease_seconds),
+                attempts=OutboxMessage.attempts + 1,
+            )
+            .returning(OutboxMessage.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = sorted(row[0] for row in result.all())
+        await session.commit()
+        return claimed
+
+    async def run_once(self) -> int:
+        """Deliver one batch of due messages; returns how many were sent"""
+        now = self.clock()
+        async with self.session_factory() as session:
+            claimed = await self.claim(session, now)
+        if not claimed:
+            return 0
+
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        sent = 0
+        async with httpx.AsyncClient(timeout=30.0, transport=self.transport) as client:
+            for message_id in claimed:
+                sent += await self._deliver(message_id, lease_until, client)
+        return sent
+
+    async def _hold(self, session: AsyncSession, message_id: int, lease_until: datetime, **values) -> bool:
+        """Update the message only if this dispatcher's lease is still on it"""
+        result = await session.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id == message_id,
+                OutboxMessage.status == OutboxStatus.PENDING,
+                OutboxMessage.next_attempt_at == lease_until,
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    async def _deliver(self, message_id: int, lease_until: datetime, client: httpx.AsyncClient) -> int:
+        async with self.session_factory() as session:
+            # Renew, so a slow batch doesn't run past the lease
+            renewed = self.clock() + timedelta(seconds=self.lease_seconds)
+            if not await self._hold(session, message_id, lease_until, next_attempt_at=renewed):
+                await session.rollback()
+                logger.warning("Outbox lease lost before delivery", message_id=message_id)
+                return 0
+            await session.commit()
+            lease_until = renewed
+
+            message = await session.get(OutboxMessage, message_id)
+            kind, attempts = message.kind, message.attempts
+            handler = self.handlers.get(kind)
+            try:
+                if handler is None:
+                    raise ValueError(f"No outbox handler for {kind!r}")
+                await handler(session, message, client)
+            except Exception as e:
+                await session.rollback()
+                # Unknown outcomes are never given up on: the charge may have happened
+                ambiguous = getattr(e, "rejected", True) is False
+                if attempts >= self.max_attempts and not ambiguous:
+                    values = {"status": OutboxStatus.DEAD}
+                    logger.error("Outbox message dead", message_id=message_id, kind=kind,
+                                 attempts=attempts, error=str(e))
+                else:
+                    retry_at = self.clock() + timedelta(seconds=self.retry_delay(min(attempts, self.max_attempts)))
+                    values = {"next_attempt_at": retry_at}
+                    log = logger.error if attempts >= self.max_attempts else logger.warning
+                    log("Outbox delivery failed", message_id=message_id, kind=kind,
+                        attempts=attempts, error=str(e))
+                if await self._hold(session, message_id, lease_until, last_error=str(e), **values):
+                    await session.commit()
+                else:
+                    await session.rollback()
+                return 0
+
+            if not await self._hold(
+                session, message_id, lease_until,
+                status=OutboxStatus.SENT, sent_at=self.clock(), last_error=None,
+            ):
+                # Another dispatcher took the message over and records it
+                await session.rollback()
+                logger.warning("Outbox lease lost during delivery", message_id=message_id, kind=kind)
+                return 0
+            await session.commit()
+            return 1
+
+    async def run_forever(self) -> None:
+        logger.info("Outbox dispatcher started", batch_size=self.batch_size, poll_seconds=self.poll_seconds)
+        while not self._stopped:
+            try:
+                sent = await self.run_once()
+            except Exception as e:
+                logger.error("Outbox dispatcher iteration failed", error=str(e))
+                sent = 0
+            # A full batch means more may be waiting
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_seconds)
+
+    def stop(self) -> None:
+        self._stopped = True
+
+
+if __name__ == "__main__":
+    asyncio.run(OutboxDispatcher().run_forever())
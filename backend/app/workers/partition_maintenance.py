@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.database import engine as default_engine
+from app.core.partitioning import (
+    RECOVERY_EVENTS_TABLE,
+    add_months,
+    ensure_monthly_partitions,
+    list_detached_partitions,
+    list_partitions,
+    month_start,
+    partition_month,
+)
+import structlog
+
+logger = structlog.get_logger()
+
+ROLLUP_SQL = """
+INSERT INTO recovery_event_rollups (company_id, month, event_type, event_count, total_amount, total_fees, created_at)
+SELECT company_id, :month, event_type, count(*), coalesce(sum(amount), 0),
+       coalesce(sum(amount * :fee_basis_points / 10000), 0), now()
+FROM "{partition}"
+GROUP BY company_id, event_type
+ON CONFLICT (company_id, month, event_type) DO UPDATE
+SET event_count = excluded.event_count, total_amount = excluded.total_amount, total_fees = excluded.total_fees
+"""
+
+# Per customer, so reconciliation can still check customer totals
+CUSTOMER_ROLLUP_SQL = """
+INSERT INTO recovery_event_customer_rollups (company_id, customer_id, month, event_type, total_amount, created_at)
+SELECT company_id, customer_id, :month, event_type, coalesce(sum(amount), 0), now()
+FROM "{partition}"
+WHERE event_type IN ('payment_failed', 'payment_recovered')
+GROUP BY company_id, customer_id, event_type
+ON CONFLICT (customer_id, month, event_type) DO UPDATE
+SET total_amount = excluded.total_amount
+"""
+
+
+class PartitionMaintenance:
+    """
+    Keeps ``recovery_events`` partitions ahead of time and retires old ones
+
+    Retiring a month rolls its events up into ``recovery_event_rollups``
+    (per company) and ``recovery_event_customer_rollups`` (per customer) and
+    detaches the partition in one transaction, so stats never see the month
+    twice or not at all. The detached table is then written to a gzipped
+    JSON-lines archive and dropped.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine] = None,
+        retention_months: Optional[int] = None,
+        premake_months: Optional[int] = None,
+        archive_dir: Optional[str] = None,
+    ):
+        self.engine = engine or default_engine
+        self.retention_months = retention_months or settings.RECOVERY_EVENTS_RETENTION_MONTHS
+        self.premake_months = premake_months or settings.RECOVERY_EVENTS_PREMAKE_MONTHS
+        self.archive_dir = archive_dir or settings.PARTITION_ARCHIVE_DIR
+
+    def archive_path(self, partition: str) -> str:
+        return os.path.join(self.archive_dir, RECOVERY_EVENTS_TABLE, f"{partition}.jsonl.gz")
+
+    async def run(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Create upcoming partitions and retire those past retention"""
+        now = now or datetime.now(timezone.utc)
+        if self.engine.dialect.name != "postgresql":
+            logger.info("Partition maintenance skipped", dialect=self.engine.dialect.name)
+            return {"created": [], "retired": []}
+
+        cutoff = add_months(month_start(now), -self.retention_months)
+
+        async with self.engine.begin() as conn:
+            created = await conn.run_sync(ensure_monthly_partitions, now, self.premake_months)
+            attached = await conn.run_sync(list_partitions)
+
+        expired = [
+            name for name in attached
+            if partition_month(name) is not None and partition_month(name) < cutoff
+        ]
+        for name in expired:
+            await self.detach_partition(name, partition_month(name))
+
+        # Includes tables left behind by a run that stopped after detaching
+        async with self.engine.connect() as conn:
+            detached = await conn.run_sync(list_detached_partitions)
+        retired = []
+        for name in detached:
+            await self.archive_partition(name)
+            await self.drop_partition(name)
+            retired.append(name)
+
+        logger.info(
+            "Partition maintenance completed",
+            created=created,
+            retired=retired,
+            cutoff=cutoff.isoformat(),
+        )
+        return {"created": created, "retired": retired}
+
+    async def detach_partition(self, name: str, month: datetime) -> None:
+        """Roll up a partition's events and detach it atomically"""
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(ROLLUP_SQL.format(partition=name)),
+                {"month": month, "fee_basis_points": settings.TRANSACTION_FEE_BASIS_POINTS},
+            )
+            await conn.execute(text(CUSTOMER_ROLLUP_SQL.format(partition=name)), {"month": month})
+            await conn.execute(text(f'ALTER TABLE {RECOVERY_EVENTS_TABLE} DETACH PARTITION "{name}"'))
+        logger.info("Detached recovery_events partition", partition=name)
+
+    async def archive_partition(self, name: str) -> str:
+        """Stream a detached partition into a compressed archive file"""
+        path = self.archive_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        rows = 0
+
+        async with self.engine.connect() as conn:
+            result = await conn.stream(text(f'SELECT * FROM "{name}" ORDER BY id'))
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                async for row in result.mappings():
+                    f.write(json.dumps(dict(row), default=str))
+                    f.write("\n")
+                    rows += 1
+
+        os.replace(tmp_path, path)
+        logger.info("Archived recovery_events partition", partition=name, rows=rows, path=path)
+        return path
+
+    async def drop_partition(self, name: str) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+
+def read_archive(path: str) -> List[Dict[str, Any]]:
+    """Load an archived partition back into memory"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+if __name__ == "__main__":
+    asyncio.run(PartitionMaintenance().run())
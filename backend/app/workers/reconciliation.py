@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import (
+    FeeLedgerEntry,
+    FeeLedgerEntryType,
+    RecoveryEvent,
+    RecoveryEventCustomerRollup,
+    RecoveryEventRollup,
+    WhopCompany,
+    WhopCustomer,
+)
+from app.services.fee_ledger import balances_select
+import structlog
+
+logger = structlog.get_logger()
+
+FAILED = "payment_failed"
+RECOVERED = "payment_recovered"
+
+# Most discrepancies kept in the report; the counts are always complete
+REPORT_LIMIT = 1000
+
+
+@dataclass
+class Discrepancy:
+    entity: str  # "customer" or "company"
+    entity_id: int
+    company_id: int
+    field: str
+    stored: int
+    expected: int
+
+    @property
+    def delta(self) -> int:
+        return self.expected - self.stored
+
+
+@dataclass
+class ChunkResult:
+    companies: int = 0
+    customers: int = 0
+    customers_skipped: int = 0
+    discrepancies: List[Discrepancy] = field(default_factory=list)
+    repaired: int = 0
+
+
+class ReconciliationJob:
+    """
+    Rebuilds customer and company totals from ``recovery_events``
+
+    Companies are processed in chunks of ``chunk_companies``, up to
+    ``concurrency`` chunks at once. Each chunk streams one grouped scan of
+    its companies' events (sums per customer and event type, fees summed per
+    event in integer cents exactly as the webhook charges them) and compares
+    it with the stored customer totals and the fee ledger balance, all read
+    in one snapshot on Postgres.
+
+    Months retired by partition maintenance survive as rollups: per-company
+    ones count towards company totals and per-customer ones towards customer
+    totals. Customers of a company with a retired month rolled up before
+    per-customer rollups existed can't be verified and are skipped.
+
+    With ``repair`` the differences are applied as relative updates
+    (customers) and ledger adjustment entries (companies), so changes that
+    land while the job runs are kept.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        chunk_companies: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        repair: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.chunk_companies = chunk_companies or settings.RECONCILIATION_CHUNK_COMPANIES
+        self.concurrency = concurrency or settings.RECONCILIATION_CONCURRENCY
+        self.repair = repair
+        self.fee_basis_points = settings.TRANSACTION_FEE_BASIS_POINTS
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with self.session_factory() as db:
+            company_ids = (await db.execute(select(WhopCompany.id).order_by(WhopCompany.id))).scalars().all()
+
+        chunks = [
+            company_ids[i:i + self.chunk_companies]
+            for i in range(0, len(company_ids), self.chunk_companies)
+        ]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def reconcile(chunk: Sequence[int]) -> ChunkResult:
+            async with semaphore:
+                return await self.reconcile_chunk(chunk)
+
+        results = await asyncio.gather(*(reconcile(chunk) for chunk in chunks))
+
+        discrepancies = [d for result in results for d in result.discrepancies]
+        report = {
+            "companies": sum(r.companies for r in results),
+            "customers": sum(r.customers for r in results),
+            "customers_skipped": sum(r.customers_skipped for r in results),
+            "customer_discrepancies": sum(1 for d in discrepancies if d.entity == "customer"),
+            "company_discrepancies": sum(1 for d in discrepancies if d.entity == "company"),
+            "repaired": sum(r.repaired for r in results),
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "discrepancies": [dict(asdict(d), delta=d.delta) for d in discrepancies[:REPORT_LIMIT]],
+        }
+        logger.info("Reconciliation finished", **{k: v for k, v in report.items() if k != "discrepancies"})
+        for d in discrepancies[:REPORT_LIMIT]:
+            logger.warning("Total out of sync", **asdict(d), delta=d.delta)
+        return report
+
+    async def reconcile_chunk(self, company_ids: Sequence[int]) -> ChunkResult:
+        async with self.session_factory() as db:
+            if db.bind.dialect.name == "postgresql":
+                # Events, customer totals and ledger read from one snapshot
+                await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            events = await self._event_totals(db, company_ids)
+            archived = await self._archived_totals(db, company_ids)
+            archived_customers, unverifiable = await self._archived_customer_totals(db, company_ids)
+            customers = (await db.execute(
+                select(
+                    WhopCustomer.id,
+                    WhopCustomer.company_id,
+                    WhopCustomer.total_failed_amount,
+                    WhopCustomer.total_recovered_amount,
+                ).where(WhopCustomer.company_id.in_(company_ids))
+            )).all()
+            balances = (await db.execute(balances_select(company_ids))).all()
+
+        result = ChunkResult(companies=len(company_ids), customers=len(customers))
+        for customer_id, company_id, stored_failed, stored_recovered in customers:
+            if company_id in unverifiable:
+                result.customers_skipped += 1
+                continue
+            for name, stored, event_type in (
+                ("total_failed_amount", stored_failed, FAILED),
+                ("total_recovered_amount", stored_recovered, RECOVERED),
+            ):
+                expected = (
+                    events["customers"].get((customer_id, event_type), 0)
+                    + archived_customers.get((customer_id, event_type), 0)
+                )
+                if (stored or 0) != expected:
+                    result.discrepancies.append(
+                        Discrepancy("customer", customer_id, company_id, name, stored or 0, expected)
+                    )
+
+        for row in balances:
+            recovered, fees = events["companies"].get(row.company_id, (0, 0))
+            archived_recovered, archived_fees = archived.get(row.company_id, (0, 0))
+            expected_recovered = recovered + archived_recovered
+            # Fees charged are taken as recorded; what's owed is accrued minus paid
+            expected_owed = fees + archived_fees - row.total_fees_paid
+            for name, stored, expected in (
+                ("total_recovered", row.total_recovered, expected_recovered),
+                ("total_fees_owed", row.total_fees_owed, expected_owed),
+            ):
+                if stored != expected:
+                    result.discrepancies.append(
+                        Discrepancy("company", row.company_id, row.company_id, name, stored, expected)
+                    )
+
+        if self.repair and result.discrepancies:
+            result.repaired = await self._repair(result.discrepancies)
+        return result
+
+    async def _event_totals(self, db: AsyncSession, company_ids: Sequence[int]) -> Dict[str, Dict]:
+        """Per-customer sums and per-company recovered/fee totals, streamed"""
+        fee = RecoveryEvent.amount * self.fee_basis_points // 10000
+        stream = await db.stream(
+            select(
+                RecoveryEvent.company_id,
+                RecoveryEvent.customer_id,
+                RecoveryEvent.event_type,
+                func.sum(RecoveryEvent.amount),
+                func.sum(fee),
+            )
+            .where(
+                RecoveryEvent.company_id.in_(company_ids),
+                RecoveryEvent.event_type.in_([FAILED, RECOVERED]),
+            )
+            .group_by(RecoveryEvent.company_id, RecoveryEvent.customer_id, RecoveryEvent.event_type)
+            .execution_options(yield_per=10000)
+        )
+        customers: Dict[tuple, int] = {}
+        companies: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        async for company_id, customer_id, event_type, amount, fees in stream:
+            customers[(customer_id, event_type)] = int(amount)
+            if event_type == RECOVERED:
+                companies[company_id][0] += int(amount)
+                companies[company_id][1] += int(fees)
+        return {"customers": customers, "companies": {k: tuple(v) for k, v in companies.items()}}
+
+    async def _archived_totals(self, db: AsyncSession, company_ids: Sequence[int]) -> Dict[int, tuple]:
+        """Recovered amount and fees from rollups of retired months"""
+        # Rollups written before total_fees existed fall back to the month's total
+        fees = func.coalesce(
+            RecoveryEventRollup.total_fees,
+            RecoveryEventRollup.total_amount * self.fee_basis_points // 10000,
+        )
+        rows = (await db.execute(
+            select(
+                RecoveryEventRollup.company_id,
+                func.sum(RecoveryEventRollup.total_amount).filter(RecoveryEventRollup.event_type == RECOVERED),
+                func.sum(fees).filter(RecoveryEventRollup.event_type == RECOVERED),
+            )
+            .where(RecoveryEventRollup.company_id.in_(company_ids))
+            .group_by(RecoveryEventRollup.company_id)
+        )).all()
+        return {company_id: (int(amount or 0), int(fee or 0)) for company_id, amount, fee in rows}
+
+    async def _archived_customer_totals(
+        self, db: AsyncSession, company_ids: Sequence[int]
+    ) -> Tuple[Dict[tuple, int], Set[int]]:
+        """
+        Per-customer sums from retired months, and the companies with a
+        retired month that has no per-customer rollup
+        """
+        rows = (await db.execute(
+            select(
+                RecoveryEventCustomerRollup.customer_id,
+                RecoveryEventCustomerRollup.event_type,
+                func.sum(RecoveryEventCustomerRollup.total_amount),
+            )
+            .where(RecoveryEventCustomerRollup.company_id.in_(company_ids))
+            .group_by(RecoveryEventCustomerRollup.customer_id, RecoveryEventCustomerRollup.event_type)
+        )).all()
+        totals = {(customer_id, event_type): int(amount) for customer_id, event_type, amount in rows}
+
+        covered = select(RecoveryEventCustomerRollup.id).where(
+            RecoveryEventCustomerRollup.company_id == RecoveryEventRollup.company_id,
+            RecoveryEventCustomerRollup.month == RecoveryEventRollup.month,
+        )
+        unverifiable = (await db.execute(
+            select(RecoveryEventRollup.company_id).distinct().where(
+                RecoveryEventRollup.company_id.in_(company_ids),
+                RecoveryEventRollup.event_type.in_([FAILED, RECOVERED]),
+                ~covered.exists(),
+            )
+        )).scalars().all()
+        return totals, set(unverifiable)
+
+    async def _repair(self, discrepancies: List[Discrepancy]) -> int:
+        customer_deltas: Dict[int, Dict[str, int]] = defaultdict(lambda: {"failed": 0, "recovered": 0})
+        company_deltas: Dict[int, Dict[str, int]] = defaultdict(lambda: {"recovered": 0, "owed": 0})
+        for d in discrepancies:
+            if d.entity == "customer":
+                customer_deltas[d.entity_id]["failed" if d.field == "total_failed_amount" else "recovered"] += d.delta
+            else:
+                company_deltas[d.entity_id]["recovered" if d.field == "total_recovered" else "owed"] += d.delta
+
+        async with self.session_factory() as db:
+            if customer_deltas:
+                table = WhopCustomer.__table__
+                await db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("customer_id"))
+                    .values(
+                        total_failed_amount=func.coalesce(table.c.total_failed_amount, 0) + bindparam("failed"),
+                        total_recovered_amount=func.coalesce(table.c.total_recovered_amount, 0) + bindparam("recovered"),
+                    ),
+                    [{"customer_id": cid, **deltas} for cid, deltas in customer_deltas.items()],
+                )
+            if company_deltas:
+                await db.execute(insert(FeeLedgerEntry), [
+                    {
+                        "company_id": company_id,
+                        "entry_type": FeeLedgerEntryType.ADJUSTMENT,
+                        "reference": "reconciliation",
+                        "recovered_delta": deltas["recovered"],
+                        "fees_owed_delta": deltas["owed"],
+                        "fees_paid_delta": 0,
+                    }
+                    for company_id, deltas in company_deltas.items()
+                ])
+            await db.commit()
+        return len(customer_deltas) + len(company_deltas)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild customer and company totals from recovery events")
+    parser.add_argument("--repair", action="store_true", help="apply corrections instead of only reporting")
+    args = parser.parse_args()
+    asyncio.run(ReconciliationJob(repair=args.repair).run())
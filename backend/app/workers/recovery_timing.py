@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models import RecoveryEvent, RecoveryTiming
+from app.services.recovery_timing import build_histograms, recovery_timing_service, slot_delays
+import structlog
+
+logger = structlog.get_logger()
+
+
+def _epoch_seconds(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RecoveryTimingJob:
+    """
+    Rebuilds every company's recovery timing table
+
+    Recoveries from the last ``lookback_days`` are read in one query and
+    bucketed by company and hour of the week with a single ``bincount``;
+    companies with at least ``min_events`` recoveries get their table
+    upserted into ``recovery_timings``.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        lookback_days: Optional[int] = None,
+        min_events: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.lookback_days = lookback_days or settings.RECOVERY_TIMING_LOOKBACK_DAYS
+        self.min_events = min_events or settings.RECOVERY_TIMING_MIN_EVENTS
+
+    async def load_recoveries(self, db: AsyncSession, since: datetime):
+        paid_at = func.coalesce(RecoveryEvent.stripe_created_at, RecoveryEvent.created_at)
+        result = await db.execute(
+            select(RecoveryEvent.company_id, paid_at).where(
+                RecoveryEvent.event_type == "payment_recovered",
+                RecoveryEvent.created_at >= since,
+            )
+        )
+        rows = result.all()
+        company_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        # Normalised in Python: DB timestamps are aware on Postgres and naive on SQLite
+        paid = np.fromiter((_epoch_seconds(row[1]) for row in rows), dtype=np.float64, count=len(rows))
+        return company_ids, paid
+
+    async def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.utcnow()
+        async with self.session_factory() as db:
+            company_ids, paid_at = await self.load_recoveries(db, now - timedelta(days=self.lookback_days))
+            companies, histograms = build_histograms(company_ids, paid_at)
+            samples = histograms.sum(axis=1)
+            eligible = np.flatnonzero(samples >= self.min_events)
+
+            tables = {
+                int(companies[i]): (slot_delays(histograms[i]).tobytes(), int(samples[i]))
+                for i in eligible
+            }
+            existing = {
+                row.company_id: row
+                for row in (await db.execute(
+                    select(RecoveryTiming).where(RecoveryTiming.company_id.in_(list(tables)))
+                )).scalars()
+            }
+            for company_id, (delays, sample_size) in tables.items():
+                row = existing.get(company_id)
+                if row is None:
+                    db.add(RecoveryTiming(company_id=company_id, slot_delays=delays, sample_size=sample_size))
+                else:
+                    row.slot_delays = delays
+                    row.sample_size = sample_size
+            await db.commit()
+
+        recovery_timing_service.invalidate()
+        stats = {"recoveries": len(company_ids), "companies": len(companies), "tables": len(tables)}
+        logger.info("Recovery timing tables rebuilt", **stats)
+        return stats
+
+
+if __name__ == "__main__":
+    asyncio.run(RecoveryTimingJob().run())
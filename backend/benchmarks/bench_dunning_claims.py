@@ -0,0 +1,151 @@
+"""
+Multi-process dunning claim benchmark
+
+Seeds a backlog of due dunning steps, then runs N worker processes that
+lease, "send" (sleep) and complete batches until the backlog is empty.
+Reports throughput per worker count and fails if any step was completed
+by more than one worker.
+
+    python -m benchmarks.bench_dunning_claims --jobs 5000 --workers 1 2 4 8
+    python -m benchmarks.bench_dunning_claims --database-url postgresql+asyncpg://...
+
+SQLite serializes writers, so it shows correctness but little scaling;
+use Postgres to see SKIP LOCKED spread the work.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.database import Base
+from app.models import DunningJob, DunningJobStatus, WhopCompany, WhopCustomer
+from app.workers.dunning_claims import claim_due_jobs, complete_jobs
+
+
+def _engine(url: str):
+    if url.startswith("sqlite"):
+        return create_async_engine(url, connect_args={"timeout": 30})
+    return create_async_engine(url, pool_size=2)
+
+
+async def _seed(url: str, jobs: int) -> None:
+    engine = _engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with factory() as session:
+        await session.execute(delete(DunningJob).where(DunningJob.stripe_invoice_id.like("in_bench_%")))
+        company = (await session.execute(
+            select(WhopCompany).where(WhopCompany.whop_company_id == "biz_bench")
+        )).scalar_one_or_none()
+        if company is None:
+            company = WhopCompany(whop_company_id="biz_bench", whop_owner_id="user_bench", name="Bench Co")
+            session.add(company)
+            await session.flush()
+            customer = WhopCustomer(company_id=company.id, stripe_customer_id="cus_bench", email="b@example.com")
+            session.add(customer)
+            await session.flush()
+        else:
+            customer = (await session.execute(
+                select(WhopCustomer).where(WhopCustomer.company_id == company.id)
+            )).scalars().first()
+
+        due_at = datetime.utcnow() - timedelta(minutes=1)
+        session.add_all([
+            DunningJob(
+                company_id=company.id,
+                customer_id=customer.id,
+                stripe_invoice_id=f"in_bench_{i}",
+                attempt=1,
+                due_at=due_at,
+            )
+            for i in range(jobs)
+        ])
+        await session.commit()
+    await engine.dispose()
+
+
+async def _work(url: str, worker_id: str, batch_size: int, send_ms: float) -> list:
+    engine = _engine(url)
+    factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    completed = []
+
+    async with factory() as session:
+        while True:
+            jobs = await claim_due_jobs(session, worker_id, datetime.utcnow(), limit=batch_size, lease_seconds=60)
+            if not jobs:
+                break
+            await asyncio.sleep(send_ms * len(jobs) / 1000)
+            ids = [job.id for job in jobs]
+            await complete_jobs(session, worker_id, ids, datetime.utcnow())
+            completed.extend(ids)
+
+    await engine.dispose()
+    return completed
+
+
+def _worker(args) -> list:
+    return asyncio.run(_work(*args))
+
+
+async def _sent_count(url: str) -> int:
+    engine = _engine(url)
+    async with engine.connect() as conn:
+        count = (await conn.execute(
+            select(func.count()).select_from(DunningJob).where(
+                DunningJob.stripe_invoice_id.like("in_bench_%"),
+                DunningJob.status == DunningJobStatus.SENT,
+            )
+        )).scalar_one()
+    await engine.dispose()
+    return count
+
+
+def run(url: str, jobs: int, workers: int, batch_size: int, send_ms: float) -> dict:
+    asyncio.run(_seed(url, jobs))
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.map(_worker, [(url, f"bench-{n}", batch_size, send_ms) for n in range(workers)])
+    elapsed = time.perf_counter() - started
+
+    completed = [job_id for ids in results for job_id in ids]
+    duplicates = len(completed) - len(set(completed))
+    sent = asyncio.run(_sent_count(url))
+    return {
+        "workers": workers,
+        "jobs": jobs,
+        "seconds": round(elapsed, 3),
+        "jobs_per_second": round(jobs / elapsed, 1),
+        "duplicates": duplicates,
+        "sent": sent,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--send-ms", type=float, default=1.0, help="simulated send time per step")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench_claims.db')}"
+        for workers in args.workers:
+            result = run(url, args.jobs, workers, args.batch_size, args.send_ms)
+            print(result)
+            if result["duplicates"] or result["sent"] != result["jobs"]:
+                raise SystemExit("dunning steps were double-claimed or lost")
+
+
+if __name__ == "__main__":
+    main()
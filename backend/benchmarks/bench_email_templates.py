@@ -0,0 +1,79 @@
+"""
+Dunning email rendering benchmark
+
+Renders a dunning wave with per-company compiled templates and compares it
+with substituting every field into the raw template for each recipient.
+
+    python -m benchmarks.bench_email_templates --emails 100000 --companies 50
+"""
+import argparse
+import time
+from html import escape
+
+from app.models import WhopCompany
+from app.services.email_templates import (
+    DUNNING_HTML,
+    DUNNING_SUBJECT,
+    DUNNING_TEXT,
+    EmailTemplateService,
+    _PLACEHOLDER,
+    company_fields,
+    recipient_fields,
+)
+
+
+def _companies(count: int):
+    return [
+        WhopCompany(
+            id=i,
+            name=f"Creator {i}",
+            brand_color="#3B82F6",
+            custom_message="Your card was declined. Update it to keep access.",
+            sender_name=f"Creator {i} Billing",
+            settings_version=1,
+        )
+        for i in range(count)
+    ]
+
+
+def render_naive(company: WhopCompany, name: str, email: str):
+    values = {**company_fields(company), **recipient_fields(name, email)}
+    return (
+        _PLACEHOLDER.sub(lambda m: values[m.group(1)], DUNNING_SUBJECT),
+        _PLACEHOLDER.sub(lambda m: escape(values[m.group(1)]), DUNNING_HTML),
+        _PLACEHOLDER.sub(lambda m: values[m.group(1)], DUNNING_TEXT),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Dunning email rendering benchmark")
+    parser.add_argument("--emails", type=int, default=100000)
+    parser.add_argument("--companies", type=int, default=50)
+    args = parser.parse_args()
+
+    companies = _companies(args.companies)
+    recipients = [(companies[i % len(companies)], f"Member {i}", f"member{i}@example.com") for i in range(args.emails)]
+
+    started = time.perf_counter()
+    for company, name, email in recipients:
+        render_naive(company, name, email)
+    naive = time.perf_counter() - started
+
+    service = EmailTemplateService()
+    started = time.perf_counter()
+    for company, name, email in recipients:
+        service.dunning_email(company).render(recipient_fields(name, email))
+    compiled = time.perf_counter() - started
+
+    for label, seconds in (("naive", naive), ("compiled", compiled)):
+        print({
+            "renderer": label,
+            "emails": args.emails,
+            "seconds": round(seconds, 3),
+            "us_per_email": round(seconds / args.emails * 1e6, 2),
+        })
+    print({"speedup": round(naive / compiled, 1)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Middleware stack benchmark
+
+Serves a small JSON endpoint through the previous ``BaseHTTPMiddleware``
+stack (request logging, security headers, request size) and through the
+plain ASGI middlewares that replaced it, and reports requests per second
+for each. The ASGI app is called directly, so only framework and
+middleware cost is measured; log lines below WARNING are filtered out as
+in production.
+
+    python -m benchmarks.bench_middleware --requests 20000 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import numpy as np
+import structlog
+from fastapi import FastAPI, Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware.access_log import AccessLogMiddleware
+from app.middleware.security_headers import RequestSizeMiddleware, SecurityHeadersMiddleware
+
+logger = structlog.get_logger()
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The security headers middleware as it was, with default settings"""
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        response = await call_next(request)
+        if request.url.scheme == "https":
+            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
+        csp_directives = [
+            "default-src 'self'",
+            "script-src 'self' 'unsafe-inline'",
+            "style-src 'self' 'unsafe-inline'",
+            "img-src 'self' data: https:",
+            "font-src 'self'",
+            "connect-src 'self'",
+            "frame-ancestors 'none'",
+            "base-uri 'self'",
+            "form-action 'self'"
+        ]
+        response.headers["Content-Security-Policy"] = "; ".join(csp_directives)
+        if "server" in response.headers:  # Was headers.pop(), which MutableHeaders lacks
+            del response.headers["server"]
+        response.headers["X-Security-Headers"] = "enabled"
+        logger.debug("Security headers applied", path=request.url.path, method=request.method,
+                     status_code=response.status_code)
+        return response
+
+
+class LegacyRequestSizeMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next) -> Response:
+        content_length = request.headers.get("content-length")
+        if content_length and int(content_length) > 16 * 1024 * 1024:
+            return Response(content='{"detail": "Request entity too large"}', status_code=413)
+        return await call_next(request)
+
+
+async def legacy_log_requests(request: Request, call_next):
+    logger.info("Request received", method=request.method, path=request.url.path,
+                client_host=request.client.host if request.client else None)
+    response = await call_next(request)
+    logger.info("Response sent", status_code=response.status_code, method=request.method,
+                path=request.url.path)
+    return response
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+def before() -> FastAPI:
+    app = _app()
+    app.add_middleware(LegacyRequestSizeMiddleware)
+    app.add_middleware(LegacySecurityHeadersMiddleware)
+    app.middleware("http")(legacy_log_requests)
+    return app
+
+
+def after() -> FastAPI:
+    app = _app()
+    app.add_middleware(RequestSizeMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(AccessLogMiddleware)
+    return app
+
+
+async def _request(app, path: str) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"api.chargechase.test"), (b"accept", b"application/json")],
+        "client": ("10.0.0.1", 50000),
+        "server": ("api.chargechase.test", 443),
+    }
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+    finished = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Like a server: the client "disconnects" once the response is sent
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return time.perf_counter() - started
+
+
+async def measure(label: str, app, path: str, requests: int, concurrency: int) -> dict:
+    for _ in range(200):  # Warm up
+        await _request(app, path)
+
+    timings = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            timings.append(await _request(app, path))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = np.array(timings) * 1e6
+    return {
+        "stack": label,
+        "requests": len(timings),
+        "requests_per_second": round(len(timings) / elapsed),
+        "p50_us": round(float(np.percentile(latencies, 50)), 1),
+        "p99_us": round(float(np.percentile(latencies, 99)), 1),
+    }
+
+
+async def run(args) -> None:
+    results = []
+    for label, app in (("BaseHTTPMiddleware", before()), ("ASGI", after())):
+        result = await measure(label, app, args.path, args.requests, args.concurrency)
+        results.append(result)
+        print(result)
+    print({"speedup": round(results[1]["requests_per_second"] / results[0]["requests_per_second"], 2)})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--path", default="/api/health")
+    args = parser.parse_args()
+
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Shared-memory rate limit benchmark
+
+Measures the limiter work slowapi does per request (one sliding-window
+hit per configured limit, ``RateLimits.API_GENERAL`` by default) against
+the ``shm://`` storage, with 1..N worker processes hitting it at once, and
+``memory://`` for reference. Then checks that N processes sharing one key
+are admitted exactly ``limit`` times in total.
+
+    python -m benchmarks.bench_rate_limit --requests 100000 --workers 1 4 8
+
+Fails if the p50 per-request overhead exceeds ``--budget-us`` (50).
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+from limits import parse_many
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from app.core import rate_limit_storage  # noqa: F401 - registers shm://
+from app.middleware.rate_limit import RateLimits
+
+
+def _limiter(uri: str) -> SlidingWindowCounterRateLimiter:
+    return SlidingWindowCounterRateLimiter(storage_from_string(uri))
+
+
+def _requests(args) -> np.ndarray:
+    """Per-request limiter time (seconds) for ``requests`` requests from ``clients`` IPs"""
+    uri, limits, requests, clients, seed = args
+    limiter = _limiter(uri)
+    items = parse_many(limits)
+    rng = np.random.default_rng(seed)
+    ips = [f"10.{seed}.{n // 256}.{n % 256}" for n in rng.integers(0, clients, size=requests)]
+    timings = np.empty(requests)
+    clock = time.perf_counter
+    for i, ip in enumerate(ips):
+        started = clock()
+        for item in items:
+            limiter.hit(item, ip, "/api/v1/whop/companies")
+        timings[i] = clock() - started
+    return timings
+
+
+def _admitted(args) -> int:
+    uri, limit, attempts = args
+    limiter = _limiter(uri)
+    item = parse_many(f"{limit}/hour")[0]
+    return sum(limiter.hit(item, "10.0.0.1", "/shared") for _ in range(attempts))
+
+
+def measure(uri: str, limits: str, requests: int, clients: int, workers: int) -> dict:
+    with multiprocessing.Pool(workers) as pool:
+        started = time.perf_counter()
+        results = pool.map(_requests, [(uri, limits, requests // workers, clients, n) for n in range(workers)])
+        elapsed = time.perf_counter() - started
+    timings = np.concatenate(results) * 1e6
+    return {
+        "storage": uri.split("://")[0],
+        "workers": workers,
+        "requests": int(timings.size),
+        "requests_per_second": round(timings.size / elapsed),
+        "p50_us": round(float(np.percentile(timings, 50)), 2),
+        "p99_us": round(float(np.percentile(timings, 99)), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=10000, help="distinct client IPs")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--limits", default=RateLimits.API_GENERAL)
+    parser.add_argument("--budget-us", type=float, default=50.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shm = f"shm://{os.path.join(tmp, 'ratelimit')}?slots=262144"
+
+        print(measure("memory://", args.limits, args.requests, args.clients, 1))
+        slowest = 0.0
+        for workers in args.workers:
+            result = measure(shm, args.limits, args.requests, args.clients, workers)
+            slowest = max(slowest, result["p50_us"])
+            print(result)
+
+        limit, workers = 500, max(args.workers)
+        with multiprocessing.Pool(workers) as pool:
+            admitted = sum(pool.map(_admitted, [(shm, limit, limit) for _ in range(workers)]))
+        print({"shared_key_limit": limit, "workers": workers, "admitted": admitted})
+
+    if admitted != limit:
+        raise SystemExit(f"{admitted} requests admitted for a limit of {limit}")
+    if slowest > args.budget_us:
+        raise SystemExit(f"p50 limiter overhead {slowest}us is over the {args.budget_us}us budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Fake Resend API for tests and delivery benchmarks
+
+Implements ``POST /emails`` and ``POST /emails/batch`` with configurable
+latency, a per-second request limit answered with 429 + Retry-After, and
+scripted failures. Accepted emails are kept in ``app.state.sent``.
+
+    python -m benchmarks.fake_resend --port 8025 --latency-ms 50
+    RESEND_API_BASE=http://127.0.0.1:8025 python -m app.workers.dunning_scheduler
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_fake_resend(
+    latency_ms: float = 0.0,
+    requests_per_second: Optional[float] = None,
+    fail_statuses: Optional[List[int]] = None,
+) -> FastAPI:
+    """
+    Build the fake API
+
+    ``fail_statuses`` is consumed one status per request before normal
+    handling resumes, e.g. ``[503, 429]`` fails the first two calls.
+    """
+    app = FastAPI(title="Fake Resend")
+    app.state.sent = []
+    app.state.requests = 0
+    app.state.batch_sizes = []
+    app.state.idempotency_keys = []
+    app.state.max_in_flight = 0
+    app.state.fail_statuses = list(fail_statuses or [])
+    ids = itertools.count(1)
+    window = {"second": 0, "count": 0}
+    in_flight = {"count": 0}
+
+    def _throttled() -> bool:
+        if not requests_per_second:
+            return False
+        second = int(time.monotonic())
+        if window["second"] != second:
+            window.update(second=second, count=0)
+        window["count"] += 1
+        return window["count"] > requests_per_second
+
+    async def _accept(emails: list, idempotency_key: Optional[str] = None) -> JSONResponse:
+        app.state.requests += 1
+        app.state.idempotency_keys.append(idempotency_key)
+        if app.state.fail_statuses:
+            status = app.state.fail_statuses.pop(0)
+            return JSONResponse({"message": "scripted failure"}, status_code=status, headers={"Retry-After": "0"})
+        if _throttled():
+            return JSONResponse({"message": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+
+        in_flight["count"] += 1
+        app.state.max_in_flight = max(app.state.max_in_flight, in_flight["count"])
+        try:
+            if latency_ms:
+                await asyncio.sleep(latency_ms / 1000)
+        finally:
+            in_flight["count"] -= 1
+
+        for email in emails:
+            if not email.get("from") or not email.get("to") or not email.get("subject"):
+                return JSONResponse({"message": "Missing required field"}, status_code=422)
+        data = [{"id": f"email_{next(ids)}"} for _ in emails]
+        app.state.sent.extend(emails)
+        app.state.batch_sizes.append(len(emails))
+        return JSONResponse({"data": data})
+
+    @app.post("/emails/batch")
+    async def send_batch(request: Request):
+        emails = await request.json()
+        if not isinstance(emails, list) or not 1 <= len(emails) <= 100:
+            return JSONResponse({"message": "Batch must contain 1-100 emails"}, status_code=422)
+        return await _accept(emails, request.headers.get("idempotency-key"))
+
+    @app.post("/emails")
+    async def send_one(request: Request):
+        response = await _accept([await request.json()])
+        if response.status_code != 200:
+            return response
+        return JSONResponse(json.loads(response.body)["data"][0])
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake Resend API")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--requests-per-second", type=float, default=None)
+    args = parser.parse_args()
+    uvicorn.run(create_fake_resend(args.latency_ms, args.requests_per_second), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Deterministic dunning simulation
+
+Generates a seeded stream of Stripe invoice failures and recoveries and plays
+it against a virtual clock. Each event goes through the real
+``handle_stripe_webhook``. Due steps fire through the real
+``DunningScheduler`` and ``send_dunning_emails``, which send to the fake
+Resend API in-process. The report covers throughput, scheduling lag
+(virtual seconds), query counts and peak Python memory.
+
+The scheduler wakes when it next has work, as ``run_forever`` does, or on a
+fixed ``--tick-seconds`` cadence. Wall time it spends working is charged to
+the virtual clock (times ``--time-scale``), so lag reflects slow pages and
+sends rather than being zero by construction.
+
+    python -m benchmarks.simulate_dunning --companies 100 --customers 20000
+    python -m benchmarks.simulate_dunning --companies 10000 --customers 1000000 \\
+        --database-url postgresql://localhost/chargechase_sim
+
+Runs offline: SQLite in a temporary file by default, or any Postgres URL.
+The schema at the target database is dropped and recreated.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+import structlog
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.api.routes.whop import handle_stripe_webhook
+from app.core.database import Base
+from app.middleware.rate_limit import limiter
+from app.models import DunningJob, WhopCompany
+from app.services.email_delivery import EmailDeliveryService
+from app.services.suppression import SuppressionIndex
+from app.workers import dunning_emails
+from app.workers.dunning_scheduler import DunningScheduler
+from benchmarks.fake_resend import create_fake_resend
+
+SIM_START = datetime(2024, 1, 1)
+RETRY_SCHEDULES = ("1,3,7", "1,2,5", "2,4,8", "1,3")
+MAX_SCHEDULE_DAYS = 8
+
+
+@dataclass(order=True)
+class SimEvent:
+    at: float  # Virtual seconds since SIM_START
+    seq: int
+    kind: str = field(compare=False)  # 'failed' or 'recovered'
+    company: int = field(compare=False)
+    customer: int = field(compare=False)
+    invoice: str = field(compare=False)
+    amount: int = field(compare=False)
+
+
+class VirtualClock:
+    """Simulated time; inside ``charging()`` scaled wall time passes on it too"""
+
+    def __init__(self, now: datetime, scale: float = 1.0):
+        self.now = now
+        self.scale = scale
+        self._started: Optional[float] = None
+
+    def __call__(self) -> datetime:
+        if self._started is None:
+            return self.now
+        return self.now + timedelta(seconds=(time.perf_counter() - self._started) * self.scale)
+
+    @contextmanager
+    def charging(self):
+        self._started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.now = self()
+            self._started = None
+
+
+def next_tick(when: datetime, tick_seconds: float) -> datetime:
+    """First point of a ``tick_seconds`` cadence (from SIM_START) at or after ``when``"""
+    ticks = math.ceil((when - SIM_START).total_seconds() / tick_seconds)
+    return SIM_START + timedelta(seconds=ticks * tick_seconds)
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+
+def generate_events(
+    seed: int,
+    companies: int,
+    customers: int,
+    days: int,
+    failure_rate: float,
+    recovery_rate: float,
+    multi_invoice_rate: float,
+) -> List[SimEvent]:
+    """Seeded failure/recovery stream, sorted by virtual time"""
+    rng = random.Random(seed)
+    horizon = days * 86400
+    events: List[SimEvent] = []
+
+    def add(at, kind, company, customer, invoice, amount):
+        events.append(SimEvent(at, len(events), kind, company, customer, invoice, amount))
+
+    for customer in range(customers):
+        if rng.random() >= failure_rate:
+            continue
+        company = customer % companies
+        failed_at = rng.uniform(0, horizon)
+        invoices = 2 if rng.random() < multi_invoice_rate else 1
+        for n in range(invoices):
+            # Amounts stay under $100 so no immediate Whop fee charge is attempted
+            amount = rng.randrange(500, 9900)
+            invoice = f"in_sim_{customer}_{n}"
+            at = failed_at + n * rng.uniform(0, 300)
+            add(at, "failed", company, customer, invoice, amount)
+            if rng.random() < recovery_rate:
+                add(at + rng.expovariate(1 / (2 * 86400)), "recovered", company, customer, invoice, amount)
+
+    events.sort()
+    return events
+
+
+def stripe_event(sim: SimEvent) -> bytes:
+    failed = sim.kind == "failed"
+    created = SIM_START + timedelta(seconds=sim.at)
+    invoice = {
+        "id": sim.invoice,
+        "customer": f"cus_sim_{sim.customer}",
+        "customer_email": f"member{sim.customer}@example.com",
+        "customer_name": f"Member {sim.customer}",
+        "currency": "usd",
+        "amount_due" if failed else "amount_paid": sim.amount,
+    }
+    return json.dumps({
+        "id": f"evt_sim_{sim.seq}",
+        "type": "invoice.payment_failed" if failed else "invoice.payment_succeeded",
+        "created": int((created - datetime(1970, 1, 1)).total_seconds()),
+        "data": {"object": invoice},
+    }).encode()
+
+
+def make_request(body: bytes) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/webhooks/stripe",
+        "headers": [(b"content-type", b"application/json")],
+        "query_string": b"",
+    }
+    return Request(scope, receive)
+
+
+def _urls(database_url: str, tmp: str):
+    if not database_url:
+        path = os.path.join(tmp, "simulate_dunning.db")
+        return f"sqlite:///{path}", f"sqlite+aiosqlite:///{path}"
+    base = database_url.replace("postgresql+asyncpg://", "postgresql://")
+    return base, base.replace("postgresql://", "postgresql+asyncpg://")
+
+
+async def simulate(args, tmp: str) -> Dict[str, object]:
+    sync_url, async_url = _urls(args.database_url, tmp)
+    sqlite = sync_url.startswith("sqlite")
+    sync_engine = create_engine(sync_url, connect_args={"timeout": 30} if sqlite else {})
+    async_engine = create_async_engine(async_url, connect_args={"timeout": 30} if sqlite else {})
+    Base.metadata.drop_all(bind=sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
+
+    with sync_engine.begin() as conn:
+        conn.execute(insert(WhopCompany), [
+            {
+                "whop_company_id": f"biz_sim_{i}",
+                "whop_owner_id": f"user_sim_{i}",
+                "name": f"Creator {i}",
+                "retry_schedule": RETRY_SCHEDULES[i % len(RETRY_SCHEDULES)],
+                "settings_version": 1,
+                "dunning_enabled": True,
+                "email_enabled": True,
+                "total_recovered": 0,
+                "total_fees_owed": 0,
+                "total_fees_paid": 0,
+            }
+            for i in range(args.companies)
+        ])
+
+    events = generate_events(
+        args.seed, args.companies, args.customers, args.days,
+        args.failure_rate, args.recovery_rate, args.multi_invoice_rate,
+    )
+
+    fake = create_fake_resend()
+    dunning_emails.email_delivery_service = EmailDeliveryService(
+        api_key="re_sim", base_url="http://resend.sim", domain_rate=1e6, domain_burst=1e6,
+        transport=httpx.ASGITransport(app=fake),
+    )
+    dunning_emails.suppression_index = SuppressionIndex()
+
+    # Webhooks are replayed in virtual time; wall-clock rate limits don't apply
+    limiter.enabled = False
+
+    webhook_queries = QueryCounter(sync_engine)
+    scheduler_queries = QueryCounter(async_engine.sync_engine)
+    SessionLocal = sessionmaker(bind=sync_engine)
+    clock = VirtualClock(SIM_START, scale=args.time_scale)
+    scheduler = DunningScheduler(
+        dunning_emails.send_dunning_emails,
+        async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False),
+        page_size=args.page_size,
+        poll_seconds=args.poll_seconds,
+        clock=clock,
+    )
+
+    end = SIM_START + timedelta(days=args.days + MAX_SCHEDULE_DAYS)
+    webhook_seconds = 0.0
+    scheduler_seconds = 0.0
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    with clock.charging():
+        await scheduler.run_due()
+    i = 0
+    while clock.now < end:
+        next_event = SIM_START + timedelta(seconds=events[i].at) if i < len(events) else None
+        wakeup = scheduler.next_wakeup()
+        if wakeup is not None and args.tick_seconds:
+            wakeup = next_tick(wakeup, args.tick_seconds)
+        targets = [t for t in (next_event, wakeup) if t is not None]
+        if not targets:
+            break
+        clock.now = max(clock.now, min(min(targets), end))
+
+        if next_event is not None and next_event <= clock.now:
+            sim = events[i]
+            i += 1
+            t0 = time.perf_counter()
+            with SessionLocal() as db:
+                await handle_stripe_webhook(f"biz_sim_{sim.company}", make_request(stripe_event(sim)), db)
+            webhook_seconds += time.perf_counter() - t0
+        else:
+            t0 = time.perf_counter()
+            with clock.charging():
+                await scheduler.run_due()
+            scheduler_seconds += time.perf_counter() - t0
+
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with SessionLocal() as db:
+        steps = db.execute(select(func.count()).select_from(DunningJob)).scalar_one()
+
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+    metrics = scheduler.metrics.snapshot()
+    return {
+        "database": "sqlite" if sqlite else "postgres",
+        "companies": args.companies,
+        "customers": args.customers,
+        "virtual_days": args.days,
+        "tick_seconds": args.tick_seconds,
+        "time_scale": args.time_scale,
+        "webhooks": len(events),
+        "dunning_steps": steps,
+        "steps_fired": metrics["fired"],
+        "emails_sent": len(fake.state.sent),
+        "email_requests": fake.state.requests,
+        "wall_seconds": round(elapsed, 2),
+        "webhooks_per_second": round(len(events) / webhook_seconds, 1) if webhook_seconds else None,
+        "steps_per_second": round(metrics["fired"] / scheduler_seconds, 1) if scheduler_seconds else None,
+        "lag_p50_seconds": metrics["lag_p50_seconds"],
+        "lag_p95_seconds": metrics["lag_p95_seconds"],
+        "lag_p99_seconds": metrics["lag_p99_seconds"],
+        "lag_max_seconds": metrics["lag_max_seconds"],
+        "pages_loaded": metrics["pages_loaded"],
+        "webhook_queries": webhook_queries.count,
+        "queries_per_webhook": round(webhook_queries.count / len(events), 1) if events else 0,
+        "scheduler_queries": scheduler_queries.count,
+        "peak_python_memory_mb": round(peak / 2 ** 20, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deterministic dunning simulation")
+    parser.add_argument("--database-url", default="", help="Postgres URL; default is a temporary SQLite file")
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=14, help="virtual days of failures")
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--recovery-rate", type=float, default=0.5)
+    parser.add_argument("--multi-invoice-rate", type=float, default=0.1)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--poll-seconds", type=float, default=900, help="virtual seconds between scheduler polls")
+    parser.add_argument("--tick-seconds", type=float, default=0,
+                        help="wake the scheduler only on this virtual cadence; 0 wakes it when work is due")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="virtual seconds that pass per wall second the scheduler spends working")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Per-event info logs would dominate the run time
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(json.dumps(asyncio.run(simulate(args, tmp)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
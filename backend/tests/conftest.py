@@ -1,9 +1,17 @@
 """Test configuration and fixtures for ChargeChase backend."""
 import os
 import asyncio
+from datetime import datetime, timedelta
+
 import pytest
 import pytest_asyncio
+
+# Keep rate limit counters per test process instead of in shared memory
+os.environ.setdefault("RATE_LIMIT_STORAGE_URI", "memory://")
+
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -67,6 +75,49 @@ def client(db_session):
     yield client
     app.dependency_overrides.clear()
 
+class FakeClock:
+    """Clock for code that takes ``clock=``: returns ``now`` until a test moves it"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        step = timedelta(**kwargs)
+        self.now += step if isinstance(self.now, datetime) else step.total_seconds()
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    """A SQLite file with every table created, shared by the sync and async fixtures."""
+    path = tmp_path / "test.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def make_session(sqlite_path):
+    """Sessionmaker for services that take a sync session."""
+    engine = create_engine(f"sqlite:///{sqlite_path}")
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_path):
+    """Async sessionmaker for workers, on the same file as ``make_session``.
+
+    Test modules override this fixture to seed their own rows.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{sqlite_path}")
+    yield async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
 @pytest.fixture
 def sample_user_data():
     """Sample user data for testing."""
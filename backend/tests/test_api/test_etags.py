@@ -0,0 +1,171 @@
+"""Tests for ETags and conditional GETs on company endpoints."""
+from datetime import datetime
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.testclient import TestClient
+from slowapi.errors import RateLimitExceeded
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.api.routes.whop import company_etag
+from app.core.database import Base, get_db, get_read_db
+from app.core.etags import etag_matches, make_etag
+from app.core.whop_auth import get_current_whop_user, whop_auth_service
+from app.middleware.rate_limit import (
+    PLAN_LIMITS,
+    company_key,
+    limiter,
+    plan_limits,
+    rate_limit_handler,
+    tenant_plans,
+)
+from app.models import WhopCompany, WhopUser
+from app.models.user import PlanType
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'etags.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme"))
+        session.commit()
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        session.info["statements"] = statements
+        yield session
+    engine.dispose()
+
+
+async def endpoint(request: Request):
+    return {}
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "endpoint": endpoint})
+
+
+app = FastAPI()
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
+
+
+@app.get("/companies/{company_id}/settings")
+@limiter.limit(plan_limits)
+async def company_settings(company_id: str, request: Request, etag=Depends(company_etag("settings"))):
+    return {"etag": etag}
+
+
+@pytest.fixture
+def client(session, monkeypatch):
+    async def company_from_whop(company_id, token):
+        return {"owner_id": "user_1", "name": "Acme"}
+
+    monkeypatch.setitem(PLAN_LIMITS, PlanType.STARTER, "2/minute")
+    monkeypatch.setitem(PLAN_LIMITS, PlanType.PRO, "3/minute")
+    monkeypatch.setattr(whop_auth_service, "get_company_from_whop", company_from_whop)
+    monkeypatch.setitem(app.dependency_overrides, get_current_whop_user, lambda: WhopUser(whop_user_id="user_1"))
+    monkeypatch.setitem(app.dependency_overrides, get_db, lambda: session)
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, lambda: session)
+    limiter.reset()
+    tenant_plans.clear()
+    yield TestClient(app, headers={"Authorization": "Bearer token"})
+    limiter.reset()
+    tenant_plans.clear()
+
+
+async def check(session, resource="settings", if_none_match=None, **options):
+    response = Response()
+    company = session.query(WhopCompany).one()
+    session.info["statements"].clear()
+    etag = await company_etag(resource, **options)(request(if_none_match), response, company=company, db=session)
+    return etag, response
+
+
+@pytest.mark.unit
+class TestConditionalGet:
+    """Test ETag matching and 304s driven by the company data version."""
+
+    def test_etag_matching(self):
+        """Test If-None-Match lists, weak validators and the wildcard."""
+        etag = make_etag("settings", 3)
+
+        assert etag == '"settings-3"'
+        assert etag_matches('"settings-2", "settings-3"', etag)
+        assert etag_matches('W/"settings-3"', etag)
+        assert etag_matches("*", etag)
+        assert not etag_matches('"settings-2"', etag)
+        assert not etag_matches(None, etag)
+
+    @pytest.mark.asyncio
+    async def test_sets_etag_from_the_version_column_only(self, session):
+        """Test that the check reads data_version alone and sets the ETag."""
+        etag, response = await check(session)
+
+        assert response.headers["etag"] == etag == '"settings-1"'
+        assert response.headers["cache-control"] == "private, no-cache"
+        (statement,) = session.info["statements"]
+        assert "data_version" in statement and "whop_companies.name" not in statement
+
+    @pytest.mark.asyncio
+    async def test_matching_etag_answers_304(self, session):
+        """Test that a client holding the current ETag gets 304."""
+        with pytest.raises(HTTPException) as raised:
+            await check(session, if_none_match='"settings-1"')
+
+        assert raised.value.status_code == 304
+        assert raised.value.headers["ETag"] == '"settings-1"'
+
+    @pytest.mark.asyncio
+    async def test_version_bump_invalidates(self, session):
+        """Test that bumping the version makes the old ETag stale."""
+        company = session.query(WhopCompany).one()
+        company.data_version = WhopCompany.data_version + 1
+        session.commit()
+
+        etag, _ = await check(session, if_none_match='"settings-1"')
+        assert etag == '"settings-2"'
+
+    def test_not_modified_answers_count_against_the_plan_limit(self, client):
+        """Test that 304s are rate limited and fill the tenant's plan."""
+        statuses = [
+            client.get("/companies/biz_1/settings", headers={"If-None-Match": '"settings-1"'}).status_code
+            for _ in range(3)
+        ]
+
+        assert statuses == [304, 304, 429]
+        assert tenant_plans.get(company_key("biz_1")) == PlanType.STARTER
+
+    def test_not_modified_answers_use_the_company_plan(self, client, session):
+        """Test that the tier comes from the company row even on a cold cache."""
+        session.query(WhopCompany).one().plan = PlanType.PRO
+        session.commit()
+
+        statuses = [
+            client.get("/companies/biz_1/settings", headers={"If-None-Match": '"settings-1"'}).status_code
+            for _ in range(4)
+        ]
+
+        assert statuses == [304, 304, 304, 429]
+
+    def test_users_without_access_get_403_not_304(self, client, monkeypatch):
+        """Test that other users can't read the version or spend the company's budget."""
+        monkeypatch.setitem(app.dependency_overrides, get_current_whop_user, lambda: WhopUser(whop_user_id="user_2"))
+
+        responses = [client.get("/companies/biz_1/settings", headers={"If-None-Match": "*"}) for _ in range(3)]
+
+        assert [response.status_code for response in responses] == [403, 403, 403]
+        assert all("etag" not in response.headers for response in responses)
+
+        monkeypatch.setitem(app.dependency_overrides, get_current_whop_user, lambda: WhopUser(whop_user_id="user_1"))
+        assert client.get("/companies/biz_1/settings").status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_stats_etag_includes_the_month(self, session):
+        """Test that the stats ETag changes when the month rolls over."""
+        etag, _ = await check(session, "stats", monthly=True)
+
+        assert etag == f'"stats-1-{datetime.utcnow():%Y%m}"'
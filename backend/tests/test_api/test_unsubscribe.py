@@ -0,0 +1,68 @@
+"""Tests for the unsubscribe link and one-click unsubscribe."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.routes.whop import router
+from app.core.database import Base, get_db
+from app.models import WhopCompany, WhopCustomer
+from app.services.suppression import suppression_index, unsubscribe_token
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'unsubscribe.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme"))
+        session.flush()
+        session.add(WhopCustomer(company_id=1, stripe_customer_id="cus_1", email="ann@example.com"))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def client(session):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = lambda: session
+    suppression_index.discard(1, "ann@example.com")
+    yield TestClient(app)
+    suppression_index.discard(1, "ann@example.com")
+
+
+def link(email="ann@example.com"):
+    return {"company": 1, "email": email, "token": unsubscribe_token(1, email)}
+
+
+@pytest.mark.unit
+class TestUnsubscribe:
+    """Test that following the link changes nothing until the form is posted."""
+
+    def test_get_only_shows_a_confirmation_form(self, client, session):
+        """Test that a GET (e.g. a link scanner) doesn't suppress the address."""
+        response = client.get("/whop/unsubscribe", params=link())
+
+        assert response.status_code == 200
+        assert '<form method="post"' in response.text
+        assert not session.query(WhopCustomer).one().dont_email
+        assert not suppression_index.is_suppressed(1, "ann@example.com")
+
+    def test_post_suppresses_the_address(self, client, session):
+        """Test the form submit and RFC 8058 one-click POST."""
+        response = client.post("/whop/unsubscribe", params=link(), data={"List-Unsubscribe": "One-Click"})
+
+        assert response.status_code == 200
+        session.expire_all()
+        assert session.query(WhopCustomer).one().dont_email
+        assert suppression_index.is_suppressed(1, "ann@example.com")
+
+    def test_bad_token_is_rejected(self, client):
+        """Test that links can't be forged for other addresses."""
+        params = dict(link(), email="bob@example.com")
+
+        assert client.get("/whop/unsubscribe", params=params).status_code == 400
+        assert client.post("/whop/unsubscribe", params=params).status_code == 400
@@ -0,0 +1,147 @@
+"""Tests for the stale-while-revalidate cache."""
+import asyncio
+
+import pytest
+
+from app.core.cache import SharedGenerations, StaleWhileRevalidateCache
+from app.core.rate_limit_storage import SharedMemoryStorage
+from conftest import FakeClock
+
+
+class Loader:
+    """Returns 1, 2, 3, ... and counts calls; can be held open or made to fail"""
+
+    def __init__(self):
+        self.calls = 0
+        self.gate = None
+        self.fail = False
+
+    async def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return self.calls
+
+
+@pytest.mark.unit
+class TestStaleWhileRevalidateCache:
+    """Test fresh hits, stale serving, single-flight loads and invalidation."""
+
+    @pytest.mark.asyncio
+    async def test_fresh_entry_is_served_without_loading(self):
+        """Test that a fresh entry doesn't call the loader again."""
+        clock = FakeClock()
+        cache = StaleWhileRevalidateCache(60, 600, clock=clock)
+        loader = Loader()
+
+        assert await cache.get("biz_1", loader) == 1
+        clock.now += 59
+        assert await cache.get("biz_1", loader) == 1
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_entry_is_served_while_refreshing(self):
+        """Test that a stale entry returns at once and is refreshed in the background."""
+        clock = FakeClock()
+        cache = StaleWhileRevalidateCache(60, 600, clock=clock)
+        loader = Loader()
+        await cache.get("biz_1", loader)
+
+        clock.now += 120
+        assert await cache.get("biz_1", loader) == 1
+        assert await cache.get("biz_1", loader) == 1  # Refresh already in flight
+        await asyncio.sleep(0)
+        assert await cache.get("biz_1", loader) == 2
+        assert loader.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_keeps_stale_value(self):
+        """Test that an upstream error doesn't drop the stale entry."""
+        clock = FakeClock()
+        cache = StaleWhileRevalidateCache(60, 600, clock=clock)
+        loader = Loader()
+        await cache.get("biz_1", loader)
+
+        loader.fail = True
+        clock.now += 120
+        assert await cache.get("biz_1", loader) == 1
+        await asyncio.sleep(0)
+        assert await cache.get("biz_1", loader) == 1
+
+        clock.now += 600
+        with pytest.raises(RuntimeError):
+            await cache.get("biz_1", loader)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_load(self):
+        """Test that simultaneous misses wait on a single loader call."""
+        cache = StaleWhileRevalidateCache(60, 600, clock=FakeClock())
+        loader = Loader()
+        loader.gate = asyncio.Event()
+
+        waiting = [asyncio.ensure_future(cache.get("biz_1", loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.gate.set()
+
+        assert await asyncio.gather(*waiting) == [1] * 5
+        assert loader.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidate_discards_a_load_in_flight(self):
+        """Test that data loaded before an invalidation isn't cached."""
+        cache = StaleWhileRevalidateCache(60, 600, clock=FakeClock())
+        loader = Loader()
+        loader.gate = asyncio.Event()
+
+        pending = asyncio.ensure_future(cache.get("biz_1", loader))
+        await asyncio.sleep(0)
+        cache.invalidate("biz_1")
+        loader.gate.set()
+        assert await pending == 1
+
+        assert await cache.get("biz_1", loader) == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_invalidation_reaches_other_workers(self, tmp_path):
+        """Test that invalidate and clear in one worker drop the entry in another."""
+        def worker():
+            # Each worker maps the file itself, as separate processes do
+            storage = SharedMemoryStorage(f"shm://{tmp_path / 'cache'}", slots=1024)
+            return StaleWhileRevalidateCache(60, 600, clock=FakeClock(), shared=SharedGenerations(storage, "pm", 660))
+
+        first, second = worker(), worker()
+        loader = Loader()
+
+        assert await second.get("biz_1", loader) == 1
+        assert await second.get("biz_2", loader) == 2
+        first.invalidate("biz_1")
+        assert await second.get("biz_1", loader) == 3
+        assert await second.get("biz_2", loader) == 2
+
+        first.clear()
+        assert await second.get("biz_2", loader) == 4
+
+    @pytest.mark.asyncio
+    async def test_expired_generation_does_not_revive_old_entries(self, tmp_path):
+        """Test that a counter that expired and was bumped again doesn't match entries loaded before."""
+        clock = FakeClock()
+
+        def worker():
+            storage = SharedMemoryStorage(f"shm://{tmp_path / 'cache'}", slots=1024, clock=clock)
+            shared = SharedGenerations(storage, "pm", 660, clock=clock)
+            return StaleWhileRevalidateCache(60, 600, clock=clock, shared=shared)
+
+        first, second = worker(), worker()
+        loader = Loader()
+
+        first.invalidate("biz_1")
+        clock.now += 600
+        assert await second.get("biz_1", loader) == 1
+
+        # The counter has expired by now, while the entry is still being served stale
+        clock.now += 100
+        first.invalidate("biz_1")
+
+        assert await second.get("biz_1", loader) == 2
@@ -0,0 +1,71 @@
+"""Tests for the shared-memory rate limit storage."""
+import multiprocessing
+
+import pytest
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from app.core.rate_limit_storage import SharedMemoryStorage
+from conftest import FakeClock
+
+START = 1_700_000_080.0  # 40s into a minute window
+
+
+def _hit_shared(path):
+    limiter = SlidingWindowCounterRateLimiter(SharedMemoryStorage(f"shm://{path}", slots=1024))
+    return sum(limiter.hit(parse("50/hour"), "10.0.0.1") for _ in range(50))
+
+
+@pytest.mark.unit
+class TestSharedMemoryStorage:
+    """Test sliding-window semantics and sharing between storages."""
+
+    def test_sliding_window_weights_previous_window(self, tmp_path):
+        """Test that the previous window's hits count in proportion to overlap."""
+        clock = FakeClock(START)
+        limiter = SlidingWindowCounterRateLimiter(SharedMemoryStorage(f"shm://{tmp_path / 'rl'}", slots=1024, clock=clock))
+        item = parse("10/minute")
+
+        assert all(limiter.hit(item, "ip") for _ in range(10))
+        assert not limiter.hit(item, "ip")
+
+        # 15s into the next window: 45/60 of the previous 10 hits still count
+        clock.now += 35
+        assert [limiter.hit(item, "ip") for _ in range(4)] == [True, True, True, False]
+
+        # Two windows later every earlier hit has aged out
+        clock.now += 120
+        assert all(limiter.hit(item, "ip") for _ in range(10))
+
+    def test_storages_on_one_file_share_counters(self, tmp_path):
+        """Test that two storages (as in two workers) see the same counts."""
+        path = tmp_path / "rl"
+        first = SlidingWindowCounterRateLimiter(SharedMemoryStorage(f"shm://{path}", slots=1024))
+        second = SlidingWindowCounterRateLimiter(SharedMemoryStorage(f"shm://{path}", slots=1024))
+        item = parse("4/minute")
+
+        assert [first.hit(item, "ip"), second.hit(item, "ip"), first.hit(item, "ip"), second.hit(item, "ip")] == [True] * 4
+        assert not first.hit(item, "ip")
+        assert not second.hit(item, "ip")
+        assert second.get_window_stats(item, "ip").remaining == 0
+        assert first.hit(item, "other-ip")
+
+    def test_processes_are_admitted_exactly_up_to_the_limit(self, tmp_path):
+        """Test that concurrent processes never overshoot a shared limit."""
+        path = tmp_path / "rl"
+        SharedMemoryStorage(f"shm://{path}", slots=1024)
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            assert sum(pool.map(_hit_shared, [path] * 4)) == 50
+
+    def test_fixed_window_and_clear(self, tmp_path):
+        """Test the fixed-window counters and clearing a key."""
+        clock = FakeClock(START)
+        storage = SharedMemoryStorage(f"shm://{tmp_path / 'rl'}", slots=1024, clock=clock)
+        limiter = FixedWindowRateLimiter(storage)
+        item = parse("2/minute")
+
+        assert [limiter.hit(item, "ip") for _ in range(3)] == [True, True, False]
+        limiter.clear(item, "ip")
+        assert limiter.hit(item, "ip")
+        clock.now += 61
+        assert storage.get(item.key_for("ip")) == 0
@@ -0,0 +1,124 @@
+"""Tests for primary/replica session routing."""
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from fastapi import Response
+
+from app.core.database import READ_PRIMARY_HEADER, SessionRouter
+from conftest import FakeClock
+
+
+async def _sessionmaker(path, role):
+    """Create a SQLite database that reports which role it plays."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE role (name TEXT)"))
+        await conn.execute(text("INSERT INTO role VALUES (:name)"), {"name": role})
+    return engine, async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _role(router, key=None, read_primary_until=None):
+    sessionmaker = await router.read_sessionmaker(key, read_primary_until)
+    async with sessionmaker() as session:
+        return (await session.execute(text("SELECT name FROM role"))).scalar()
+
+
+@pytest_asyncio.fixture
+async def databases(tmp_path):
+    primary_engine, primary = await _sessionmaker(tmp_path / "primary.db", "primary")
+    replica_engine, replica = await _sessionmaker(tmp_path / "replica.db", "replica")
+    yield primary, replica
+    await primary_engine.dispose()
+    await replica_engine.dispose()
+
+
+@pytest.mark.unit
+class TestSessionRouter:
+    """Test replica selection, lag fallback and read-after-write pinning."""
+
+    @pytest.mark.asyncio
+    async def test_reads_use_replica(self, databases):
+        """Test that healthy replicas serve reads."""
+        primary, replica = databases
+        router = SessionRouter(primary, replica)
+
+        assert await _role(router, "biz_1") == "replica"
+
+    @pytest.mark.asyncio
+    async def test_without_replica_reads_use_primary(self, databases):
+        """Test that routing is a no-op when no replica is configured."""
+        primary, _ = databases
+        router = SessionRouter(primary)
+        router.mark_write("biz_1")
+
+        assert await _role(router, "biz_1") == "primary"
+
+    @pytest.mark.asyncio
+    async def test_write_pins_key_to_primary(self, databases):
+        """Test read-after-write stickiness for the written key only."""
+        primary, replica = databases
+        clock = FakeClock()
+        router = SessionRouter(primary, replica, sticky_seconds=10, clock=clock)
+
+        router.mark_write("biz_1")
+
+        assert await _role(router, "biz_1") == "primary"
+        assert await _role(router, "biz_2") == "replica"
+
+        clock.now += 11
+        assert await _role(router, "biz_1") == "replica"
+
+    @pytest.mark.asyncio
+    async def test_client_carries_the_pin_to_other_workers(self, databases):
+        """Test that the header from a write pins that client's reads in any process."""
+        primary, replica = databases
+        wall = FakeClock()
+        writer = SessionRouter(primary, replica, sticky_seconds=10, wall_clock=wall)
+        other_worker = SessionRouter(primary, replica, sticky_seconds=10, wall_clock=wall)
+        response = Response()
+
+        writer.mark_write("biz_1", response)
+        pin = response.headers[READ_PRIMARY_HEADER]
+
+        assert await _role(other_worker, "biz_1") == "replica"
+        assert await _role(other_worker, "biz_1", pin) == "primary"
+        assert await _role(other_worker, "biz_1", str(wall.now + 3600)) == "replica"
+        assert await _role(other_worker, "biz_1", "garbage") == "replica"
+
+        wall.now += 11
+        assert await _role(other_worker, "biz_1", pin) == "replica"
+
+    @pytest.mark.asyncio
+    async def test_lagging_replica_falls_back(self, databases):
+        """Test that replica lag above the threshold routes to the primary."""
+        primary, replica = databases
+        clock = FakeClock()
+        lag = {"value": 30.0}
+
+        async def probe(session):
+            return lag["value"]
+
+        router = SessionRouter(
+            primary, replica, max_lag_seconds=5, lag_check_seconds=1, lag_probe=probe, clock=clock
+        )
+        assert await _role(router) == "primary"
+
+        # The cached measurement is reused until the check interval passes
+        lag["value"] = 0.5
+        assert await _role(router) == "primary"
+        clock.now += 1
+        assert await _role(router) == "replica"
+
+    @pytest.mark.asyncio
+    async def test_failed_lag_probe_falls_back(self, databases):
+        """Test that an unreachable replica routes reads to the primary."""
+        primary, replica = databases
+
+        async def probe(session):
+            raise RuntimeError("replica down")
+
+        router = SessionRouter(primary, replica, lag_probe=probe)
+
+        assert await _role(router) == "primary"
@@ -0,0 +1,142 @@
+"""Tests for tenant- and plan-aware rate limiting."""
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from limits import parse_many
+from slowapi.errors import RateLimitExceeded
+from slowapi.util import get_remote_address
+
+from app.core.database import get_db
+from app.core.security import create_access_token
+from app.core.whop_auth import get_whop_company_with_auth, whop_auth_service
+from app.middleware import rate_limit
+from app.middleware.rate_limit import (
+    PLAN_LIMITS,
+    RateLimits,
+    company_key,
+    limiter,
+    plan_limits,
+    rate_limit_handler,
+    remember_tenant_plan,
+    tenant_key,
+    tenant_plans,
+    webhook_key,
+)
+from app.models.user import PlanType
+
+app = FastAPI()
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
+
+
+@app.get("/companies/{company_id}/stats")
+@limiter.limit(plan_limits)
+async def company_stats(company_id: str, request: Request):
+    return {"company_id": company_id}
+
+
+@app.get("/me")
+@limiter.limit(plan_limits)
+async def me(request: Request):
+    return {"key": tenant_key(request)}
+
+
+@app.post("/webhooks/stripe/{company_id}")
+@limiter.limit("2/minute", key_func=webhook_key)
+@limiter.shared_limit("5/minute", scope="stripe_webhooks", key_func=get_remote_address)
+async def stripe_webhook(company_id: str, request: Request):
+    return {"status": "processed"}
+
+
+@app.get("/companies/{company_id}/settings")
+@limiter.limit(plan_limits)
+async def company_settings(company_id: str, request: Request, company=Depends(get_whop_company_with_auth)):
+    return {"company_id": company_id}
+
+
+app.dependency_overrides[get_db] = lambda: None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(rate_limit, "auth_failure_limits", parse_many("3/minute"))
+    monkeypatch.setitem(PLAN_LIMITS, PlanType.STARTER, "2/minute")
+    monkeypatch.setitem(PLAN_LIMITS, PlanType.PRO, "5/minute")
+    limiter.reset()
+    tenant_plans.clear()
+    yield TestClient(app)
+    limiter.reset()
+    tenant_plans.clear()
+
+
+def admitted(client, path, attempts, method="get", **kwargs):
+    return sum(
+        getattr(client, method)(path, **kwargs).status_code == 200
+        for _ in range(attempts)
+    )
+
+
+@pytest.mark.unit
+class TestTenantRateLimits:
+    """Test tenant keys, plan tiers and per-company webhook limits."""
+
+    def test_companies_behind_one_ip_have_their_own_budget(self, client):
+        """Test that two companies on the same address don't share a limit."""
+        assert admitted(client, "/companies/biz_1/stats", 4) == 2
+        assert admitted(client, "/companies/biz_2/stats", 4) == 2
+
+    def test_limit_follows_the_cached_plan(self, client):
+        """Test that a pro company gets the pro tier and unknown ones the starter tier."""
+        remember_tenant_plan(company_key("biz_pro"), PlanType.PRO)
+
+        assert admitted(client, "/companies/biz_pro/stats", 8) == 5
+        assert admitted(client, "/companies/biz_new/stats", 8) == 2
+
+    def test_rejection_reports_the_limit(self, client):
+        """Test that going over the limit answers 429 with Retry-After."""
+        admitted(client, "/companies/biz_1/stats", 2)
+
+        response = client.get("/companies/biz_1/stats")
+        assert response.status_code == 429
+        assert 0 < int(response.headers["Retry-After"]) <= 60
+
+    def test_signed_in_user_is_keyed_by_user(self, client):
+        """Test that a valid token keys by user and anything else by address."""
+        token = create_access_token({"sub": "42", "email": "a@example.com"})
+
+        assert client.get("/me", headers={"Authorization": f"Bearer {token}"}).json() == {"key": "user:42"}
+        assert client.get("/me", headers={"Authorization": "Bearer not-a-token"}).json() == {"key": "testclient"}
+
+    def test_webhooks_are_limited_per_company(self, client):
+        """Test that one company's webhook burst doesn't block another's."""
+        assert admitted(client, "/webhooks/stripe/biz_1", 3, method="post") == 2
+        assert admitted(client, "/webhooks/stripe/biz_2", 3, method="post") == 2
+
+    def test_webhook_senders_are_limited_per_address(self, client):
+        """Test that unsigned webhooks can't spread one address's burst over many companies."""
+        admitted(client, "/webhooks/stripe/biz_1", 2, method="post")
+        admitted(client, "/webhooks/stripe/biz_2", 2, method="post")
+
+        assert admitted(client, "/webhooks/stripe/biz_3", 2, method="post") == 1
+
+    def test_failed_auth_is_limited_per_address(self, client, monkeypatch):
+        """Test that callers without valid credentials get 429 once their address is over budget."""
+        async def reject(token):
+            raise HTTPException(status_code=401, detail="Invalid Whop token")
+
+        monkeypatch.setattr(whop_auth_service, "verify_whop_token", reject)
+        bad_token = {"Authorization": "Bearer expired"}
+
+        assert client.get("/companies/biz_1/settings").status_code == 403
+        statuses = [client.get(f"/companies/biz_{i}/settings", headers=bad_token).status_code for i in range(4)]
+
+        assert statuses == [401, 401, 429, 429]
+        assert client.get("/companies/biz_1/settings").status_code == 429
+
+    def test_limit_strings_parse(self):
+        """Test that every predefined limit is a non-empty limit string."""
+        from limits import parse_many
+
+        for value in [*vars(RateLimits).values(), *PLAN_LIMITS.values()]:
+            if isinstance(value, str) and "/" in value:
+                assert parse_many(value)
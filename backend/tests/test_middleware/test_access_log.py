@@ -0,0 +1,92 @@
+"""Tests for the sampled, queue-backed access log."""
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.middleware.access_log import AccessLogMiddleware, AccessLogWriter
+
+
+class Sink:
+    def __init__(self):
+        self.lines = []
+
+    def __call__(self, fields):
+        self.lines.append(fields)
+
+
+def make_client(writer, sample_rates):
+    app = FastAPI()
+
+    @app.get("/api/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/whop/companies/{company_id}/stats")
+    async def stats(company_id: str):
+        if company_id == "missing":
+            raise HTTPException(status_code=404, detail="Company not found")
+        return {"company_id": company_id}
+
+    app.add_middleware(AccessLogMiddleware, sample_rates=sample_rates, writer=writer)
+    return TestClient(app)
+
+
+@pytest.fixture
+def sink():
+    return Sink()
+
+
+@pytest.mark.unit
+class TestAccessLog:
+    """Test one line per request, sampling and the non-blocking queue."""
+
+    def test_one_line_per_request_with_latency(self, sink):
+        """Test that each request is written once, off the request path."""
+        writer = AccessLogWriter(sink=sink)
+        client = make_client(writer, {})
+
+        client.get("/whop/companies/biz_1/stats")
+        writer.stop()
+
+        assert len(sink.lines) == 1
+        line = sink.lines[0]
+        assert (line["method"], line["path"], line["status_code"]) == ("GET", "/whop/companies/biz_1/stats", 200)
+        assert line["duration_ms"] >= 0
+        assert "sample_rate" not in line
+
+    def test_sampled_routes_still_log_errors(self, sink):
+        """Test that successes on hot routes are sampled but errors never are."""
+        writer = AccessLogWriter(sink=sink)
+        client = make_client(writer, {"/api/health": 0.0, "/whop/companies/*/stats": 0.0})
+
+        for _ in range(20):
+            client.get("/api/health")
+            client.get("/whop/companies/biz_1/stats")
+        client.get("/whop/companies/missing/stats")
+        writer.stop()
+
+        assert [(line["path"], line["status_code"]) for line in sink.lines] == [
+            ("/whop/companies/missing/stats", 404),
+        ]
+
+    def test_sampled_lines_carry_their_rate(self, sink):
+        """Test that a sampled line records the rate it was kept at."""
+        writer = AccessLogWriter(sink=sink)
+        client = make_client(writer, {"/api/health": 0.5})
+
+        for _ in range(200):
+            client.get("/api/health")
+        writer.stop()
+
+        assert 0 < len(sink.lines) < 200
+        assert {line["sample_rate"] for line in sink.lines} == {0.5}
+
+    def test_full_queue_drops_instead_of_blocking(self, sink):
+        """Test that lines beyond the queue size are counted and dropped."""
+        writer = AccessLogWriter(max_queue=2, sink=sink)
+        writer._thread = object()  # Not started: nothing drains the queue
+
+        for i in range(5):
+            writer.submit({"n": i})
+
+        assert writer.dropped == 3
@@ -0,0 +1,120 @@
+"""Tests for the ASGI security header, request size and access log middlewares."""
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.access_log import AccessLogMiddleware
+from app.middleware.security_headers import (
+    CONTENT_SECURITY_POLICY,
+    RequestSizeMiddleware,
+    SecurityHeadersMiddleware,
+)
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.get("/plain")
+    async def plain():
+        return PlainTextResponse("ok", headers={"Server": "uvicorn", "X-Frame-Options": "SAMEORIGIN"})
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"chunk {i}\n"
+        return StreamingResponse(chunks())
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"received": len(await request.body())}
+
+    @app.post("/webhooks/stripe")
+    async def webhook(request: Request):
+        return {"received": len(await request.body())}
+
+    app.add_middleware(RequestSizeMiddleware, max_size=64, route_limits={"/webhooks": 16})
+    app.add_middleware(SecurityHeadersMiddleware)
+    app.add_middleware(AccessLogMiddleware)
+    return app
+
+
+@pytest.fixture
+def client():
+    return TestClient(make_app())
+
+
+@pytest.mark.unit
+class TestSecurityHeadersMiddleware:
+    """Test header injection, streaming pass-through and size rejection."""
+
+    def test_adds_headers_and_drops_server_banner(self, client):
+        """Test that every security header is set once and Server is removed."""
+        response = client.get("/plain")
+
+        assert response.text == "ok"
+        assert response.headers["content-security-policy"] == CONTENT_SECURITY_POLICY
+        assert response.headers.get_list("x-frame-options") == ["DENY"]
+        assert response.headers["x-content-type-options"] == "nosniff"
+        assert response.headers["x-security-headers"] == "enabled"
+        assert "server" not in response.headers
+        assert "strict-transport-security" not in response.headers
+
+    def test_hsts_only_over_https(self):
+        """Test that HSTS is sent for https requests."""
+        client = TestClient(make_app(), base_url="https://testserver")
+
+        assert client.get("/plain").headers["strict-transport-security"] == "max-age=31536000; includeSubDomains"
+
+    def test_streaming_response_passes_through(self, client):
+        """Test that a streamed body arrives intact with the headers applied."""
+        response = client.get("/stream")
+
+        assert response.text == "chunk 0\nchunk 1\nchunk 2\n"
+        assert response.headers["x-frame-options"] == "DENY"
+
+    def test_rejects_declared_oversized_body(self, client):
+        """Test that a Content-Length over the limit is answered with 413."""
+        response = client.post("/upload", content=b"x" * 65)
+
+        assert response.status_code == 413
+        assert response.json() == {"detail": "Request entity too large"}
+        assert response.headers["x-frame-options"] == "DENY"
+        assert client.post("/upload", content=b"x" * 64).json() == {"received": 64}
+
+    @pytest.mark.asyncio
+    async def test_chunked_body_is_cut_off_at_the_limit(self):
+        """Test that a body without Content-Length stops being read once over the limit."""
+        pulled, sent = [], []
+
+        async def receive():
+            pulled.append(len(pulled))
+            return {"type": "http.request", "body": b"x" * 10, "more_body": len(pulled) < 100}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload",
+            "root_path": "", "scheme": "http", "query_string": b"", "http_version": "1.1",
+            "headers": [(b"host", b"testserver"), (b"transfer-encoding", b"chunked")],
+            "client": ("10.0.0.1", 50000), "server": ("testserver", 80),
+        }
+        await make_app()(scope, receive, send)
+
+        assert sent[0]["status"] == 413
+        assert json.loads(sent[1]["body"]) == {"detail": "Request entity too large"}
+        assert len(pulled) == 7  # 70 bytes is the first read over 64
+
+    def test_route_limits_by_path_prefix(self, client):
+        """Test that webhooks get their own smaller limit."""
+        def chunks(count):
+            for _ in range(count):
+                yield b"x" * 10
+
+        assert client.post("/webhooks/stripe", content=chunks(2)).status_code == 413
+        assert client.post("/webhooks/stripe", content=chunks(1)).json() == {"received": 10}
+        assert client.post("/upload", content=chunks(6)).json() == {"received": 60}
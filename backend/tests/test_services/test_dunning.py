@@ -0,0 +1,120 @@
+"""Tests for dunning sequence scheduling and coalescing."""
+import pytest
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models import DunningJob, DunningJobStatus, WhopCompany, WhopCustomer
+from app.services.dunning import dunning_service, step_invoices
+from app.services.email_templates import recipient_fields
+from app.services.retry_schedule import retry_schedule_service
+
+T0 = datetime(2024, 6, 1, 9, 0, 0)
+
+
+@pytest.fixture
+def db(make_session):
+    retry_schedule_service.cache.clear()
+    session = make_session()
+    company = WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme", retry_schedule="1,3")
+    session.add(company)
+    session.flush()
+    session.add(WhopCustomer(company_id=company.id, stripe_customer_id="cus_1", email="a@example.com"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _fail(db, invoice_id, minutes=0, amount=1000):
+    company = db.get(WhopCompany, 1)
+    customer = db.get(WhopCustomer, 1)
+    jobs = dunning_service.schedule_sequence(
+        db, company, customer, invoice_id, failed_at=T0 + timedelta(minutes=minutes), amount=amount
+    )
+    db.commit()
+    return jobs
+
+
+def _open_steps(db):
+    return db.query(DunningJob).filter(DunningJob.status == DunningJobStatus.PENDING).order_by(DunningJob.id).all()
+
+
+@pytest.mark.unit
+class TestDunningCoalescing:
+    """Test that close failures share one sequence and email."""
+
+    def test_failures_within_window_share_a_sequence(self, db):
+        """Test that a second failure is added to the open sequence."""
+        _fail(db, "in_a")
+        _fail(db, "in_b", minutes=5, amount=2500)
+
+        steps = _open_steps(db)
+        assert len(steps) == 2
+        assert all([inv["id"] for inv in step_invoices(job)] == ["in_a", "in_b"] for job in steps)
+
+    def test_failure_after_window_starts_new_sequence(self, db):
+        """Test that failures further apart are dunned separately."""
+        _fail(db, "in_a")
+        _fail(db, "in_b", minutes=settings.DUNNING_COALESCE_WINDOW_MINUTES + 1)
+
+        assert len(_open_steps(db)) == 4
+
+    def test_retried_webhook_is_ignored(self, db):
+        """Test that a redelivered failure doesn't duplicate the invoice."""
+        _fail(db, "in_a")
+        _fail(db, "in_b", minutes=1)
+
+        assert _fail(db, "in_b", minutes=2) == []
+        assert len(step_invoices(_open_steps(db)[0])) == 2
+
+    def test_first_failure_step_is_not_held(self, db):
+        """Test that an immediate step for a lone failure is due at once."""
+        company = db.get(WhopCompany, 1)
+        company.retry_schedule = "0"
+        company.settings_version += 1
+        (step,) = _fail(db, "in_a")
+
+        assert step.due_at == T0
+
+    def test_step_waits_for_window_while_a_sequence_is_open(self, db):
+        """Test that an immediate step is held when the customer is already being dunned."""
+        _fail(db, "in_a")
+        company = db.get(WhopCompany, 1)
+        company.retry_schedule = "0"
+        company.settings_version += 1
+        minutes = settings.DUNNING_COALESCE_WINDOW_MINUTES + 1
+        (step,) = _fail(db, "in_b", minutes=minutes)
+
+        assert step.due_at == T0 + timedelta(minutes=minutes + settings.DUNNING_COALESCE_WINDOW_MINUTES)
+
+    def test_claimed_steps_are_not_extended(self, db):
+        """Test that a failure only joins steps no worker has picked up yet."""
+        first, second = _fail(db, "in_a")
+        first.status = DunningJobStatus.CLAIMED
+        db.commit()
+
+        assert _fail(db, "in_b", minutes=5) == [second]
+        assert [inv["id"] for inv in step_invoices(first)] == ["in_a"]
+        assert [inv["id"] for inv in step_invoices(second)] == ["in_a", "in_b"]
+
+    def test_paying_invoices_shrinks_then_cancels_sequence(self, db):
+        """Test that the sequence is cancelled once every invoice is paid."""
+        _fail(db, "in_a")
+        _fail(db, "in_b", minutes=5)
+
+        assert dunning_service.cancel_sequence(db, 1, "in_a") == 0
+        db.commit()
+        assert all([inv["id"] for inv in step_invoices(job)] == ["in_b"] for job in _open_steps(db))
+
+        assert dunning_service.cancel_sequence(db, 1, "in_b") == 2
+        db.commit()
+        assert _open_steps(db) == []
+
+    def test_email_lists_outstanding_invoices(self, db):
+        """Test that one email lists every coalesced invoice."""
+        _fail(db, "in_a", amount=1000)
+        _fail(db, "in_b", minutes=5, amount=2550)
+
+        fields = recipient_fields("Ann", "a@example.com", step_invoices(_open_steps(db)[0]))
+
+        assert "Invoice in_a: 10.00 USD" in fields["invoices_html"]
+        assert "- Invoice in_b: 25.50 USD" in fields["invoices_text"]
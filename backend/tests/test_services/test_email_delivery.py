@@ -0,0 +1,138 @@
+"""Tests for batched Resend email delivery."""
+import httpx
+import pytest
+
+from app.services.email_delivery import EmailDeliveryService, EmailMessage, TokenBucket
+from benchmarks.fake_resend import create_fake_resend
+
+
+def _messages(count, domain="chargechase.com"):
+    return [
+        EmailMessage(
+            from_email=f"Acme <billing@{domain}>",
+            to=[f"member{i}@example.com"],
+            subject="Payment failed",
+            html="<p>Please update your card.</p>",
+        )
+        for i in range(count)
+    ]
+
+
+def _service(fake, sleeps=None, **kwargs):
+    async def sleep(seconds):
+        if sleeps is not None:
+            sleeps.append(seconds)
+
+    options = dict(api_key="re_test", base_url="http://resend.test", domain_rate=1000, domain_burst=1000)
+    options.update(kwargs)
+    return EmailDeliveryService(transport=httpx.ASGITransport(app=fake), sleep=sleep, **options)
+
+
+@pytest.mark.unit
+class TestEmailDelivery:
+    """Test batching, concurrency limits, retries and rate limiting."""
+
+    @pytest.mark.asyncio
+    async def test_sends_in_batches_per_sender_domain(self):
+        """Test that messages are chunked per domain into batches of the maximum size."""
+        fake = create_fake_resend()
+        messages = _messages(250) + _messages(5, domain="other.io")
+
+        result = await _service(fake).send(messages)
+
+        assert len(result.sent) == 255
+        assert not result.failed
+        assert sorted(fake.state.batch_sizes) == [5, 50, 100, 100]
+
+    @pytest.mark.asyncio
+    async def test_limits_requests_in_flight(self):
+        """Test that no more than max_concurrency batches are sent at once."""
+        fake = create_fake_resend(latency_ms=20)
+
+        result = await _service(fake, batch_size=10, max_concurrency=3).send(_messages(100))
+
+        assert len(result.sent) == 100
+        assert fake.state.max_in_flight == 3
+
+    @pytest.mark.asyncio
+    async def test_retries_throttling_and_server_errors(self):
+        """Test that 429 and 5xx responses are retried, honouring Retry-After."""
+        fake = create_fake_resend(fail_statuses=[429, 503])
+        sleeps = []
+
+        result = await _service(fake, sleeps).send(_messages(3))
+
+        assert len(result.sent) == 3
+        assert fake.state.requests == 3
+        assert sleeps == [0.0, 0.0]
+
+    @pytest.mark.asyncio
+    async def test_retries_reuse_the_batch_idempotency_key(self):
+        """Test that every attempt at a batch carries the same Idempotency-Key."""
+        fake = create_fake_resend(fail_statuses=[503, 500])
+        messages = _messages(3)
+        for i, message in enumerate(messages):
+            message.idempotency_key = f"dunning-job-{i}"
+
+        await _service(fake).send(messages)
+        await _service(fake).send(messages[:2])
+
+        first, retry, second_retry, other = fake.state.idempotency_keys
+        assert first == retry == second_retry
+        assert other != first
+        assert "idempotency_key" not in str(fake.state.sent)
+
+    @pytest.mark.asyncio
+    async def test_rerendered_content_gets_a_new_key(self):
+        """Test that the same jobs re-sent with changed content don't reuse the key Resend would refuse."""
+        fake = create_fake_resend()
+        messages = _messages(2)
+        for i, message in enumerate(messages):
+            message.idempotency_key = f"dunning-job-{i}"
+
+        await _service(fake).send(messages)
+        await _service(fake).send(messages)
+        messages[0].html = "<p>Updated brand message</p>"
+        await _service(fake).send(messages)
+
+        first, resent, rerendered = fake.state.idempotency_keys
+        assert first == resent
+        assert rerendered != first
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self):
+        """Test that a rejected batch fails immediately and is not retryable."""
+        fake = create_fake_resend(fail_statuses=[422])
+
+        result = await _service(fake).send(_messages(2))
+
+        assert fake.state.requests == 1
+        assert sorted(result.failed) == [0, 1]
+        assert result.retryable == []
+
+    @pytest.mark.asyncio
+    async def test_exhausted_retries_are_reported_retryable(self):
+        """Test that a batch still failing after max_retries is left for a later retry."""
+        fake = create_fake_resend(fail_statuses=[500] * 3)
+
+        result = await _service(fake, max_retries=2).send(_messages(2))
+
+        assert fake.state.requests == 3
+        assert result.retryable == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_paces_requests(self):
+        """Test that the bucket allows a burst then waits for refills."""
+        now = [0.0]
+        waits = []
+
+        async def sleep(seconds):
+            waits.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            await bucket.acquire()
+
+        assert waits == [0.5, 0.5]
+        assert now[0] == 1.0
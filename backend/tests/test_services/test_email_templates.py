@@ -0,0 +1,99 @@
+"""Tests for compiled, cached dunning email templates."""
+import pytest
+from pydantic import ValidationError
+
+from app.api.routes.whop import CompanySettingsUpdate
+from app.models import WhopCompany
+from app.services.email_templates import (
+    DEFAULT_BRAND_COLOR,
+    EmailTemplateService,
+    company_fields,
+    compile_template,
+    recipient_fields,
+)
+
+
+def _company(**kwargs):
+    fields = dict(id=7, name="Acme", brand_color="#FF0000", custom_message="Card declined", settings_version=1)
+    fields.update(kwargs)
+    return WhopCompany(**fields)
+
+
+@pytest.mark.unit
+class TestEmailTemplates:
+    """Test compilation, escaping and cache invalidation."""
+
+    def test_company_fields_are_substituted_at_compile_time(self):
+        """Test that only recipient fields remain to render."""
+        template = compile_template("<b>{{ company_name }}</b> {{ greeting }}!", {"company_name": "A&B"})
+
+        assert template.fields == ("greeting",)
+        assert template.literals == ("<b>A&amp;B</b> ", "!")
+        assert template.render({"greeting": "Hi <Ann>,"}) == "<b>A&amp;B</b> Hi &lt;Ann&gt;,!"
+
+    def test_html_fields_are_not_escaped(self):
+        """Test that ``*_html`` fields are inserted as markup."""
+        template = compile_template("{{ rows_html }}", {})
+
+        assert template.render({"rows_html": "<li>x</li>"}) == "<li>x</li>"
+
+    def test_renders_branded_dunning_email(self):
+        """Test that company branding and recipient fields both appear."""
+        service = EmailTemplateService()
+        template = service.dunning_email(_company(sender_name="Acme Billing", sender_email="billing@acme.com"))
+
+        subject, html, text = template.render(recipient_fields("Ann", "ann@example.com"))
+
+        assert template.from_email == "Acme Billing <billing@acme.com>"
+        assert subject == "Action needed: your Acme payment failed"
+        assert "#FF0000" in html and "Hi Ann," in html and "ann@example.com" in html
+        assert "Card declined" in text
+
+    def test_unsubscribe_link_in_both_bodies(self):
+        """Test that the HTML has only the link and the text footer has the URL."""
+        template = EmailTemplateService().dunning_email(_company())
+        url = "https://api.example.com/whop/unsubscribe?company=7&email=ann%40example.com&token=abc"
+
+        _, html, text = template.render(recipient_fields("Ann", "ann@example.com", unsubscribe_url=url))
+
+        assert "Unsubscribe:" not in html
+        assert html.count("https://api.example.com/whop/unsubscribe") == 1
+        assert '<a href="https://api.example.com/whop/unsubscribe?company=7&amp;email=ann%40example.com&amp;token=abc"' in html
+        assert text.rstrip().endswith(f"Unsubscribe: {url}")
+
+    def test_cached_until_settings_version_changes(self):
+        """Test that the compiled template is reused until settings are saved."""
+        service = EmailTemplateService()
+        company = _company()
+
+        first = service.dunning_email(company)
+        assert service.dunning_email(company) is first
+
+        company.brand_color = "#00FF00"
+        company.settings_version = 2
+        second = service.dunning_email(company)
+        assert second is not first
+        assert "#00FF00" in second.html.literals[0]
+
+    def test_invalidate_drops_entry(self):
+        """Test that invalidation forces a recompile."""
+        service = EmailTemplateService()
+        company = _company()
+        first = service.dunning_email(company)
+
+        service.invalidate(company.id)
+
+        assert service.dunning_email(company) is not first
+
+    @pytest.mark.parametrize("value", ["red;background:url(https://evil.example)", "#12345", "3B82F6", '#fff" onload="x'])
+    def test_brand_color_must_be_hex(self, value):
+        """Test that a brand color that could break out of the style attribute is refused or ignored."""
+        with pytest.raises(ValidationError):
+            CompanySettingsUpdate(brand_color=value)
+
+        assert company_fields(_company(brand_color=value))["brand_color"] == DEFAULT_BRAND_COLOR
+
+    def test_hex_brand_colors_are_kept(self):
+        """Test that short and long hex colors are accepted and used."""
+        assert CompanySettingsUpdate(brand_color="#abc").brand_color == "#abc"
+        assert company_fields(_company(brand_color="#FF0000"))["brand_color"] == "#FF0000"
@@ -0,0 +1,43 @@
+"""Tests for fee ledger balances."""
+import pytest
+
+from app.models import FeeBalanceSnapshot, WhopCompany
+from app.services.fee_ledger import FeeBalance, fee_ledger_service
+
+
+@pytest.fixture
+def db(make_session):
+    session = make_session()
+    session.add_all([
+        WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme",
+                    total_recovered=10000, total_fees_owed=290, total_fees_paid=0),
+        WhopCompany(whop_company_id="biz_2", whop_owner_id="user_2", name="Other"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.unit
+class TestFeeLedgerBalances:
+    """Test that balances are snapshot (or legacy counters) plus ledger tail."""
+
+    def test_ledger_entries_add_to_legacy_counters(self, db):
+        """Test that a company without a snapshot starts from its legacy totals."""
+        fee_ledger_service.record_recovery(db, 1, 5000, 145, reference="evt_1")
+        fee_ledger_service.record_charge(db, 1, 400, reference="charge_1")
+        db.commit()
+
+        assert fee_ledger_service.balance(db, 1) == FeeBalance(15000, 35, 400)
+        assert fee_ledger_service.balance(db, 2) == FeeBalance(0, 0, 0)
+
+    def test_snapshot_replaces_folded_entries(self, db):
+        """Test that entries up to the snapshot are not counted twice."""
+        first = fee_ledger_service.record_recovery(db, 1, 5000, 145)
+        db.commit()
+        db.add(FeeBalanceSnapshot(company_id=1, last_entry_id=first.id,
+                                  total_recovered=15000, total_fees_owed=435, total_fees_paid=0))
+        fee_ledger_service.record_recovery(db, 1, 1000, 29)
+        db.commit()
+
+        assert fee_ledger_service.balance(db, 1) == FeeBalance(16000, 464, 0)
@@ -0,0 +1,72 @@
+"""Tests for HyperLogLog distinct-member sketches."""
+import pytest
+from datetime import date
+
+from app.services.hyperloglog import HyperLogLog
+from app.services.member_sketches import period_start
+
+
+@pytest.mark.unit
+class TestHyperLogLog:
+    """Test estimation accuracy, merging and serialization."""
+
+    def test_empty_sketch_counts_zero(self):
+        """Test that an empty sketch estimates zero."""
+        assert HyperLogLog().count() == 0
+
+    @pytest.mark.parametrize("cardinality", [10, 1000, 50000])
+    def test_estimate_within_error_bound(self, cardinality):
+        """Test that estimates stay within three standard errors."""
+        sketch = HyperLogLog()
+        sketch.update(f"cus_{i}" for i in range(cardinality))
+
+        error = abs(sketch.count() - cardinality) / cardinality
+        assert error <= 3 * sketch.relative_error
+
+    def test_duplicates_do_not_inflate(self):
+        """Test that re-adding members leaves the sketch unchanged."""
+        sketch = HyperLogLog()
+        sketch.update(f"cus_{i}" for i in range(500))
+        before = sketch.count()
+
+        changed = [sketch.add(f"cus_{i}") for i in range(500)]
+
+        assert not any(changed)
+        assert sketch.count() == before
+
+    def test_union_matches_combined_stream(self):
+        """Test that merged daily sketches equal one sketch of all members."""
+        monday, tuesday, combined = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        monday.update(f"cus_{i}" for i in range(0, 3000))
+        tuesday.update(f"cus_{i}" for i in range(2000, 5000))
+        combined.update(f"cus_{i}" for i in range(0, 5000))
+
+        merged = HyperLogLog.union([monday, tuesday])
+
+        assert (merged.registers == combined.registers).all()
+
+    @pytest.mark.parametrize("cardinality", [3, 20000])
+    def test_serialization_round_trip(self, cardinality):
+        """Test sparse and dense encodings restore the same registers."""
+        sketch = HyperLogLog()
+        sketch.update(f"cus_{i}" for i in range(cardinality))
+
+        data = sketch.to_bytes()
+        restored = HyperLogLog.from_bytes(data)
+
+        assert (restored.registers == sketch.registers).all()
+        if cardinality == 3:
+            assert len(data) < 16
+
+    def test_merge_rejects_mismatched_precision(self):
+        """Test that sketches of different precision can't be merged."""
+        with pytest.raises(ValueError):
+            HyperLogLog(10).merge(HyperLogLog(12))
+
+    def test_period_buckets(self):
+        """Test day, week and month bucketing of sketch days."""
+        day = date(2024, 5, 16)  # Thursday
+
+        assert period_start(day, "day") == day
+        assert period_start(day, "week") == date(2024, 5, 13)
+        assert period_start(day, "month") == date(2024, 5, 1)
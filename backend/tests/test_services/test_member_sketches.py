@@ -0,0 +1,76 @@
+"""Tests for recording members into daily sketches."""
+from datetime import date
+
+import pytest
+
+from app.models import MemberSketch, WhopCompany
+from app.services.hyperloglog import HyperLogLog
+from app.services.member_sketches import MemberSketchService
+
+DAY = date(2024, 5, 16)
+
+
+def members(session):
+    rows = session.query(MemberSketch).all()
+    return HyperLogLog.union(HyperLogLog.from_bytes(row.registers) for row in rows).count()
+
+
+@pytest.mark.unit
+class TestMemberSketchRecord:
+    """Test creating and updating a company's daily sketch."""
+
+    def test_first_record_creates_the_day_and_later_ones_merge(self, make_session):
+        """Test that one row per day and shard collects every member."""
+        service = MemberSketchService(shards=1)
+        with make_session() as session:
+            for member in ("cus_1", "cus_2", "cus_1"):
+                service.record(session, 1, "failed", member, day=DAY)
+                session.commit()
+
+            assert members(session) == 2
+
+    def test_losing_the_insert_race_merges_into_the_winner(self, make_session, monkeypatch):
+        """Test that a concurrent first insert becomes an update, keeping the caller's work."""
+        service = MemberSketchService(shards=1)
+        with make_session() as other:
+            service.record(other, 1, "failed", "cus_1", day=DAY)
+            other.commit()
+
+        # This transaction looked before the other one committed its row
+        lookups = iter([None])
+        locked_row = service._locked_row
+        monkeypatch.setattr(service, "_locked_row", lambda *args: next(lookups, None) or locked_row(*args))
+
+        with make_session() as session:
+            session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme"))
+            service.record(session, 1, "failed", "cus_2", day=DAY)
+            session.commit()
+
+            assert members(session) == 2
+            assert session.query(WhopCompany).count() == 1
+
+    def test_members_spread_over_shards_and_merge_on_read(self, make_session):
+        """Test that a day's members are split across shard rows and counted together."""
+        service = MemberSketchService(shards=4)
+        with make_session() as session:
+            for member in [f"cus_{i}" for i in range(20)] * 2:
+                service.record(session, 1, "failed", member, day=DAY)
+            session.commit()
+
+            assert 1 < session.query(MemberSketch).count() <= 4
+            assert service.distinct_members(session, 1, "failed", DAY, DAY) == 20
+            series = service.distinct_members_series(session, 1, "failed", DAY, DAY)
+            assert series["series"] == [{"period": DAY.isoformat(), "members": 20}]
+
+    def test_member_already_counted_takes_no_lock(self, make_session, monkeypatch):
+        """Test that repeating a member reads its shard without locking it."""
+        service = MemberSketchService()
+        with make_session() as session:
+            service.record(session, 1, "failed", "cus_1", day=DAY)
+            session.commit()
+
+            def locked_row(*args):
+                raise AssertionError("locked a shard for a member it already covers")
+
+            monkeypatch.setattr(service, "_locked_row", locked_row)
+            service.record(session, 1, "failed", "cus_1", day=DAY)
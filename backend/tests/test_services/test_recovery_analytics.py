@@ -0,0 +1,115 @@
+"""Tests for the vectorized recovery analytics engine."""
+import numpy as np
+import pytest
+
+from app.services.recovery_analytics import (
+    RecoveryColumns,
+    compute_recovery_analytics,
+    pair_failures_and_recoveries,
+    recovery_rate_by_attempt,
+)
+
+HOUR = 3600.0
+DAY = 86400.0
+# 2024-01-01T00:00:00Z
+T0 = 1704067200.0
+
+
+def _columns(events):
+    """Build columns from (customer_id, invoice_id, is_failure, seconds) tuples."""
+    customer_ids, invoice_ids, failures, times = zip(*events)
+    return RecoveryColumns(
+        customer_id=np.array(customer_ids, dtype=np.int64),
+        invoice_id=np.array(invoice_ids, dtype=object),
+        is_failure=np.array(failures, dtype=bool),
+        created_at=np.array(times, dtype=np.float64),
+    )
+
+
+@pytest.mark.unit
+class TestRecoveryAnalytics:
+    """Test pairing and aggregation of failure/recovery events."""
+
+    def test_pairs_first_failure_with_first_later_recovery(self):
+        """Test that each invoice pairs its first failure and next recovery."""
+        columns = _columns([
+            (1, "in_a", True, T0),
+            (1, "in_a", True, T0 + 24 * HOUR),
+            (1, "in_a", False, T0 + 30 * HOUR),
+            (2, "in_b", True, T0),
+            # A recovery before any failure must not be paired
+            (3, "in_c", False, T0 - HOUR),
+            (3, "in_c", True, T0),
+        ])
+
+        pairs = pair_failures_and_recoveries(columns)
+
+        assert len(pairs) == 3
+        hours = sorted(
+            (r - f) / HOUR for f, r in zip(pairs.failed_at, pairs.recovered_at) if not np.isnan(r)
+        )
+        assert hours == [30.0]
+        assert sorted(pairs.attempts.tolist()) == [1, 1, 2]
+
+    def test_missing_invoice_ids_group_per_customer(self):
+        """Test that events without an invoice id still pair per customer."""
+        columns = _columns([
+            (1, None, True, T0),
+            (1, None, False, T0 + HOUR),
+        ])
+
+        pairs = pair_failures_and_recoveries(columns)
+
+        assert len(pairs) == 1
+        assert pairs.recovered.tolist() == [True]
+
+    def test_rate_by_attempt(self):
+        """Test that per-attempt rates use pairs that reached that attempt."""
+        columns = _columns([
+            (1, "in_1", True, T0),
+            (1, "in_1", False, T0 + HOUR),
+            (2, "in_2", True, T0),
+            (2, "in_2", True, T0 + DAY),
+            (2, "in_2", False, T0 + 2 * DAY),
+            (3, "in_3", True, T0),
+            (3, "in_3", True, T0 + DAY),
+        ])
+
+        rates = recovery_rate_by_attempt(pair_failures_and_recoveries(columns), max_attempt=3)
+
+        assert rates[0] == {"attempt": 1, "reached": 3, "recovered": 1, "rate": 0.3333}
+        assert rates[1] == {"attempt": 2, "reached": 2, "recovered": 1, "rate": 0.5}
+        assert rates[2]["reached"] == 0 and rates[2]["rate"] is None
+
+    def test_cohorts_skip_immature_pairs(self):
+        """Test that cohort rates ignore pairs younger than the checkpoint."""
+        columns = _columns([
+            (1, "in_1", True, T0),
+            (1, "in_1", False, T0 + 2 * DAY),
+            (2, "in_2", True, T0),
+        ])
+
+        result = compute_recovery_analytics(columns, now=T0 + 5 * DAY)
+
+        cohort = result["cohorts"][0]
+        assert cohort["cohort"] == "2024-01"
+        assert cohort["size"] == 2
+        assert cohort["recovered_within_days"]["1"] == 0.0
+        assert cohort["recovered_within_days"]["3"] == 0.5
+        assert cohort["recovered_within_days"]["7"] is None
+        assert result["time_to_recovery"]["median_hours"] == 48.0
+
+    def test_empty_company(self):
+        """Test that a company without events returns an empty payload."""
+        columns = RecoveryColumns(
+            customer_id=np.empty(0, dtype=np.int64),
+            invoice_id=np.empty(0, dtype=object),
+            is_failure=np.empty(0, dtype=bool),
+            created_at=np.empty(0, dtype=np.float64),
+        )
+
+        result = compute_recovery_analytics(columns, now=T0)
+
+        assert result["failed_invoices"] == 0
+        assert result["cohorts"] == []
+        assert result["time_to_recovery"]["median_hours"] is None
@@ -0,0 +1,90 @@
+"""Tests for hour-of-week recovery timing tables."""
+import numpy as np
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+
+from app.models import RecoveryEvent, RecoveryTiming, WhopCompany, WhopCustomer
+from app.services.recovery_timing import HOURS_PER_WEEK, build_histograms, hour_of_week, slot_delays, snap
+from app.workers.recovery_timing import RecoveryTimingJob
+
+MONDAY = datetime(2024, 6, 3)
+
+
+def _epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.unit
+class TestRecoveryTiming:
+    """Test histogram building, slot tables and snapping."""
+
+    def test_hour_of_week_starts_monday(self):
+        """Test that Monday 00:00 UTC is hour 0 and Sunday 23:00 is 167."""
+        stamps = np.array([_epoch(MONDAY), _epoch(MONDAY + timedelta(days=6, hours=23))])
+
+        assert hour_of_week(stamps).tolist() == [0, 167]
+
+    def test_histograms_are_split_by_company(self):
+        """Test that one pass buckets every company's recoveries."""
+        company_ids = np.array([5, 5, 9])
+        paid_at = np.array([_epoch(MONDAY + timedelta(hours=h)) for h in (9, 9, 20)])
+
+        companies, histograms = build_histograms(company_ids, paid_at)
+
+        assert companies.tolist() == [5, 9]
+        assert histograms.shape == (2, HOURS_PER_WEEK)
+        assert histograms[0, 9] == 2 and histograms[1, 20] == 1
+
+    def test_slot_delays_point_to_next_good_hour(self):
+        """Test that hours shortly before a peak are pushed into it."""
+        histogram = np.zeros(HOURS_PER_WEEK)
+        histogram[[10, 10 + 24]] = 100  # Monday and Tuesday 10:00
+
+        delays = slot_delays(histogram, top_fraction=2 / HOURS_PER_WEEK, max_delay_hours=6)
+
+        assert delays.dtype == np.uint8
+        assert delays[7] == 3 and delays[10] == 0
+        assert delays[2] == 0  # Peak is further away than the maximum delay
+
+    def test_snap_moves_to_start_of_slot(self):
+        """Test that snapping is a lookup plus a shift to the hour."""
+        delays = bytearray(HOURS_PER_WEEK)
+        delays[7] = 3
+
+        assert snap(MONDAY + timedelta(hours=7, minutes=25), bytes(delays)) == MONDAY + timedelta(hours=10)
+        assert snap(MONDAY + timedelta(hours=8, minutes=25), bytes(delays)) == MONDAY + timedelta(hours=8, minutes=25)
+
+    @pytest.mark.asyncio
+    async def test_job_stores_tables_for_companies_with_history(self, session_factory):
+        """Test that only companies with enough recoveries get a table."""
+        async with session_factory() as session:
+            session.add_all([
+                WhopCompany(whop_company_id=f"biz_{i}", whop_owner_id="user_1", name=f"Co {i}") for i in (1, 2)
+            ])
+            await session.flush()
+            session.add_all([
+                WhopCustomer(company_id=i, stripe_customer_id=f"cus_{i}", email=f"{i}@example.com") for i in (1, 2)
+            ])
+            await session.flush()
+            session.add_all([
+                RecoveryEvent(
+                    company_id=company_id,
+                    customer_id=company_id,
+                    event_type="payment_recovered",
+                    amount=1000,
+                    stripe_created_at=MONDAY + timedelta(days=day, hours=18),
+                )
+                for company_id, count in ((1, 30), (2, 3))
+                for day in range(count)
+            ])
+            await session.commit()
+
+        stats = await RecoveryTimingJob(session_factory, lookback_days=3650, min_events=10).run()
+
+        assert stats == {"recoveries": 33, "companies": 2, "tables": 1}
+        async with session_factory() as session:
+            (timing,) = (await session.execute(select(RecoveryTiming))).scalars().all()
+        assert timing.company_id == 1 and timing.sample_size == 30
+        # Smoothing makes the hour before the 18:00 peak a good slot too
+        assert timing.slot_delays[15] == 2
@@ -0,0 +1,58 @@
+"""Tests for the parsed, cached retry schedule."""
+import pytest
+from datetime import datetime
+
+from app.models import WhopCompany
+from app.services.retry_schedule import (
+    DEFAULT_RETRY_SCHEDULE,
+    RetrySchedule,
+    RetryScheduleService,
+    parse_retry_schedule,
+)
+
+
+@pytest.mark.unit
+class TestRetrySchedule:
+    """Test parsing, validation, due times and caching."""
+
+    def test_parses_days_into_hour_offsets(self):
+        """Test the settings string form and its round trip."""
+        schedule = parse_retry_schedule(" 1, 3 ,7 ")
+
+        assert schedule.offsets_hours == (24, 72, 168)
+        assert schedule.to_days_string() == "1,3,7"
+        assert parse_retry_schedule(schedule.to_json()) == schedule
+
+    @pytest.mark.parametrize("value", ["", "1,x", "3,1", "1,1", "-1", "1,2,3,4,5", "90"])
+    def test_rejects_invalid_schedules(self, value):
+        """Test that malformed, unordered or oversized schedules are rejected."""
+        with pytest.raises(ValueError):
+            parse_retry_schedule(value)
+
+    def test_due_at_for_one_step(self):
+        """Test the scalar form used when persisting steps."""
+        schedule = RetrySchedule((24, 72))
+
+        assert schedule.due_at(datetime(2024, 6, 1), 2) == datetime(2024, 6, 4)
+
+    def test_legacy_string_is_parsed_leniently(self):
+        """Test that rows saved before validation still get a usable schedule."""
+        service = RetryScheduleService()
+
+        company = WhopCompany(id=1, retry_schedule="7,1,bogus", settings_version=1)
+        assert service.schedule_for(company) == DEFAULT_RETRY_SCHEDULE
+
+        company = WhopCompany(id=2, retry_schedule="7,1,3,14,30", settings_version=1)
+        assert service.schedule_for(company).offsets_hours == (24, 72, 168, 336)
+
+    def test_cached_until_settings_version_changes(self):
+        """Test that the parsed schedule is reused until settings are saved."""
+        service = RetryScheduleService()
+        company = WhopCompany(id=3, retry_schedule_hours={"offsets_hours": [24]}, settings_version=1)
+        first = service.schedule_for(company)
+
+        company.retry_schedule_hours = {"offsets_hours": [48]}
+        assert service.schedule_for(company) is first
+
+        company.settings_version = 2
+        assert service.schedule_for(company).offsets_hours == (48,)
@@ -0,0 +1,90 @@
+"""Tests for the in-memory email suppression index."""
+import base64
+import hashlib
+import hmac
+import pytest
+
+from app.core.whop_auth import resend_signature_valid
+from app.models import WhopCompany, WhopCustomer
+from app.services.suppression import SuppressionIndex, unsubscribe_token
+
+
+@pytest.fixture
+def db(make_session):
+    session = make_session()
+    for i in (1, 2):
+        session.add(WhopCompany(whop_company_id=f"biz_{i}", whop_owner_id="user_1", name=f"Co {i}"))
+    session.flush()
+    session.add_all([
+        WhopCustomer(company_id=1, stripe_customer_id="cus_1", email="Ann@Example.com"),
+        WhopCustomer(company_id=2, stripe_customer_id="cus_2", email="ann@example.com"),
+        WhopCustomer(company_id=1, stripe_customer_id="cus_3", email="bob@example.com", dont_email=True),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.unit
+class TestSuppressionIndex:
+    """Test loading, in-memory filtering and bounce handling."""
+
+    @pytest.mark.asyncio
+    async def test_load_from_dont_email_flags(self, db, session_factory):
+        """Test that flagged customers are loaded per company."""
+        index = SuppressionIndex()
+        async with session_factory() as session:
+            assert await index.load(session) == 1
+
+        assert index.is_suppressed(1, "BOB@example.com")
+        assert not index.is_suppressed(2, "bob@example.com")
+
+    def test_filter_drops_suppressed_recipients(self):
+        """Test that filtering needs no database access."""
+        index = SuppressionIndex()
+        index.add(1, "bob@example.com")
+
+        assert index.filter(1, ["ann@example.com", "Bob@Example.com"]) == ["ann@example.com"]
+        assert index.filter(2, ["bob@example.com"]) == ["bob@example.com"]
+
+    def test_hard_bounce_suppresses_every_company(self, db):
+        """Test that a bounced address is flagged for all companies."""
+        index = SuppressionIndex()
+
+        flagged = index.handle_resend_event(db, {"type": "email.bounced", "data": {"to": ["ann@example.com"]}})
+        db.commit()
+
+        assert flagged == 2
+        assert index.is_suppressed(1, "ann@example.com") and index.is_suppressed(2, "ann@example.com")
+        assert all(c.dont_email for c in db.query(WhopCustomer).filter(WhopCustomer.stripe_customer_id != "cus_3"))
+
+    def test_complaint_suppresses_sending_company_only(self, db):
+        """Test that a spam complaint only opts out of the tagged company."""
+        index = SuppressionIndex()
+        event = {
+            "type": "email.complained",
+            "data": {"to": ["ann@example.com"], "tags": [{"name": "company_id", "value": "2"}]},
+        }
+
+        assert index.handle_resend_event(db, event) == 1
+        assert index.is_suppressed(2, "ann@example.com")
+        assert not index.is_suppressed(1, "ann@example.com")
+
+    def test_unsubscribe_token_is_bound_to_company_and_email(self):
+        """Test that tokens can't be reused for another address or company."""
+        token = unsubscribe_token(1, "Ann@example.com")
+
+        assert token == unsubscribe_token(1, "ann@example.com")
+        assert token != unsubscribe_token(2, "ann@example.com")
+        assert token != unsubscribe_token(1, "bob@example.com")
+
+    def test_resend_signature(self):
+        """Test Svix-style webhook signature verification."""
+        key = b"test-secret-key"
+        secret = "whsec_" + base64.b64encode(key).decode()
+        body = b'{"type":"email.bounced"}'
+        digest = hmac.new(key, b"msg_1.1700000000." + body, hashlib.sha256).digest()
+        signature = "v1," + base64.b64encode(digest).decode()
+
+        assert resend_signature_valid(secret, "msg_1", "1700000000", body, f"v1,bogus {signature}")
+        assert not resend_signature_valid(secret, "msg_2", "1700000000", body, signature)
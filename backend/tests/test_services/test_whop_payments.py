@@ -0,0 +1,116 @@
+"""Tests for Whop payment method caching and manual fee processing."""
+import httpx
+import pytest
+
+from app.models import FeeBatchRun, FeeCharge, FeeChargeStatus, FeeLedgerEntry, WhopCompany
+from app.services.whop_payments import WhopPaymentService
+
+
+class FakeWhop:
+    def __init__(self):
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return httpx.Response(200, json={"data": [{"id": f"pm_{self.requests}"}]})
+
+
+@pytest.mark.unit
+class TestPaymentMethodCache:
+    """Test that payment methods are cached until a charge webhook arrives."""
+
+    @pytest.mark.asyncio
+    async def test_charge_webhook_invalidates_company_entry(self):
+        """Test that only the charged company's payment methods are refetched."""
+        whop = FakeWhop()
+        service = WhopPaymentService(transport=httpx.MockTransport(whop))
+
+        first = await service.get_payment_methods("biz_1")
+        await service.get_payment_methods("biz_2")
+        assert await service.get_payment_methods("biz_1") == first
+        assert whop.requests == 2
+
+        await service.handle_payment_webhook({
+            "type": "charge.failed",
+            "data": {"object": {"id": "ch_1", "company_id": "biz_1"}},
+        })
+
+        assert await service.get_payment_methods("biz_1") != first
+        await service.get_payment_methods("biz_2")
+        assert whop.requests == 3
+
+    @pytest.mark.asyncio
+    async def test_errors_are_returned_and_not_cached(self):
+        """Test that a Whop error is reported and retried on the next view."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(503) if len(calls) == 1 else httpx.Response(200, json={"data": []})
+
+        service = WhopPaymentService(transport=httpx.MockTransport(handler))
+
+        assert "error" in await service.get_payment_methods("biz_1")
+        assert await service.get_payment_methods("biz_1") == {"data": []}
+
+
+@pytest.fixture
+def db(make_session):
+    with make_session() as session:
+        session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme",
+                                total_fees_owed=2500, total_fees_paid=0))
+        session.commit()
+        yield session
+
+
+@pytest.mark.unit
+class TestProcessBatchFees:
+    """Test that a manual fee charge never overlaps a batch charge."""
+
+    @pytest.mark.asyncio
+    async def test_refuses_while_a_batch_charge_is_pending(self, db):
+        """Test that fees a batch is still charging are not charged again."""
+        run = FeeBatchRun(period="2024-06-01", status="running")
+        db.add(run)
+        db.flush()
+        db.add(FeeCharge(run_id=run.id, company_id=1, period="2024-06-01", amount=2500,
+                         idempotency_key="chargechase-fees-1-2024-06-01", status=FeeChargeStatus.PENDING))
+        db.commit()
+        whop = FakeWhop()
+        service = WhopPaymentService(transport=httpx.MockTransport(whop))
+
+        result = await service.process_batch_fees(db, db.get(WhopCompany, 1))
+
+        assert result["amount"] == 0
+        assert whop.requests == 0
+
+    @pytest.mark.asyncio
+    async def test_claims_a_charge_row_before_calling_whop(self, db):
+        """Test that a manual charge is recorded as a run-less fee charge and in the ledger once."""
+        claims = []
+
+        def handler(request):
+            claims.append(db.query(FeeCharge.status).one())
+            return httpx.Response(200, json={"id": "ch_1", "amount": 2500})
+
+        service = WhopPaymentService(transport=httpx.MockTransport(handler))
+
+        result = await service.process_batch_fees(db, db.get(WhopCompany, 1))
+
+        assert result["status"] == "success"
+        assert claims == [(FeeChargeStatus.PENDING,)]
+        charge = db.query(FeeCharge).one()
+        assert (charge.run_id, charge.status, charge.whop_charge_id) == (None, FeeChargeStatus.SUCCEEDED, "ch_1")
+        assert db.query(FeeLedgerEntry).filter(FeeLedgerEntry.reference == charge.idempotency_key).count() == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_outcome_stays_claimed(self, db):
+        """Test that a charge Whop may have taken blocks further charges until it is retried."""
+        whop = []
+        service = WhopPaymentService(transport=httpx.MockTransport(lambda request: whop.append(request) or httpx.Response(503)))
+
+        assert (await service.process_batch_fees(db, db.get(WhopCompany, 1)))["status"] == "error"
+        assert (await service.process_batch_fees(db, db.get(WhopCompany, 1)))["amount"] == 0
+
+        assert len(whop) == 1
+        assert db.query(FeeCharge.status).one() == (FeeChargeStatus.PENDING,)
@@ -0,0 +1,92 @@
+"""Tests for leased dunning step claiming."""
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+from app.models import DunningJob, DunningJobStatus, WhopCompany, WhopCustomer
+from app.workers.dunning_claims import claim_due_jobs, complete_jobs
+
+T0 = datetime(2024, 6, 1, 9, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    async with session_factory() as session:
+        company = WhopCompany(whop_company_id="biz_claims", whop_owner_id="user_1", name="Claims Co")
+        session.add(company)
+        await session.commit()
+        session.add(WhopCustomer(company_id=company.id, stripe_customer_id="cus_1", email="a@example.com"))
+        await session.commit()
+        session.add_all([
+            DunningJob(
+                company_id=1,
+                customer_id=1,
+                stripe_invoice_id=f"in_{i}",
+                attempt=1,
+                due_at=T0 + timedelta(minutes=i),
+            )
+            for i in range(6)
+        ])
+        await session.commit()
+
+    return session_factory
+
+
+@pytest.mark.unit
+class TestDunningClaims:
+    """Test disjoint leases, expiry reclaim and owner-only completion."""
+
+    @pytest.mark.asyncio
+    async def test_workers_claim_disjoint_batches(self, session_factory):
+        """Test that two workers never lease the same step."""
+        now = T0 + timedelta(hours=1)
+        async with session_factory() as a, session_factory() as b:
+            first = await claim_due_jobs(a, "worker-a", now, limit=4, lease_seconds=60)
+            second = await claim_due_jobs(b, "worker-b", now, limit=4, lease_seconds=60)
+
+        first_ids = {job.id for job in first}
+        second_ids = {job.id for job in second}
+        assert len(first_ids) == 4
+        assert len(second_ids) == 2
+        assert not first_ids & second_ids
+        assert all(job.status == DunningJobStatus.CLAIMED for job in first + second)
+
+    @pytest.mark.asyncio
+    async def test_only_due_steps_are_claimed(self, session_factory):
+        """Test that steps due in the future stay pending."""
+        async with session_factory() as session:
+            jobs = await claim_due_jobs(session, "worker-a", T0 + timedelta(minutes=2), lease_seconds=60)
+
+        assert [job.stripe_invoice_id for job in jobs] == ["in_0", "in_1", "in_2"]
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_is_reclaimed(self, session_factory):
+        """Test that a crashed worker's steps are claimable after the lease."""
+        now = T0 + timedelta(hours=1)
+        async with session_factory() as session:
+            crashed = await claim_due_jobs(session, "worker-a", now, lease_seconds=60)
+            assert await claim_due_jobs(session, "worker-b", now + timedelta(seconds=30), lease_seconds=60) == []
+
+            reclaimed = await claim_due_jobs(session, "worker-b", now + timedelta(seconds=61), lease_seconds=60)
+
+        assert {job.id for job in reclaimed} == {job.id for job in crashed}
+        assert all(job.lease_owner == "worker-b" for job in reclaimed)
+
+    @pytest.mark.asyncio
+    async def test_only_lease_owner_completes(self, session_factory):
+        """Test that a worker whose lease was taken over can't mark steps sent."""
+        now = T0 + timedelta(hours=1)
+        async with session_factory() as session:
+            jobs = await claim_due_jobs(session, "worker-a", now, limit=2, lease_seconds=60)
+            await claim_due_jobs(
+                session, "worker-b", now + timedelta(seconds=61), lease_seconds=60, job_ids=[jobs[0].id]
+            )
+            job_ids = [job.id for job in jobs]
+
+            assert await complete_jobs(session, "worker-a", job_ids, now) == 1
+
+            result = await session.execute(
+                select(DunningJob.status).where(DunningJob.id.in_(job_ids)).order_by(DunningJob.id)
+            )
+            assert result.scalars().all() == [DunningJobStatus.CLAIMED, DunningJobStatus.SENT]
@@ -0,0 +1,80 @@
+"""Tests for the dunning email step handler."""
+import httpx
+import pytest
+import pytest_asyncio
+from datetime import datetime
+
+from app.models import DunningJob, WhopCompany, WhopCustomer
+from app.services.email_delivery import EmailDeliveryService
+from app.services.suppression import SuppressionIndex
+from app.workers import dunning_emails
+from benchmarks.fake_resend import create_fake_resend
+
+
+@pytest_asyncio.fixture
+async def session(session_factory):
+    async with session_factory() as session:
+        company = WhopCompany(
+            whop_company_id="biz_mail",
+            whop_owner_id="user_1",
+            name="Mail Co",
+            sender_name="Mail Co Billing",
+            sender_email="billing@mailco.com",
+        )
+        session.add(company)
+        await session.flush()
+        session.add_all([
+            WhopCustomer(company_id=company.id, stripe_customer_id="cus_1", email="a@example.com", name="Ann"),
+            WhopCustomer(company_id=company.id, stripe_customer_id="cus_2", email="b@example.com", dont_email=True),
+        ])
+        await session.flush()
+        session.add_all([
+            DunningJob(company_id=company.id, customer_id=customer_id, stripe_invoice_id=f"in_{customer_id}",
+                       attempt=1, due_at=datetime(2024, 6, 1))
+            for customer_id in (1, 2)
+        ])
+        await session.commit()
+        yield session
+
+
+def _use_fake(monkeypatch, fake):
+    async def no_sleep(seconds):
+        pass
+
+    service = EmailDeliveryService(
+        api_key="re_test", base_url="http://resend.test", max_retries=1,
+        transport=httpx.ASGITransport(app=fake), sleep=no_sleep,
+    )
+    monkeypatch.setattr(dunning_emails, "email_delivery_service", service)
+    monkeypatch.setattr(dunning_emails, "suppression_index", SuppressionIndex())
+
+
+async def _jobs(session):
+    return [await session.get(DunningJob, job_id) for job_id in (1, 2)]
+
+
+@pytest.mark.unit
+class TestDunningEmails:
+    """Test which steps the email handler reports as done."""
+
+    @pytest.mark.asyncio
+    async def test_sends_branded_email_and_skips_opted_out(self, session, monkeypatch):
+        """Test that opted-out customers are completed without an email."""
+        fake = create_fake_resend()
+        _use_fake(monkeypatch, fake)
+
+        done = await dunning_emails.send_dunning_emails(session, await _jobs(session))
+
+        assert sorted(done) == [1, 2]
+        assert [email["to"] for email in fake.state.sent] == [["a@example.com"]]
+        assert fake.state.sent[0]["from"] == "Mail Co Billing <billing@mailco.com>"
+        assert (await session.get(WhopCustomer, 1)).last_recovery_email_sent_at is not None
+
+    @pytest.mark.asyncio
+    async def test_transient_failures_are_left_for_retry(self, session, monkeypatch):
+        """Test that steps whose send kept failing are not reported done."""
+        _use_fake(monkeypatch, create_fake_resend(fail_statuses=[503, 503]))
+
+        done = await dunning_emails.send_dunning_emails(session, await _jobs(session))
+
+        assert done == [2]
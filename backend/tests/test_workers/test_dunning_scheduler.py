@@ -0,0 +1,159 @@
+"""Tests for the heap-based dunning scheduler."""
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.models import DunningJob, DunningJobStatus, WhopCompany, WhopCustomer
+from app.workers.dunning_scheduler import DunningScheduler
+from conftest import FakeClock
+
+T0 = datetime(2024, 6, 1, 9, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    async with session_factory() as session:
+        company = WhopCompany(whop_company_id="biz_dunning", whop_owner_id="user_1", name="Dunning Co")
+        session.add(company)
+        await session.commit()
+        session.add(WhopCustomer(company_id=company.id, stripe_customer_id="cus_1", email="a@example.com"))
+        await session.commit()
+
+    return session_factory
+
+
+async def _add_jobs(factory, offsets_minutes):
+    async with factory() as session:
+        start = len((await session.execute(select(DunningJob.id))).all())
+        jobs = [
+            DunningJob(
+                company_id=1,
+                customer_id=1,
+                stripe_invoice_id=f"in_{start + i}",
+                attempt=1,
+                due_at=T0 + timedelta(minutes=offset),
+            )
+            for i, offset in enumerate(offsets_minutes)
+        ]
+        session.add_all(jobs)
+        await session.commit()
+        return jobs
+
+
+def _recorder():
+    fired = []
+
+    async def handler(session, jobs):
+        fired.extend(job.stripe_invoice_id for job in jobs)
+
+    return fired, handler
+
+
+@pytest.mark.unit
+class TestDunningScheduler:
+    """Test due-time ordering, paging and lag metrics."""
+
+    @pytest.mark.asyncio
+    async def test_fires_only_due_steps_in_order(self, session_factory):
+        """Test that steps fire once due and the next wakeup is the head."""
+        await _add_jobs(session_factory, [30, 10, 20])
+        fired, handler = _recorder()
+        clock = FakeClock(T0)
+        scheduler = DunningScheduler(handler, session_factory, page_size=10, poll_seconds=3600, clock=clock)
+
+        assert await scheduler.run_due() == 0
+        assert scheduler.next_wakeup() == T0 + timedelta(minutes=10)
+
+        clock.advance(minutes=20)
+        assert await scheduler.run_due() == 2
+        assert fired == ["in_1", "in_2"]
+
+        clock.advance(minutes=15)
+        assert await scheduler.run_due() == 1
+        assert fired == ["in_1", "in_2", "in_0"]
+
+    @pytest.mark.asyncio
+    async def test_pages_in_more_work_as_heap_drains(self, session_factory):
+        """Test that a backlog larger than one page is fully drained."""
+        await _add_jobs(session_factory, [1, 2, 3, 4, 5])
+        fired, handler = _recorder()
+        clock = FakeClock(T0 + timedelta(hours=1))
+        scheduler = DunningScheduler(handler, session_factory, page_size=2, poll_seconds=3600, clock=clock)
+
+        assert await scheduler.run_due() == 5
+        assert len(fired) == 5
+        assert scheduler.metrics.pages_loaded >= 3
+
+    @pytest.mark.asyncio
+    async def test_picks_up_new_steps_on_poll_or_notify(self, session_factory):
+        """Test that steps written after a page load are still fired."""
+        await _add_jobs(session_factory, [60])
+        fired, handler = _recorder()
+        clock = FakeClock(T0)
+        scheduler = DunningScheduler(handler, session_factory, page_size=10, poll_seconds=30, clock=clock)
+        await scheduler.run_due()
+
+        (polled,) = await _add_jobs(session_factory, [1])
+        clock.advance(minutes=2)
+        assert await scheduler.run_due() == 1
+        assert fired == [polled.stripe_invoice_id]
+
+        (notified,) = await _add_jobs(session_factory, [3])
+        scheduler.notify(notified.id, notified.due_at)
+        clock.advance(seconds=61)
+        assert await scheduler.run_due() == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_steps_are_skipped(self, session_factory):
+        """Test that a step cancelled after being queued is not fired."""
+        (job,) = await _add_jobs(session_factory, [5])
+        fired, handler = _recorder()
+        clock = FakeClock(T0)
+        scheduler = DunningScheduler(handler, session_factory, page_size=10, poll_seconds=3600, clock=clock)
+        await scheduler.run_due()
+
+        async with session_factory() as session:
+            await session.execute(
+                update(DunningJob).where(DunningJob.id == job.id).values(status=DunningJobStatus.CANCELLED)
+            )
+            await session.commit()
+
+        clock.advance(minutes=10)
+        assert await scheduler.run_due() == 0
+        assert fired == []
+
+    @pytest.mark.asyncio
+    async def test_records_scheduling_lag(self, session_factory):
+        """Test that lag is measured from each step's due time."""
+        await _add_jobs(session_factory, [0, 0])
+        _, handler = _recorder()
+        clock = FakeClock(T0 + timedelta(seconds=4))
+        scheduler = DunningScheduler(handler, session_factory, page_size=10, poll_seconds=3600, clock=clock)
+
+        await scheduler.run_due()
+
+        snapshot = scheduler.metrics.snapshot()
+        assert snapshot["fired"] == 2
+        assert snapshot["lag_p50_seconds"] == 4.0
+        assert snapshot["lag_max_seconds"] == 4.0
+
+    @pytest.mark.asyncio
+    async def test_failed_handler_retries_after_lease_expiry(self, session_factory):
+        """Test that steps whose handler raised are fired again once the lease runs out."""
+        await _add_jobs(session_factory, [0])
+        calls = []
+
+        async def flaky(session, jobs):
+            calls.append([job.id for job in jobs])
+            if len(calls) == 1:
+                raise RuntimeError("provider down")
+
+        clock = FakeClock(T0)
+        scheduler = DunningScheduler(flaky, session_factory, page_size=10, poll_seconds=30, clock=clock)
+        assert await scheduler.run_due() == 0
+
+        clock.advance(seconds=settings.DUNNING_LEASE_SECONDS + 1)
+        assert await scheduler.run_due() == 1
+        assert calls[0] == calls[1]
@@ -0,0 +1,176 @@
+"""Tests for the nightly fee batch runner."""
+import json
+from datetime import datetime
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.models import FeeBatchRun, FeeCharge, FeeChargeStatus, OutboxMessage, WhopCompany
+from app.services.fee_ledger import balances_select, fee_ledger_service
+from app.workers.fee_batch import FeeBatchRunner, fee_idempotency_key
+
+PERIOD = "2024-06-01"
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    async with session_factory() as session:
+        session.add_all([
+            WhopCompany(
+                whop_company_id=f"biz_{i}",
+                whop_owner_id=f"user_{i}",
+                name=f"Company {i}",
+                total_fees_owed=owed,
+                total_fees_paid=0,
+            )
+            for i, owed in enumerate([1000, 2500, 0, 400], start=1)
+        ])
+        await session.commit()
+
+    return session_factory
+
+
+class FakeWhop:
+    """Records charge requests; companies in ``failing`` get the mapped status"""
+
+    def __init__(self, failing=None):
+        self.requests = []
+        self.failing = dict(failing or {})
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append((request.headers["Idempotency-Key"], body))
+        if body["company_id"] in self.failing:
+            return httpx.Response(self.failing[body["company_id"]], json={"error": "unavailable"})
+        return httpx.Response(200, json={"id": f"ch_{request.headers['Idempotency-Key']}", "amount": body["amount"]})
+
+
+async def balances(factory):
+    async with factory() as session:
+        rows = (await session.execute(balances_select())).all()
+    return {row.company_id: (row.total_fees_owed, row.total_fees_paid) for row in rows}
+
+
+@pytest.mark.unit
+class TestFeeBatchRunner:
+    """Test fee charging, checkpoint resume and the run summary."""
+
+    @pytest.mark.asyncio
+    async def test_charges_every_company_with_fees_owed(self, session_factory):
+        """Test that fees owed, not amounts recovered, are charged once per company."""
+        whop = FakeWhop()
+        runner = FeeBatchRunner(session_factory, concurrency=2, transport=httpx.MockTransport(whop))
+
+        summary = await runner.run(PERIOD)
+
+        charged = {body["company_id"]: body["amount"] for _, body in whop.requests}
+        assert charged == {"biz_1": 1000, "biz_2": 2500, "biz_4": 400}
+        assert {key for key, _ in whop.requests} == {fee_idempotency_key(i, PERIOD) for i in (1, 2, 4)}
+        assert await balances(session_factory) == {1: (0, 1000), 2: (0, 2500), 3: (0, 0), 4: (0, 400)}
+        assert summary["succeeded"] == 3
+        assert summary["failed"] == 0
+        assert summary["amount_charged"] == 3900
+
+    @pytest.mark.asyncio
+    async def test_resume_retries_pending_rows_with_the_same_key(self, session_factory):
+        """Test that a crashed run resumes without recharging finished companies."""
+        async with session_factory() as session:
+            run = FeeBatchRun(period=PERIOD, status="running")
+            session.add(run)
+            await session.commit()
+            # Crash after company 1 was charged and recorded, before company 2
+            session.add_all([
+                FeeCharge(run_id=run.id, company_id=1, period=PERIOD, amount=1000,
+                          idempotency_key=fee_idempotency_key(1, PERIOD), status=FeeChargeStatus.SUCCEEDED),
+                FeeCharge(run_id=run.id, company_id=2, period=PERIOD, amount=2500,
+                          idempotency_key=fee_idempotency_key(2, PERIOD), status=FeeChargeStatus.PENDING),
+            ])
+            fee_ledger_service.record_charge(session, 1, 1000, reference=fee_idempotency_key(1, PERIOD))
+            await session.commit()
+
+        whop = FakeWhop()
+        summary = await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run(PERIOD)
+
+        assert sorted(key for key, _ in whop.requests) == [fee_idempotency_key(2, PERIOD), fee_idempotency_key(4, PERIOD)]
+        assert await balances(session_factory) == {1: (0, 1000), 2: (0, 2500), 3: (0, 0), 4: (0, 400)}
+        assert summary["succeeded"] == 3
+        assert summary["attempted_this_run"] == 2
+
+    @pytest.mark.asyncio
+    async def test_completed_run_is_not_repeated(self, session_factory):
+        """Test that running a finished period again makes no charges."""
+        first = await FeeBatchRunner(session_factory, transport=httpx.MockTransport(FakeWhop())).run(PERIOD)
+        whop = FakeWhop()
+
+        again = await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run(PERIOD)
+
+        assert whop.requests == []
+        assert again == first
+
+    @pytest.mark.asyncio
+    async def test_rejections_are_reported_and_fees_stay_owed(self, session_factory):
+        """Test that a charge Whop refused is summarized and leaves the balance untouched."""
+        whop = FakeWhop(failing={"biz_2": 402})
+
+        summary = await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run(PERIOD)
+
+        assert summary["succeeded"] == 2
+        assert summary["failed"] == 1
+        assert summary["pending"] == 0
+        assert summary["amount_failed"] == 2500
+        assert summary["failures"][0]["company_id"] == 2
+        assert "402" in summary["failures"][0]["error"]
+        assert (await balances(session_factory))[2] == (2500, 0)
+
+    @pytest.mark.asyncio
+    async def test_ambiguous_failures_are_retried_with_the_original_key(self, session_factory):
+        """Test that a 5xx leaves the run open and is retried, never recharged under a new key."""
+        summary = await FeeBatchRunner(
+            session_factory, transport=httpx.MockTransport(FakeWhop(failing={"biz_2": 503}))
+        ).run(PERIOD)
+
+        assert (summary["failed"], summary["pending"], summary["amount_pending"]) == (0, 1, 2500)
+        async with session_factory() as session:
+            assert (await session.get(FeeBatchRun, 1)).status == "running"
+
+        # Next period: company 2 is retried under the first period's key, not planned again
+        whop = FakeWhop()
+        await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run("2024-06-02")
+
+        assert [key for key, _ in whop.requests] == [fee_idempotency_key(2, PERIOD)]
+        assert await balances(session_factory) == {1: (0, 1000), 2: (0, 2500), 3: (0, 0), 4: (0, 400)}
+        async with session_factory() as session:
+            assert (await session.get(FeeBatchRun, 1)).status == "completed"
+
+    @pytest.mark.asyncio
+    async def test_skips_companies_with_an_immediate_charge_in_flight(self, session_factory):
+        """Test that a pending outbox fee charge keeps the company out of the batch."""
+        async with session_factory() as session:
+            session.add(OutboxMessage(
+                kind="fee_charge", company_id=2, payload={"company_id": 2, "amount": 300},
+                idempotency_key="chargechase-fee-2-evt_1", next_attempt_at=datetime(2024, 6, 1),
+            ))
+            await session.commit()
+        whop = FakeWhop()
+
+        await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run(PERIOD)
+
+        assert {body["company_id"] for _, body in whop.requests} == {"biz_1", "biz_4"}
+
+    @pytest.mark.asyncio
+    async def test_settles_a_manual_charge_left_unresolved(self, session_factory):
+        """Test that a manual charge with an unknown outcome is retried under its key instead of replanned."""
+        async with session_factory() as session:
+            session.add(FeeCharge(company_id=2, period="manual-0-2500", amount=2500,
+                                  idempotency_key="chargechase-fees-2-0-2500", status=FeeChargeStatus.PENDING))
+            await session.commit()
+
+        whop = FakeWhop()
+        summary = await FeeBatchRunner(session_factory, transport=httpx.MockTransport(whop)).run(PERIOD)
+
+        assert sorted(key for key, _ in whop.requests) == sorted([
+            "chargechase-fees-2-0-2500", fee_idempotency_key(1, PERIOD), fee_idempotency_key(4, PERIOD),
+        ])
+        assert await balances(session_factory) == {1: (0, 1000), 2: (0, 2500), 3: (0, 0), 4: (0, 400)}
+        assert summary["pending"] == 0
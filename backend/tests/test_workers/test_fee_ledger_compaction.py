@@ -0,0 +1,73 @@
+"""Tests for fee ledger compaction into snapshots."""
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import select
+
+from app.models import FeeBalanceSnapshot, FeeLedgerEntry, WhopCompany
+from app.services.fee_ledger import balances_select, fee_ledger_service
+from app.workers.fee_ledger_compaction import FeeLedgerCompactionJob
+
+T0 = datetime(2024, 6, 1, 9, 0, 0)
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    async with session_factory() as session:
+        session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme",
+                                total_recovered=10000, total_fees_owed=290, total_fees_paid=0))
+        await session.commit()
+
+    return session_factory
+
+
+async def add_entry(factory, created_at, amount=1000, fee=29):
+    async with factory() as session:
+        entry = fee_ledger_service.recovery_entry(1, amount, fee)
+        entry.created_at = created_at
+        session.add(entry)
+        await session.commit()
+
+
+async def balance(factory):
+    async with factory() as session:
+        row = (await session.execute(balances_select([1]))).one()
+    return row.total_recovered, row.total_fees_owed, row.total_fees_paid
+
+
+@pytest.mark.unit
+class TestFeeLedgerCompaction:
+    """Test that compaction folds old entries without changing balances."""
+
+    @pytest.mark.asyncio
+    async def test_compaction_preserves_balances(self, session_factory):
+        """Test that snapshot plus tail equals the uncompacted balance."""
+        await add_entry(session_factory, T0)
+        await add_entry(session_factory, T0 + timedelta(minutes=1), amount=2000, fee=58)
+        before = await balance(session_factory)
+
+        stats = await FeeLedgerCompactionJob(session_factory, lag_seconds=60).run(now=T0 + timedelta(hours=1))
+
+        assert stats["companies"] == 1
+        assert await balance(session_factory) == before == (13000, 377, 0)
+        async with session_factory() as session:
+            snapshot = (await session.execute(select(FeeBalanceSnapshot))).scalar_one()
+            assert snapshot.last_entry_id == 2
+            # The ledger is never rewritten
+            assert len((await session.execute(select(FeeLedgerEntry))).scalars().all()) == 2
+
+    @pytest.mark.asyncio
+    async def test_recent_entries_stay_in_the_tail(self, session_factory):
+        """Test that entries inside the lag window are not folded yet."""
+        await add_entry(session_factory, T0)
+        await add_entry(session_factory, T0 + timedelta(minutes=59, seconds=30))
+        job = FeeLedgerCompactionJob(session_factory, lag_seconds=60)
+
+        await job.run(now=T0 + timedelta(hours=1))
+        async with session_factory() as session:
+            snapshot = (await session.execute(select(FeeBalanceSnapshot))).scalar_one()
+            assert snapshot.last_entry_id == 1
+        assert await balance(session_factory) == (12000, 348, 0)
+
+        await job.run(now=T0 + timedelta(hours=2))
+        assert await balance(session_factory) == (12000, 348, 0)
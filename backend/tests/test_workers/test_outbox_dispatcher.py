@@ -0,0 +1,163 @@
+"""Tests for the outbox dispatcher and fee charge delivery."""
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.models import FeeLedgerEntry, OutboxMessage, OutboxStatus, WhopCompany
+from app.services.outbox import FEE_CHARGE, outbox_service
+from app.workers.outbox_dispatcher import OutboxDispatcher, deliver_fee_charge
+from conftest import FakeClock
+
+T0 = datetime(2024, 6, 1, 9, 0, 0)
+
+
+class FakeWhop:
+    """Answers charge requests with the queued statuses, then 200"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.keys = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.keys.append(request.headers["Idempotency-Key"])
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = json.loads(request.content)
+        return httpx.Response(status, json={"id": "ch_1", "amount": body["amount"]})
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory, make_session):
+    with make_session() as session:
+        session.add(WhopCompany(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme"))
+        session.flush()
+        outbox_service.enqueue_fee_charge(session, 1, 290, "evt_1", "in_1")
+        session.commit()
+        session.query(OutboxMessage).update({OutboxMessage.next_attempt_at: T0})
+        session.commit()
+    return session_factory
+
+
+async def state(factory):
+    async with factory() as session:
+        message = (await session.execute(select(OutboxMessage))).scalar_one()
+        charges = (await session.execute(select(FeeLedgerEntry))).scalars().all()
+    return message, charges
+
+
+@pytest.mark.unit
+class TestOutboxDispatcher:
+    """Test delivery, retry with backoff and dead-lettering."""
+
+    def test_enqueue_is_idempotent_per_stripe_event(self, session_factory, make_session):
+        """Test that a retried webhook doesn't queue a second charge."""
+        with make_session() as session:
+            assert outbox_service.enqueue_fee_charge(session, 1, 290, "evt_1", "in_1") is None
+            assert outbox_service.has_pending(session, 1, "fee_charge")
+
+    @pytest.mark.asyncio
+    async def test_delivers_charge_and_records_it_in_the_ledger(self, session_factory):
+        """Test that a sent charge carries its key and moves the fee to paid."""
+        whop = FakeWhop()
+        dispatcher = OutboxDispatcher(session_factory=session_factory, transport=httpx.MockTransport(whop), clock=FakeClock(T0))
+
+        assert await dispatcher.run_once() == 1
+
+        message, charges = await state(session_factory)
+        assert whop.keys == ["chargechase-fee-1-evt_1"]
+        assert message.status == OutboxStatus.SENT
+        assert [(c.fees_owed_delta, c.fees_paid_delta) for c in charges] == [(-290, 290)]
+
+    @pytest.mark.asyncio
+    async def test_failure_backs_off_then_retries_with_the_same_key(self, session_factory):
+        """Test that a failed delivery is retried later and charged once."""
+        whop = FakeWhop(statuses=[503])
+        clock = FakeClock(T0)
+        dispatcher = OutboxDispatcher(session_factory=session_factory, transport=httpx.MockTransport(whop), clock=clock)
+
+        assert await dispatcher.run_once() == 0
+        message, charges = await state(session_factory)
+        assert message.status == OutboxStatus.PENDING
+        assert message.attempts == 1
+        assert message.next_attempt_at > T0
+        assert charges == []
+        assert await dispatcher.run_once() == 0  # Not due yet
+
+        clock.now = T0 + timedelta(hours=2)
+        assert await dispatcher.run_once() == 1
+        message, charges = await state(session_factory)
+        assert whop.keys == ["chargechase-fee-1-evt_1"] * 2
+        assert message.status == OutboxStatus.SENT
+        assert len(charges) == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_on_rejections_after_max_attempts(self, session_factory):
+        """Test that a charge Whop keeps refusing is marked dead."""
+        clock = FakeClock(T0)
+        dispatcher = OutboxDispatcher(
+            session_factory=session_factory,
+            transport=httpx.MockTransport(FakeWhop(statuses=[402, 402])),
+            max_attempts=2,
+            clock=clock,
+        )
+
+        await dispatcher.run_once()
+        clock.now = T0 + timedelta(hours=2)
+        await dispatcher.run_once()
+
+        message, charges = await state(session_factory)
+        assert message.status == OutboxStatus.DEAD
+        assert "402" in message.last_error
+        assert charges == []
+
+    @pytest.mark.asyncio
+    async def test_ambiguous_failures_are_never_given_up(self, session_factory):
+        """Test that server errors past max_attempts stay pending, since the charge may exist."""
+        clock = FakeClock(T0)
+        dispatcher = OutboxDispatcher(
+            session_factory=session_factory,
+            transport=httpx.MockTransport(FakeWhop(statuses=[500, 500])),
+            max_attempts=2,
+            clock=clock,
+        )
+
+        await dispatcher.run_once()
+        clock.now = T0 + timedelta(hours=2)
+        await dispatcher.run_once()
+
+        message, charges = await state(session_factory)
+        assert message.status == OutboxStatus.PENDING
+        assert message.next_attempt_at > clock.now
+        assert "500" in message.last_error
+
+        clock.now = T0 + timedelta(days=1)
+        assert await dispatcher.run_once() == 1
+        assert len((await state(session_factory))[1]) == 1
+
+    @pytest.mark.asyncio
+    async def test_lost_lease_does_not_record_the_charge_twice(self, session_factory):
+        """Test that a dispatcher whose lease expired mid-delivery discards its ledger write."""
+        whop = FakeWhop()
+        transport = httpx.MockTransport(whop)
+        other = OutboxDispatcher(session_factory=session_factory, transport=transport, clock=FakeClock(T0 + timedelta(minutes=5)))
+
+        async def slow_delivery(session, message, client):
+            # Whop is slow: the lease runs out and another dispatcher takes over
+            message_id = message.id
+            await session.rollback()
+            assert await other.run_once() == 1
+            await deliver_fee_charge(session, await session.get(OutboxMessage, message_id), client)
+
+        dispatcher = OutboxDispatcher(
+            handlers={FEE_CHARGE: slow_delivery}, session_factory=session_factory, transport=transport, clock=FakeClock(T0),
+        )
+
+        assert await dispatcher.run_once() == 0
+
+        message, charges = await state(session_factory)
+        assert message.status == OutboxStatus.SENT
+        assert whop.keys == ["chargechase-fee-1-evt_1"] * 2
+        assert [(c.fees_owed_delta, c.fees_paid_delta) for c in charges] == [(-290, 290)]
@@ -0,0 +1,144 @@
+"""Tests for recovery_events partitioning helpers."""
+import os
+from collections import Counter, defaultdict
+
+import pytest
+from datetime import datetime, timezone
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.schema import CreateTable
+
+from app.core.database import Base
+from app.core.partitioning import (
+    DEFAULT_PARTITION,
+    add_months,
+    build_partitioned_recovery_events,
+    create_partitioned_tables,
+    list_partitions,
+    month_start,
+    partition_month,
+    partition_name,
+)
+from app.models import RecoveryEventCustomerRollup, RecoveryEventRollup, WhopCompany, WhopCustomer
+from app.workers.partition_maintenance import PartitionMaintenance, read_archive
+
+# Retiring partitions needs a real Postgres, e.g. postgresql+asyncpg://localhost/chargechase_test
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+@pytest.mark.unit
+class TestPartitioning:
+    """Test partition naming, month arithmetic and DDL."""
+
+    def test_month_arithmetic_crosses_years(self):
+        """Test that month shifts roll over year boundaries."""
+        start = month_start(datetime(2024, 11, 17, 9, 30))
+
+        assert start == datetime(2024, 11, 1, tzinfo=timezone.utc)
+        assert add_months(start, 3) == datetime(2025, 2, 1, tzinfo=timezone.utc)
+        assert add_months(start, -11) == datetime(2023, 12, 1, tzinfo=timezone.utc)
+
+    def test_partition_name_round_trip(self):
+        """Test that partition names map back to their month."""
+        month = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+        assert partition_name(month) == "recovery_events_p2024_03"
+        assert partition_month(partition_name(month)) == month
+        assert partition_month("recovery_events") is None
+
+    def test_partitioned_table_ddl(self):
+        """Test that the Postgres DDL partitions by created_at."""
+        ddl = str(CreateTable(build_partitioned_recovery_events()).compile(dialect=postgresql.dialect()))
+
+        assert "PARTITION BY RANGE (created_at)" in ddl
+        assert "PRIMARY KEY (id, created_at)" in ddl
+        assert "id SERIAL NOT NULL" in ddl
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.integration
+@pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+class TestPartitionRetirement:
+    """Test rolling up, detaching, archiving and dropping old months on Postgres."""
+
+    @pytest.mark.asyncio
+    async def test_retired_months_are_fully_rolled_up(self, tmp_path):
+        """Test that the rollups of a retired month match the rows that were dropped."""
+        engine = create_async_engine(POSTGRES_URL)
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(Base.metadata.tables)} CASCADE"))
+            await conn.run_sync(create_partitioned_tables, _utc(2024, 1, 10), 1)
+            company_id = (await conn.execute(
+                WhopCompany.__table__.insert().values(whop_company_id="biz_1", whop_owner_id="user_1", name="Acme")
+                .returning(WhopCompany.id)
+            )).scalar_one()
+            customers = [
+                (await conn.execute(
+                    WhopCustomer.__table__.insert().values(company_id=company_id, stripe_customer_id=f"cus_{i}", email=f"{i}@example.com")
+                    .returning(WhopCustomer.id)
+                )).scalar_one()
+                for i in (1, 2)
+            ]
+            events = [
+                # 2023-06 has no partition: it lands in the default one
+                (customers[0], "payment_failed", 1000, _utc(2023, 6, 3)),
+                (customers[0], "payment_failed", 2500, _utc(2024, 1, 5)),
+                (customers[0], "payment_recovered", 2500, _utc(2024, 1, 9)),
+                (customers[1], "payment_failed", 700, _utc(2024, 1, 31, 23, 59)),
+                (customers[1], "email_sent", 0, _utc(2024, 1, 20)),
+                (customers[1], "payment_failed", 400, _utc(2024, 2, 1)),
+            ]
+            await conn.execute(text(
+                "INSERT INTO recovery_events (company_id, customer_id, event_type, amount, created_at) "
+                "VALUES (:company_id, :customer_id, :event_type, :amount, :created_at)"
+            ), [
+                {"company_id": company_id, "customer_id": c, "event_type": t, "amount": a, "created_at": at}
+                for c, t, a, at in events
+            ])
+            assert (await conn.execute(text(f'SELECT count(*) FROM "{DEFAULT_PARTITION}"'))).scalar_one() == 1
+
+        summary = await PartitionMaintenance(
+            engine, retention_months=1, premake_months=1, archive_dir=str(tmp_path),
+        ).run(now=_utc(2024, 3, 10))
+
+        retired = [partition_name(_utc(2023, 6, 1)), partition_name(_utc(2024, 1, 1))]
+        assert summary["retired"] == retired
+        dropped = [e for e in events if e[3] < _utc(2024, 2, 1)]
+        async with engine.connect() as conn:
+            assert not set(retired) & set(await conn.run_sync(list_partitions))
+            assert (await conn.execute(text("SELECT count(*) FROM recovery_events"))).scalar_one() == 1
+
+            rollups = (await conn.execute(select(RecoveryEventRollup.__table__))).all()
+            assert {(month_start(r.month), r.event_type): (r.event_count, r.total_amount) for r in rollups} == {
+                key: (len(group), sum(a for _, _, a, _ in group))
+                for key, group in _group(dropped, lambda e: (month_start(e[3]), e[1])).items()
+            }
+
+            customer_rollups = (await conn.execute(select(RecoveryEventCustomerRollup.__table__))).all()
+            assert {(r.customer_id, month_start(r.month), r.event_type): r.total_amount for r in customer_rollups} == {
+                key: sum(a for _, _, a, _ in group)
+                for key, group in _group(dropped, lambda e: (e[0], month_start(e[3]), e[1])).items()
+                if key[2] in ("payment_failed", "payment_recovered")
+            }
+
+            await conn.execute(text(f"DROP TABLE IF EXISTS {', '.join(Base.metadata.tables)} CASCADE"))
+            await conn.commit()
+        await engine.dispose()
+
+        archived = Counter(
+            row["event_type"]
+            for name in retired
+            for row in read_archive(os.path.join(tmp_path, "recovery_events", f"{name}.jsonl.gz"))
+        )
+        assert archived == Counter(e[1] for e in dropped)
+
+
+def _group(rows, key):
+    groups = defaultdict(list)
+    for row in rows:
+        groups[key(row)].append(row)
+    return groups
@@ -0,0 +1,110 @@
+"""Tests for rebuilding totals from recovery events."""
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from app.models import RecoveryEvent, RecoveryEventCustomerRollup, RecoveryEventRollup, WhopCompany, WhopCustomer
+from app.services.fee_ledger import balances_select, fee_ledger_service
+from app.workers.reconciliation import ReconciliationJob
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    async with session_factory() as session:
+        session.add_all([
+            WhopCompany(whop_company_id=f"biz_{i}", whop_owner_id=f"user_{i}", name=f"Company {i}")
+            for i in (1, 2, 3)
+        ])
+        await session.flush()
+        session.add_all([
+            WhopCustomer(company_id=1, stripe_customer_id="cus_1", email="a@example.com",
+                         total_failed_amount=5000, total_recovered_amount=3333),
+            WhopCustomer(company_id=2, stripe_customer_id="cus_2", email="b@example.com",
+                         total_failed_amount=900, total_recovered_amount=0),
+            WhopCustomer(company_id=3, stripe_customer_id="cus_3", email="c@example.com",
+                         total_failed_amount=0, total_recovered_amount=0),
+        ])
+        await session.flush()
+        session.add_all([
+            RecoveryEvent(company_id=1, customer_id=1, event_type="payment_failed", amount=5000),
+            RecoveryEvent(company_id=1, customer_id=1, event_type="payment_recovered", amount=3333),
+            RecoveryEvent(company_id=1, customer_id=1, event_type="email_sent", amount=0),
+            RecoveryEvent(company_id=2, customer_id=2, event_type="payment_failed", amount=1000),
+            RecoveryEvent(company_id=2, customer_id=2, event_type="payment_recovered", amount=999),
+        ])
+        # Company 1's ledger matches; company 2 lost its recovery update
+        fee_ledger_service.record_recovery(session, 1, 3333, 96)
+        # Company 3 only has a retired month, rolled up per company alone
+        session.add(RecoveryEventRollup(company_id=3, month=datetime(2022, 1, 1), event_type="payment_recovered",
+                                        event_count=2, total_amount=20000, total_fees=580))
+        await session.commit()
+
+    return session_factory
+
+
+async def company_balances(factory):
+    async with factory() as session:
+        rows = (await session.execute(balances_select())).all()
+    return {row.company_id: (row.total_recovered, row.total_fees_owed) for row in rows}
+
+
+@pytest.mark.unit
+class TestReconciliation:
+    """Test discrepancy detection, exact fee math and bulk repair."""
+
+    @pytest.mark.asyncio
+    async def test_reports_drift_without_changing_anything(self, session_factory):
+        """Test that only out-of-sync totals are reported in report mode."""
+        report = await ReconciliationJob(session_factory, chunk_companies=2, concurrency=2).run()
+
+        found = {(d["entity"], d["entity_id"], d["field"]): (d["stored"], d["expected"]) for d in report["discrepancies"]}
+        assert found == {
+            ("customer", 2, "total_failed_amount"): (900, 1000),
+            ("customer", 2, "total_recovered_amount"): (0, 999),
+            ("company", 2, "total_recovered"): (0, 999),
+            ("company", 2, "total_fees_owed"): (0, 28),  # 999 * 2.9% truncated
+            ("company", 3, "total_recovered"): (0, 20000),
+            ("company", 3, "total_fees_owed"): (0, 580),
+        }
+        assert report["companies"] == 3
+        assert report["customers_skipped"] == 1
+        assert report["repaired"] == 0
+        assert (await company_balances(session_factory))[2] == (0, 0)
+
+    @pytest.mark.asyncio
+    async def test_repair_brings_totals_back_in_line(self, session_factory):
+        """Test that a repair run leaves nothing for the next run to find."""
+        report = await ReconciliationJob(session_factory, repair=True).run()
+
+        assert report["repaired"] == 3
+        assert await company_balances(session_factory) == {1: (3333, 96), 2: (999, 28), 3: (20000, 580)}
+        async with session_factory() as session:
+            customer = (await session.execute(select(WhopCustomer).where(WhopCustomer.id == 2))).scalar_one()
+            assert (customer.total_failed_amount, customer.total_recovered_amount) == (1000, 999)
+
+        again = await ReconciliationJob(session_factory).run()
+        assert again["customer_discrepancies"] == again["company_discrepancies"] == 0
+
+    @pytest.mark.asyncio
+    async def test_customers_with_retired_months_are_checked(self, session_factory):
+        """Test that per-customer rollups count towards customer totals."""
+        async with session_factory() as session:
+            session.add_all([
+                RecoveryEventRollup(company_id=1, month=datetime(2022, 2, 1), event_type="payment_failed",
+                                    event_count=1, total_amount=700, total_fees=20),
+                RecoveryEventCustomerRollup(company_id=1, customer_id=1, month=datetime(2022, 2, 1),
+                                            event_type="payment_failed", total_amount=700),
+            ])
+            await session.commit()
+
+        report = await ReconciliationJob(session_factory, repair=True).run()
+
+        found = {(d["entity"], d["entity_id"], d["field"]): (d["stored"], d["expected"]) for d in report["discrepancies"]}
+        assert found[("customer", 1, "total_failed_amount")] == (5000, 5700)
+        assert ("company", 1, "total_recovered") not in found
+        assert report["customers_skipped"] == 1  # Company 3's customer
+
+        again = await ReconciliationJob(session_factory).run()
+        assert again["customer_discrepancies"] == again["company_discrepancies"] == 0
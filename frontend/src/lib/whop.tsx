@@ -139,15 +139,23 @@ export function useWhopExperience() {
   return { experience, isLoading, error }
 }
 
+// Set by the API after a write; sent back until it passes so reads, on any
+// server worker, see that write instead of a lagging read replica
+const READ_PRIMARY_HEADER = 'X-Read-Primary-Until'
+let readPrimaryUntil: string | null = null
+
 // API helper function that includes Whop auth headers
 export async function whopApiCall(endpoint: string, options: RequestInit = {}) {
   // Get auth token from localStorage or context
   const token = localStorage.getItem('whop_token') || 'dev-token-123'
   
-  const defaultHeaders = {
+  const defaultHeaders: Record<string, string> = {
     'Content-Type': 'application/json',
     'Authorization': `Bearer ${token}`,
   }
+  if (readPrimaryUntil && Number(readPrimaryUntil) * 1000 > Date.now()) {
+    defaultHeaders[READ_PRIMARY_HEADER] = readPrimaryUntil
+  }
 
   // Use Whop-specific API endpoints
   const baseUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
@@ -155,11 +163,16 @@ export async function whopApiCall(endpoint: string, options: RequestInit = {}) {
     ? `${baseUrl}/whop${endpoint.replace('/api/', '/companies/')}`
     : `${baseUrl}${endpoint}`
 
-  return fetch(fullUrl, {
+  const response = await fetch(fullUrl, {
     ...options,
     headers: {
       ...defaultHeaders,
       ...options.headers,
     },
   })
+  const until = response.headers.get(READ_PRIMARY_HEADER)
+  if (until) {
+    readPrimaryUntil = until
+  }
+  return response
 }